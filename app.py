@@ -7,10 +7,17 @@ import tempfile
 import os
 from io import BytesIO
 import base64
+import json
 import time
 import wave
+import uuid
+from collections import deque
 import pygame
 from gtts import gTTS
+from domain_registry import registry
+from http_transport import HttpTransport
+from stt_engine import SpeechToText
+from history_store import HistoryStore, HISTORY_RECENT_LIMIT, HISTORY_PAGE_SIZE
 
 # Configure page
 st.set_page_config(
@@ -21,13 +28,40 @@ st.set_page_config(
 
 # Initialize session state
 if 'search_history' not in st.session_state:
-    st.session_state.search_history = []
+    # Only the most recent compact entries stay in memory; full results live in the history store
+    st.session_state.search_history = deque(maxlen=HISTORY_RECENT_LIMIT)
+if 'history_page' not in st.session_state:
+    st.session_state.history_page = 1
 if 'is_listening' not in st.session_state:
     st.session_state.is_listening = False
 
 # API Configuration
 API_URL = "http://localhost:8000/search"
+STREAM_URL = "http://localhost:8000/search/stream"
 DOMAINS_URL = "http://localhost:8000/domains"
+TTS_URL = "http://localhost:8000/tts"
+JOBS_URL = "http://localhost:8000/jobs/"
+
+# Answer deadline sent with every search; the backend trims its work to meet it
+SEARCH_DEADLINE_MS = int(os.getenv("SEARCH_DEADLINE_MS", "15000"))
+
+# Read timeouts (seconds) per call; connecting is capped separately by the transport
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", str(SEARCH_DEADLINE_MS / 1000 + 2)))
+STREAM_TIMEOUT = float(os.getenv("STREAM_TIMEOUT", str(SEARCH_DEADLINE_MS / 1000 + 2)))
+DOMAINS_TIMEOUT = float(os.getenv("DOMAINS_TIMEOUT", "10"))
+# The domain list changes rarely: fetch it at most this often (seconds) for all sessions
+DOMAINS_CACHE_TTL = int(os.getenv("DOMAINS_CACHE_TTL", "300"))
+TTS_TIMEOUT = float(os.getenv("TTS_TIMEOUT", "60"))
+# Large advanced searches run as background jobs, polled until they finish or this many seconds pass
+JOB_WAIT_TIMEOUT = float(os.getenv("JOB_WAIT_TIMEOUT", "120"))
+JOB_POLL_INTERVAL = 1.0
+# Hedge slow searches with a duplicate request; only useful behind several backend replicas
+HEDGE_SEARCH_REQUESTS = os.getenv("HEDGE_SEARCH_REQUESTS", "0") == "1"
+
+@st.cache_resource
+def get_transport():
+    """Keep-alive connection pool shared by all sessions of this Streamlit server"""
+    return HttpTransport()
 
 def text_to_speech_gtts(text):
     """Convert text to speech using Google Text-to-Speech (gTTS)"""
@@ -45,6 +79,24 @@ def text_to_speech_gtts(text):
         st.error(f"Error in Google TTS: {str(e)}")
         return None
 
+def text_to_speech_server(text):
+    """Get speech audio from the backend /tts endpoint (cached there); returns (audio_bytes, mimetype)
+
+    st.audio needs the whole file, so playback starts only once the last chunk has arrived. The backend
+    still streams sentence chunks in order, so clients that play a stream directly can start earlier.
+    """
+    try:
+        with get_transport().post(TTS_URL, TTS_TIMEOUT, json={"text": text}, stream=True) as response:
+            if response.status_code == 200:
+                # Collected in full: st.audio cannot play a partial download
+                audio = b"".join(response.iter_content(chunk_size=None))
+                return audio, response.headers.get('Content-Type', 'audio/mpeg')
+    except requests.exceptions.RequestException:
+        pass
+    # Backend without /tts, or TTS failed there: synthesize locally
+    return text_to_speech_gtts(text), "audio/mp3"
+
+@st.cache_data(max_entries=32, show_spinner=False)
 def text_to_speech_browser_based(text):
     """Create browser-based text-to-speech using HTML/JavaScript"""
     # This creates an HTML audio element that uses browser's built-in TTS
@@ -106,17 +158,21 @@ def text_to_speech_browser_based(text):
     """
     return html_code
 
+@st.cache_resource
+def get_speech_to_text():
+    """Recognizer, STT engine (STT_ENGINE) and noise calibration reused across clicks"""
+    return SpeechToText()
+
 def speech_to_text():
     """Convert speech to text using microphone"""
     try:
-        r = sr.Recognizer()
+        stt = get_speech_to_text()
         with sr.Microphone() as source:
             st.info("🎤 Listening... Speak now!")
-            r.adjust_for_ambient_noise(source, duration=1)
-            audio = r.listen(source, timeout=10, phrase_time_limit=10)
+            audio = stt.listen(source, timeout=10, phrase_time_limit=10)
         
         st.info("🔄 Processing your speech...")
-        text = r.recognize_google(audio)
+        text = stt.transcribe(audio)
         return text
     except sr.RequestError as e:
         st.error(f"Could not request results from speech recognition service: {e}")
@@ -131,20 +187,25 @@ def speech_to_text():
         st.error(f"Error in speech recognition: {str(e)}")
         return None
 
-def search_api(query, search_depth="advanced", max_results=5, search_scope="ap_gov_only"):
+def search_api(query, search_depth="advanced", max_results=5, search_scope="ap_gov_only", summarizer="llm"):
     """Call the search API"""
     try:
         payload = {
             "query": query,
             "search_depth": search_depth,
             "max_results": max_results,
-            "search_scope": search_scope
+            "search_scope": search_scope,
+            "summarizer": summarizer,
+            "deadline_ms": SEARCH_DEADLINE_MS
         }
         
-        response = requests.post(API_URL, json=payload, timeout=30)
+        response = get_transport().post(API_URL, SEARCH_TIMEOUT, json=payload, hedge=HEDGE_SEARCH_REQUESTS)
         
         if response.status_code == 200:
-            return response.json()
+            result = response.json()
+            if response.headers.get('Server-Timing'):
+                result['server_timing'] = response.headers['Server-Timing']
+            return result
         else:
             return {
                 "error": f"API Error: {response.status_code}",
@@ -158,43 +219,283 @@ def search_api(query, search_depth="advanced", max_results=5, search_scope="ap_g
             "source_found": None
         }
 
+def search_api_job(query, search_depth, max_results, search_scope, summarizer, on_progress):
+    """Run a search as a backend job, polling its status until it finishes"""
+    try:
+        payload = {
+            "query": query,
+            "search_depth": search_depth,
+            "max_results": max_results,
+            "search_scope": search_scope,
+            "summarizer": summarizer,
+            "priority": "interactive"  # a user is waiting on it, even if it is a large search
+        }
+        
+        response = get_transport().post(f"{API_URL}?async=1", SEARCH_TIMEOUT, json=payload)
+        if response.status_code != 202:
+            return {
+                "error": f"API Error: {response.status_code}",
+                "response": "Sorry, could not process your request",
+                "source_found": None
+            }
+        status_url = JOBS_URL + response.json()['job_id']
+        
+        give_up_at = time.monotonic() + JOB_WAIT_TIMEOUT
+        while time.monotonic() < give_up_at:
+            status_response = get_transport().get(status_url, DOMAINS_TIMEOUT)
+            if status_response.status_code != 200:
+                return {
+                    "error": f"API Error: {status_response.status_code}",
+                    "response": "Sorry, could not process your request",
+                    "source_found": None
+                }
+            job = status_response.json()
+            if job['status'] in ('done', 'failed'):
+                return job['result']
+            on_progress(job)
+            time.sleep(JOB_POLL_INTERVAL)
+        return {
+            "error": "Search job timed out",
+            "response": "Sorry, the search is taking too long. Please try again later",
+            "source_found": None
+        }
+    except requests.exceptions.RequestException as e:
+        return {
+            "error": f"Connection Error: {str(e)}",
+            "response": "Sorry, could not connect to the search service",
+            "source_found": None
+        }
+
+def job_progress_label(job):
+    """Status line for a running search job, e.g. 'Searching (queued)' or 'Searching: tavily, filter'"""
+    if job['status'] == 'queued':
+        return f"Searching ({job['status']}, {job['priority']} priority)"
+    stages = job.get('progress')
+    return f"Searching: {', '.join(stages)}" if stages else "Searching..."
+
+def format_server_timing(header):
+    """Render a Server-Timing header as 'tavily 812 ms · llm 2310 ms · total 3190 ms'"""
+    parts = []
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        duration = params.partition("dur=")[2]
+        if name and duration:
+            parts.append(f"{name} {float(duration):.0f} ms")
+    return " · ".join(parts)
+
+def parse_sse_events(lines):
+    """Parse Server-Sent Event lines into (event, data) pairs"""
+    event, data_lines = "message", []
+    for line in lines:
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].lstrip())
+
+def search_api_stream(query, search_depth, max_results, search_scope, outcome, summarizer="llm"):
+    """Call the streaming search API, yielding answer text as it arrives
+
+    The final response (or error) is stored in outcome['result'] once the stream ends.
+    """
+    payload = {
+        "query": query,
+        "search_depth": search_depth,
+        "max_results": max_results,
+        "search_scope": search_scope,
+        "summarizer": summarizer,
+        "deadline_ms": SEARCH_DEADLINE_MS
+    }
+    try:
+        with get_transport().post(STREAM_URL, STREAM_TIMEOUT, json=payload, stream=True) as response:
+            if response.status_code == 404:
+                # Backend without streaming support
+                outcome['result'] = search_api(query, search_depth, max_results, search_scope, summarizer)
+                yield outcome['result'].get('response', '')
+                return
+            if response.status_code != 200:
+                outcome['result'] = {
+                    "error": f"API Error: {response.status_code}",
+                    "response": "Sorry, could not process your request",
+                    "source_found": None
+                }
+                return
+            
+            response.encoding = 'utf-8'
+            for event, data in parse_sse_events(response.iter_lines(chunk_size=None, decode_unicode=True)):
+                if event == "sources":
+                    outcome['sources'] = data.get('sources', [])
+                elif event == "token":
+                    yield data.get('text', '')
+                elif event in ("done", "error"):
+                    outcome['result'] = data
+    except requests.exceptions.RequestException as e:
+        outcome['result'] = {
+            "error": f"Connection Error: {str(e)}",
+            "response": "Sorry, could not connect to the search service",
+            "source_found": None
+        }
+
+@st.cache_resource
+def get_domains_validator():
+    """Last /domains list and its ETag, shared by all sessions"""
+    return {}
+
+@st.cache_data(ttl=DOMAINS_CACHE_TTL, show_spinner=False)
+def load_ap_domains():
+    """Fetch the AP government domain list; failures raise so they are not cached"""
+    # Revalidate with the last ETag so an unchanged list is not re-sent
+    validator = get_domains_validator()
+    headers = {"If-None-Match": validator['etag']} if validator else {}
+    response = get_transport().get(DOMAINS_URL, DOMAINS_TIMEOUT, headers=headers)
+    if response.status_code == 304 and validator:
+        return validator['data']
+    response.raise_for_status()
+    data = response.json()
+    if response.headers.get('ETag'):
+        validator.update(etag=response.headers['ETag'], data=data)
+    return data
+
 def get_ap_domains():
     """Get list of AP government domains"""
     try:
-        response = requests.get(DOMAINS_URL, timeout=10)
-        if response.status_code == 200:
-            return response.json()
-        return None
+        return load_ap_domains()
     except:
         return None
 
-def main():
-    st.title("🏛️ Andhra Pradesh Government Search Assistant")
-    st.markdown("*Search official information from AP government websites*")
-    st.markdown("---")
+@st.cache_resource
+def get_history_store():
+    """SQLite search history shared by all sessions of this Streamlit server"""
+    return HistoryStore()
+
+def load_session_history():
+    """Resume this browser session's recent history on first run (session id is kept in the URL)"""
+    if 'session_id' in st.session_state:
+        return
+    session_id = st.query_params.get("session") or uuid.uuid4().hex
+    st.query_params["session"] = session_id
+    st.session_state.session_id = session_id
+    st.session_state.search_history.extend(get_history_store().recent(session_id))
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def load_result(entry_id):
+    """Full result of a history entry; stored results never change, so they are cached by id"""
+    return get_history_store().get_result(entry_id) or {}
+
+def get_latest_result():
+    """Full result of the latest search"""
+    return load_result(st.session_state.search_history[-1]['id'])
+
+@st.fragment
+def render_search_history(scope_icons):
+    """One page of earlier searches; full responses are only loaded when expanded entries ask for them
+
+    Filtering, paging and expanding entries rerun only this fragment.
+    """
+    store = get_history_store()
+    session_id = st.session_state.session_id
+    latest_id = st.session_state.search_history[-1]['id']
     
-    # Sidebar with domain information
-    with st.sidebar:
-        st.header("ℹ️ Search Information")
+    history_filter = st.text_input("Search history:", key="history_filter", placeholder="Filter by query or response text")
+    if history_filter != st.session_state.get('history_filter_applied'):
+        st.session_state.history_filter_applied = history_filter
+        st.session_state.history_page = 1
+    
+    total = store.count(session_id, history_filter, exclude_id=latest_id)
+    if total == 0:
+        st.caption("No earlier searches match." if history_filter else "No earlier searches yet.")
+        return
+    pages = (total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+    page = min(st.session_state.history_page, pages)
+    
+    recent = list(reversed(st.session_state.search_history))[1:]
+    if not history_filter and page * HISTORY_PAGE_SIZE <= len(recent):
+        # Served from the in-memory recent entries
+        entries = recent[(page - 1) * HISTORY_PAGE_SIZE:page * HISTORY_PAGE_SIZE]
+    else:
+        entries = store.page(session_id, page, HISTORY_PAGE_SIZE, history_filter, exclude_id=latest_id)
+    
+    offset = (page - 1) * HISTORY_PAGE_SIZE
+    for i, search in enumerate(entries, offset + 1):
+        scope_icon = scope_icons.get(search.get('search_scope', 'ap_gov_only'), '🔍')
         
-        domain_info = get_ap_domains()
-        if domain_info:
-            st.success(f"Searching across {domain_info['total_domains']} AP Government domains")
-            
-            with st.expander("View AP Government Domains"):
-                for domain in domain_info['ap_government_domains']:
-                    st.text(f"• {domain}")
-        else:
-            st.warning("Could not load domain information")
+        with st.expander(f"{scope_icon} Search {i}: {search['query'][:50]}..."):
+            st.markdown(f"**Time:** {search['timestamp']}")
+            st.markdown(f"**Query:** {search['query']}")
+            st.markdown(f"**Search Scope:** {search.get('search_scope', 'ap_gov_only')}")
+            if search.get('preview'):
+                st.markdown("**Response:**")
+                st.write(search['preview'])
+            if st.checkbox("Show full response and sources", key=f"history_full_{search['id']}"):
+                result = load_result(search['id'])
+                if result.get('response'):
+                    st.write(result['response'])
+                if result.get('source_found'):
+                    st.markdown("**Sources:**")
+                    st.write(result['source_found'])
+    
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if st.button("⬅️ Newer", disabled=page <= 1, use_container_width=True):
+            st.session_state.history_page = page - 1
+            st.rerun(scope="fragment")
+    with col_page:
+        st.caption(f"Page {page} of {pages} ({total} searches)")
+    with col_next:
+        if st.button("Older ➡️", disabled=page >= pages, use_container_width=True):
+            st.session_state.history_page = page + 1
+            st.rerun(scope="fragment")
+
+SCOPE_ICONS = {
+    'ap_gov_only': '🏛️',
+    'include_ap_gov': '🔍',
+    'general': '🌐',
+    'local_corpus': '📚'
+}
+
+SCOPE_DISPLAY = {
+    'ap_gov_only': '🏛️ AP Gov Only',
+    'include_ap_gov': '🔍 AP Gov + Others',
+    'general': '🌐 General Web',
+    'local_corpus': '📚 Local Corpus'
+}
+
+@st.fragment
+def render_sidebar():
+    """Domain information and search examples (the domain list comes from the shared cache)
+    
+    A fragment, so interactions in the sidebar rerun only the sidebar. Call it inside `with st.sidebar:`:
+    a fragment cannot write into the sidebar from the main body.
+    """
+    st.header("ℹ️ Search Information")
+    
+    domain_info = get_ap_domains()
+    if domain_info:
+        st.success(f"Searching across {domain_info['total_domains']} AP Government domains")
         
-        st.markdown("---")
-        st.markdown("**Examples of what you can search:**")
-        st.markdown("• Land registration procedures")
-        st.markdown("• Government schemes")
-        st.markdown("• Online services")
-        st.markdown("• Department contacts")
-        st.markdown("• Policy documents")
+        with st.expander("View AP Government Domains"):
+            for domain in domain_info['ap_government_domains']:
+                st.text(f"• {domain}")
+    else:
+        st.warning("Could not load domain information")
     
+    st.markdown("---")
+    st.markdown("**Examples of what you can search:**")
+    st.markdown("• Land registration procedures")
+    st.markdown("• Government schemes")
+    st.markdown("• Online services")
+    st.markdown("• Department contacts")
+    st.markdown("• Policy documents")
+
+@st.fragment
+def render_search_form():
+    """Query input, search settings and the search itself
+    
+    Changing inputs or settings reruns only this fragment; a finished search reruns the whole page.
+    """
     # Create two columns for the main interface
     col1, col2 = st.columns([2, 1])
     
@@ -228,6 +529,9 @@ def main():
                         st.success(f"Recognized: '{query}'")
                         st.session_state.voice_query = query
             
+            if st.button("🎚️ Recalibrate Microphone", help="Re-measure background noise on the next voice input"):
+                get_speech_to_text().recalibrate()
+            
             # Display recognized voice input
             if hasattr(st.session_state, 'voice_query'):
                 query = st.session_state.voice_query
@@ -242,7 +546,8 @@ def main():
             [
                 ("ap_gov_only", "🏛️ AP Government Only"),
                 ("include_ap_gov", "🔍 Include AP Gov + Others"),
-                ("general", "🌐 General Web Search")
+                ("general", "🌐 General Web Search"),
+                ("local_corpus", "📚 Local Corpus (offline, fast)")
             ],
             format_func=lambda x: x[1],
             index=0
@@ -261,12 +566,19 @@ def main():
             value=5
         )
         
-        # TTS Method selection
-        tts_method = st.selectbox(
-            "Text-to-Speech Method:",
-            ["Browser TTS", "Google TTS"],
-            index=0
-        )
+        # Extractive answers skip the LLM; 'auto' uses them for simple lookups
+        summarizer = st.selectbox(
+            "Answer Style:",
+            [
+                ("auto", "⚡ Auto"),
+                ("extractive", "📄 Extractive (fastest)"),
+                ("llm", "🤖 LLM summary")
+            ],
+            format_func=lambda x: x[1],
+            index=2  # LLM answers unless the user opts into the faster styles
+        )[0]
+        
+        stream_response = st.checkbox("Stream response", value=True)
     
     # Search button
     col_search, col_clear = st.columns([1, 1])
@@ -276,121 +588,156 @@ def main():
     
     with col_clear:
         if st.button("🗑️ Clear History", use_container_width=True):
+            get_history_store().clear(st.session_state.session_id)
+            load_result.clear()  # drop the cached results of the deleted entries (ids are never reused)
             st.session_state.search_history.clear()
+            st.session_state.history_page = 1
             if hasattr(st.session_state, 'voice_query'):
                 del st.session_state.voice_query
             st.rerun()
     
     # Perform search
     if search_clicked and query.strip():
-        with st.spinner("Searching AP Government sources..."):
-            result = search_api(query, search_depth, max_results, search_scope)
-            
-            # Store in history
-            st.session_state.search_history.append({
-                "query": query,
-                "result": result,
-                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                "search_scope": search_scope
-            })
+        if search_depth == "advanced" and max_results > 5:
+            # Large advanced searches can outlast a request timeout, so they run as backend jobs
+            with st.status("Searching AP Government sources...") as status:
+                result = search_api_job(
+                    query, search_depth, max_results, search_scope, summarizer,
+                    lambda job: status.update(label=job_progress_label(job))
+                )
+                status.update(label="Search complete", state="error" if result.get('error') else "complete")
+        elif stream_response:
+            # Render the answer progressively as the backend streams it
+            st.markdown("---")
+            st.markdown("**📋 Response:**")
+            outcome = {}
+            st.write_stream(search_api_stream(query, search_depth, max_results, search_scope, outcome, summarizer))
+            result = outcome.get('result') or {
+                "error": "Stream ended unexpectedly",
+                "response": "Sorry, could not process your request",
+                "source_found": None
+            }
+        else:
+            with st.spinner("Searching AP Government sources..."):
+                result = search_api(query, search_depth, max_results, search_scope, summarizer)
+        
+        # Store in history
+        entry = get_history_store().add(
+            st.session_state.session_id, query, search_scope, result, time.strftime("%Y-%m-%d %H:%M:%S")
+        )
+        st.session_state.search_history.append(entry)
+        st.session_state.history_page = 1
+        # The result panel and history live outside this fragment: redraw the page
+        st.rerun()
+
+@st.fragment
+def render_latest_result():
+    """The latest search's answer, sources and read-aloud controls
     
-    # Display results
-    if st.session_state.search_history:
-        st.markdown("---")
-        st.subheader("Search Results")
+    Switching the TTS method or timing display reruns only this fragment.
+    """
+    st.markdown("---")
+    st.subheader("Search Results")
+    
+    # Show latest result
+    latest_search = st.session_state.search_history[-1]
+    
+    # Display search info
+    col_info1, col_info2, col_info3 = st.columns(3)
+    with col_info1:
+        st.metric("Query", latest_search['query'][:20] + "..." if len(latest_search['query']) > 20 else latest_search['query'])
+    with col_info2:
+        st.metric("Search Scope", SCOPE_DISPLAY.get(latest_search.get('search_scope', 'ap_gov_only')))
+    with col_info3:
+        st.metric("Results Found", latest_search.get('total_results') if latest_search.get('total_results') is not None else 'N/A')
+    
+    st.markdown(f"**Search Time:** {latest_search['timestamp']}")
+    
+    result = get_latest_result()
+    show_timing = st.checkbox("Show server timing", value=False, key="show_timing", help="Per-stage backend latency from the Server-Timing header")
+    if show_timing and result.get('server_timing'):
+        st.caption(f"⏱️ {format_server_timing(result['server_timing'])}")
+    if result.get('degradations'):
+        st.caption(f"⚡ Shortened to answer in time: {', '.join(result['degradations'])}")
+    
+    if "error" in result:
+        st.error(f"Error: {result['error']}")
+    
+    # Display response
+    if result.get('response'):
+        st.markdown("**📋 Response:**")
+        response_text = result['response']
         
-        # Show latest result
-        latest_search = st.session_state.search_history[-1]
+        # Highlight if it's from AP government sources
+        if result.get('search_scope') == 'ap_gov_only':
+            st.info("ℹ️ Information sourced from official Andhra Pradesh government websites")
         
-        # Display search info
-        col_info1, col_info2, col_info3 = st.columns(3)
-        with col_info1:
-            st.metric("Query", latest_search['query'][:20] + "..." if len(latest_search['query']) > 20 else latest_search['query'])
-        with col_info2:
-            scope_display = {
-                'ap_gov_only': '🏛️ AP Gov Only',
-                'include_ap_gov': '🔍 AP Gov + Others', 
-                'general': '🌐 General Web'
-            }
-            st.metric("Search Scope", scope_display.get(latest_search.get('search_scope', 'ap_gov_only')))
-        with col_info3:
-            st.metric("Results Found", latest_search['result'].get('total_results', 'N/A'))
+        st.write(response_text)
         
-        st.markdown(f"**Search Time:** {latest_search['timestamp']}")
+        # Text-to-Speech options
+        st.markdown("**🔊 Listen to Response:**")
         
-        result = latest_search['result']
+        # TTS Method selection
+        tts_method = st.selectbox(
+            "Text-to-Speech Method:",
+            ["Browser TTS", "Google TTS"],
+            index=0,
+            key="tts_method"
+        )
         
-        if "error" in result:
-            st.error(f"Error: {result['error']}")
+        if tts_method == "Browser TTS":
+            # Use browser-based TTS (most reliable)
+            st.components.v1.html(
+                text_to_speech_browser_based(response_text),
+                height=100
+            )
         
-        # Display response
-        if result.get('response'):
-            st.markdown("**📋 Response:**")
-            response_text = result['response']
-            
-            # Highlight if it's from AP government sources
-            if result.get('search_scope') == 'ap_gov_only':
-                st.info("ℹ️ Information sourced from official Andhra Pradesh government websites")
-            
-            st.write(response_text)
-            
-            # Text-to-Speech options
-            st.markdown("**🔊 Listen to Response:**")
-            
-            if tts_method == "Browser TTS":
-                # Use browser-based TTS (most reliable)
-                st.components.v1.html(
-                    text_to_speech_browser_based(response_text),
-                    height=100
-                )
-            
-            elif tts_method == "Google TTS":
-                if st.button("🔊 Generate Audio", key="gtts_button"):
-                    with st.spinner("Converting to speech..."):
-                        audio_bytes = text_to_speech_gtts(response_text)
-                        if audio_bytes:
-                            st.audio(audio_bytes, format="audio/mp3")
-            
-            # Copy response button
-            if st.button("📋 Copy Response", key="copy_button"):
-                st.code(response_text, language=None)
+        elif tts_method == "Google TTS":
+            if st.button("🔊 Generate Audio", key="gtts_button"):
+                with st.spinner("Converting to speech..."):
+                    audio_bytes, audio_format = text_to_speech_server(response_text)
+                    if audio_bytes:
+                        st.audio(audio_bytes, format=audio_format)
         
-        # Display sources
-        if result.get('source_found'):
-            st.markdown("**🔗 Official Sources:**")
-            sources = result['source_found'].split(', ')
-            for i, source in enumerate(sources, 1):
-                # Check if it's an AP government domain
-                is_ap_gov = any(domain in source.lower() for domain in [
-                    'ap.gov.in', 'apland', 'webland', 'registration.ap.gov.in', 
-                    'aponline', 'appolice', 'aptransport', 'appsc', 'aptet'
-                ])
-                
-                icon = "🏛️" if is_ap_gov else "🔗"
-                st.markdown(f"{icon} {i}. [{source}]({source})")
+        # Copy response button
+        if st.button("📋 Copy Response", key="copy_button"):
+            st.code(response_text, language=None)
+    
+    # Display sources
+    if result.get('source_found'):
+        st.markdown("**🔗 Official Sources:**")
+        sources = result['source_found'].split(', ')
+        for i, source in enumerate(sources, 1):
+            # Check if it's an AP government domain
+            is_ap_gov = registry.is_ap_gov(source)
+            
+            icon = "🏛️" if is_ap_gov else "🔗"
+            st.markdown(f"{icon} {i}. [{source}]({source})")
+            # Same document republished elsewhere (e.g. a department subdomain)
+            for mirror in (result.get('mirrors') or {}).get(source, []):
+                st.markdown(f"&nbsp;&nbsp;&nbsp;&nbsp;↳ mirror: [{mirror}]({mirror})")
+
+def main():
+    load_session_history()
+    
+    st.title("🏛️ Andhra Pradesh Government Search Assistant")
+    st.markdown("*Search official information from AP government websites*")
+    st.markdown("---")
+    
+    # Each part of the page reruns independently when its own widgets change
+    with st.sidebar:
+        render_sidebar()
+    render_search_form()
+    
+    # Display results
+    if st.session_state.search_history:
+        render_latest_result()
         
         # Search History
         if len(st.session_state.search_history) > 1:
             st.markdown("---")
             st.subheader("📚 Search History")
-            
-            for i, search in enumerate(reversed(st.session_state.search_history[:-1]), 1):
-                scope_icon = {
-                    'ap_gov_only': '🏛️',
-                    'include_ap_gov': '🔍', 
-                    'general': '🌐'
-                }.get(search.get('search_scope', 'ap_gov_only'), '🔍')
-                
-                with st.expander(f"{scope_icon} Search {i}: {search['query'][:50]}..."):
-                    st.markdown(f"**Time:** {search['timestamp']}")
-                    st.markdown(f"**Query:** {search['query']}")
-                    st.markdown(f"**Search Scope:** {search.get('search_scope', 'ap_gov_only')}")
-                    if search['result'].get('response'):
-                        st.markdown("**Response:**")
-                        st.write(search['result']['response'])
-                    if search['result'].get('source_found'):
-                        st.markdown("**Sources:**")
-                        st.write(search['result']['source_found'])
+            render_search_history(SCOPE_ICONS)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from search_pipeline import parse_search_request, search_request_key, error_response
+
+# Batch configuration
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "500"))
+BATCH_DEFAULT_CONCURRENCY = int(os.getenv("BATCH_DEFAULT_CONCURRENCY", "4"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+
+
+def parse_batch_request(data):
+    """Validate a /search/batch body; returns (queries, concurrency, stream) or raises ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError("The request body must be a JSON object")
+    if not isinstance(data.get('queries'), list) or not data['queries']:
+        raise ValueError("A non-empty 'queries' list is required")
+    if len(data['queries']) > BATCH_MAX_QUERIES:
+        raise ValueError(f"At most {BATCH_MAX_QUERIES} queries are allowed per batch")
+
+    try:
+        concurrency = int(data.get('concurrency', BATCH_DEFAULT_CONCURRENCY))
+    except (TypeError, ValueError):
+        raise ValueError("concurrency must be an integer") from None
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+    return data['queries'], concurrency, bool(data.get('stream', False))
+
+
+def plan_batch(queries, default_max_results):
+    """Group identical queries so each is searched once; returns [(query_data, [indices])]"""
+    groups = {}
+    plan = []
+    for index, query_data in enumerate(queries):
+        try:
+            params = parse_search_request(query_data, default_max_results)
+        except ValueError:
+            params = None
+        if params is None:
+            # Invalid entries are still run so they get their own 400 result
+            plan.append((query_data, [index]))
+            continue
+        key = search_request_key(params)
+        if key in groups:
+            groups[key].append(index)
+        else:
+            groups[key] = [index]
+            plan.append((query_data, groups[key]))
+    return plan
+
+
+def _run_one(run_search, query_data):
+    try:
+        return run_search(query_data)
+    except Exception as e:
+        return error_response(e), 500
+
+
+def run_batch(run_search, queries, concurrency, default_max_results):
+    """Run run_search over a batch with bounded concurrency, yielding (indices, payload, status) as each completes"""
+    plan = plan_batch(queries, default_max_results)
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(plan))) as executor:
+        futures = {
+            executor.submit(_run_one, run_search, query_data): indices
+            for query_data, indices in plan
+        }
+        for future in as_completed(futures):
+            payload, status = future.result()
+            yield futures[future], payload, status
+
+
+async def arun_batch(run_search, queries, concurrency, default_max_results):
+    """Async variant of run_batch for coroutine run_search functions"""
+    plan = plan_batch(queries, default_max_results)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(query_data, indices):
+        async with semaphore:
+            try:
+                payload, status = await run_search(query_data)
+            except Exception as e:
+                payload, status = error_response(e), 500
+        return indices, payload, status
+
+    for next_done in asyncio.as_completed([run_one(*entry) for entry in plan]):
+        yield await next_done
+
+
+def ordered_batch_response(queries, completed):
+    """Assemble (indices, payload, status) tuples into the ordered batch response body"""
+    results = [None] * len(queries)
+    unique_queries = 0
+    for indices, payload, status in completed:
+        unique_queries += 1
+        for index in indices:
+            results[index] = {"status": status, "result": payload}
+    return {
+        "results": results,
+        "total_queries": len(queries),
+        "unique_queries": unique_queries
+    }
+
+
+def ndjson_lines(indices, payload, status):
+    """NDJSON lines for one completed query, one per batch position it answers"""
+    return "".join(
+        json.dumps({"index": index, "status": status, "result": payload}) + "\n"
+        for index in indices
+    )
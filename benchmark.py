@@ -0,0 +1,457 @@
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+
+from http_transport import build_session
+
+# Backends that can be benchmarked; {port} is filled in per run
+BACKEND_COMMANDS = {
+    "tevily": [sys.executable, "-m", "flask", "--app", "tevily", "run", "--port", "{port}", "--no-reload", "--no-debugger"],
+    "tevily_2": [sys.executable, "-m", "flask", "--app", "tevily_2", "run", "--port", "{port}", "--no-reload", "--no-debugger"],
+    "tevily_async": [sys.executable, "-m", "hypercorn", "tevily_async:app", "--bind", "127.0.0.1:{port}"],
+}
+
+# Environment overrides per scenario mode
+MODE_ENV = {
+    "nocache": {"TAVILY_CACHE_MAX_BYTES": "0", "LLM_CACHE_MAX_BYTES": "0", "SEMANTIC_CACHE_ENABLED": "0"},
+    "stream": {},
+    "extractive": {},
+    "auto": {},
+}
+
+# Modes that pick the summarizer the requests ask for; without one, the LLM backends are asked for "llm"
+SUMMARIZER_MODES = ("extractive", "auto")
+
+QUERY_TOPICS = [
+    "land registration", "ration card", "pension scheme", "birth certificate", "caste certificate",
+    "driving licence renewal", "property tax payment", "electricity bill", "rythu bharosa", "scholarship",
+    "police verification", "water tax", "income certificate", "vehicle registration", "mutation of land",
+]
+QUERY_FORMS = ["how to apply for {}", "documents required for {}", "status of {}", "fees for {}", "{} online"]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def sample_latency(rng, median, sigma):
+    """Log-normal latency around median (seconds); sigma 0 gives a constant"""
+    return median * float(np.exp(rng.normal(0, sigma))) if sigma else median
+
+
+class StubConfig:
+    """Latency, payload and error settings shared by the stub upstream servers"""
+
+    def __init__(self, args):
+        self.tavily_latency = args.tavily_latency
+        self.tavily_error_rate = args.tavily_error_rate
+        self.results = args.results
+        self.content_chars = args.content_chars
+        self.llm_latency = args.llm_latency
+        self.llm_error_rate = args.llm_error_rate
+        self.llm_tokens = args.llm_tokens
+        self.sigma = args.latency_sigma
+        self.rng = np.random.default_rng(args.seed)
+        self.lock = threading.Lock()
+        self.calls = {"tavily": 0, "llm": 0}
+
+    def draw(self, upstream, median, error_rate):
+        with self.lock:
+            self.calls[upstream] += 1
+            return sample_latency(self.rng, median, self.sigma), self.rng.random() < error_rate
+
+
+def _stub_handler(config):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if self.path.rstrip("/").endswith("/search"):
+                self._tavily(body)
+            elif "/chat/completions" in self.path:
+                self._chat(body)
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def _tavily(self, body):
+            latency, failed = config.draw("tavily", config.tavily_latency, config.tavily_error_rate)
+            time.sleep(latency)
+            if failed:
+                return self._send_json(429, {"detail": {"error": "rate limit (stub)"}})
+            query = body.get("query", "")
+            domains = body.get("include_domains") or ["example.ap.gov.in"]
+            filler = (f"{query}. Visit the nearest office with the required documents and apply online. " * 50)[:config.content_chars]
+            results = [{
+                "url": f"https://{domains[i % len(domains)]}/page/{abs(hash((query, i))) % 10000}",
+                "title": f"{query.title()} - result {i + 1}",
+                "content": filler,
+                "score": round(0.95 - i * 0.05, 2),
+                "raw_content": None,
+            } for i in range(min(int(body.get("max_results", 5)), config.results))]
+            self._send_json(200, {"query": query, "answer": f"Stub answer for {query}", "results": results,
+                                  "response_time": round(latency, 3)})
+
+        def _chat(self, body):
+            latency, failed = config.draw("llm", config.llm_latency, config.llm_error_rate)
+            words = [f"word{i}" for i in range(config.llm_tokens)]
+            if failed:
+                time.sleep(latency)
+                return self._send_json(429, {"error": {"code": "429", "message": "Rate limit (stub)"}})
+            base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": "gpt-4o"}
+            if not body.get("stream"):
+                time.sleep(latency)
+                return self._send_json(200, dict(base, object="chat.completion", choices=[{
+                    "index": 0, "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                }], usage={"prompt_tokens": 1000, "completion_tokens": len(words), "total_tokens": 1000 + len(words)}))
+
+            # Streamed: a fifth of the latency before the first token, the rest spread over the tokens
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            time.sleep(latency * 0.2)
+            per_token = latency * 0.8 / max(len(words), 1)
+            for i, word in enumerate(words):
+                chunk = dict(base, object="chat.completion.chunk", choices=[{
+                    "index": 0, "finish_reason": None, "delta": {"content": word + " "},
+                }])
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+                time.sleep(per_token)
+            done = dict(base, object="chat.completion.chunk", choices=[{"index": 0, "finish_reason": "stop", "delta": {}}])
+            self._write_chunk(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _write_chunk(self, text):
+            data = text.encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+    return StubHandler
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Backends dropping keep-alive connections when they shut down is expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_stub_server(config):
+    """Serve both the Tavily /search stand-in and the Azure chat completions stand-in on one port"""
+    server = _StubServer(("127.0.0.1", free_port()), _stub_handler(config))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def build_queries(unique, seed):
+    rng = random.Random(seed)
+    pool = [form.format(topic) for topic in QUERY_TOPICS for form in QUERY_FORMS]
+    rng.shuffle(pool)
+    return [pool[i % len(pool)] + ("" if i < len(pool) else f" {i // len(pool)}") for i in range(unique)]
+
+
+def backend_env(stub_url, modes, keep_guards):
+    env = dict(os.environ)
+    env.update({
+        "TAVILY_API_KEY": "tvly-benchmark",
+        "TAVILY_API_BASE_URL": stub_url,
+        "OPENAI_API_KEY": "sk-benchmark",
+        "AZURE_OPENAI_API_KEY": "benchmark",
+        "AZURE_OPENAI_ENDPOINT": stub_url,
+        "SEMANTIC_CACHE_EMBEDDER": "hashing",
+        "RETRIEVAL_MODE": "web",
+        "CORPUS_INDEX_ENABLED": "0",
+        "LLM_MAX_RETRIES": "0",
+    })
+    if not keep_guards:
+        env.update({"TAVILY_RATE_LIMIT": "0", "LLM_RATE_LIMIT": "0"})
+    for mode in modes:
+        env.update(MODE_ENV[mode])
+    return env
+
+
+def start_backend(name, env, startup_timeout=60):
+    """Launch a backend in a subprocess and wait for /health; returns (process, base_url)"""
+    port = free_port()
+    command = [part.format(port=port) for part in BACKEND_COMMANDS[name]]
+    process = subprocess.Popen(command, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{name} exited during startup:\n{process.stderr.read()[-2000:]}")
+        try:
+            if requests.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return process, base_url
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{name} did not become healthy within {startup_timeout}s")
+
+
+def stop_backend(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def _search_once(session, base_url, query, stream, timeout, summarizer=None):
+    """One request; returns (status, total_seconds, first_token_seconds)"""
+    payload = {"query": query, "search_scope": "ap_gov_only"}
+    if summarizer:
+        payload["summarizer"] = summarizer
+    started = time.perf_counter()
+    if not stream:
+        response = session.post(f"{base_url}/search", json=payload, timeout=timeout)
+        response.content
+        return response.status_code, time.perf_counter() - started, None
+
+    first_token = None
+    status = "stream_error"
+    with session.post(f"{base_url}/search/stream", json=payload, stream=True, timeout=timeout) as response:
+        if response.status_code != 200:
+            return response.status_code, time.perf_counter() - started, None
+        for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+            if line == "event: token" and first_token is None:
+                first_token = time.perf_counter() - started
+            elif line == "event: done":
+                status = 200
+            elif line == "event: error":
+                status = "stream_error"
+    return status, time.perf_counter() - started, first_token
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    values = np.asarray(samples) * 1000
+    return {
+        "p50": round(float(np.percentile(values, 50)), 1),
+        "p95": round(float(np.percentile(values, 95)), 1),
+        "p99": round(float(np.percentile(values, 99)), 1),
+        "mean": round(float(values.mean()), 1),
+        "max": round(float(values.max()), 1),
+    }
+
+
+def drive_load(base_url, queries, total, concurrency, stream, timeout, warmup, summarizer=None):
+    """Send total requests at a fixed concurrency and summarize latency and throughput"""
+    session = build_session(pool_maxsize=concurrency)
+    for query in queries[:warmup]:
+        try:
+            _search_once(session, base_url, query, stream, timeout, summarizer)
+        except requests.exceptions.RequestException:
+            pass
+
+    counter = iter(range(total))
+    lock = threading.Lock()
+    records = []
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            try:
+                record = _search_once(session, base_url, queries[i % len(queries)], stream, timeout, summarizer)
+            except requests.exceptions.RequestException as e:
+                record = (type(e).__name__, timeout, None)
+            with lock:
+                records.append(record)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - started
+
+    status_counts = {}
+    for status, _, _ in records:
+        status_counts[str(status)] = status_counts.get(str(status), 0) + 1
+    ok = [r for r in records if r[0] == 200]
+    summary = {
+        "requests": len(records),
+        "errors": len(records) - len(ok),
+        "status_counts": status_counts,
+        "duration_s": round(elapsed, 3),
+        "rps": round(len(records) / elapsed, 2) if elapsed else None,
+        "latency_ms": percentiles([r[1] for r in ok]),
+    }
+    if stream:
+        summary["first_token_ms"] = percentiles([r[2] for r in ok if r[2] is not None])
+    return summary
+
+
+def scenario_summarizer(name, modes):
+    """Summarizer the scenario's requests ask for; None for tevily, which never calls the LLM"""
+    if name == "tevily":
+        return None
+    requested = [m for m in modes if m in SUMMARIZER_MODES]
+    if len(requested) > 1:
+        raise ValueError(f"Pick one summarizer mode: {', '.join(requested)}")
+    return requested[0] if requested else "llm"
+
+
+def run_scenario(spec, args, stub_url, queries, config):
+    """Benchmark one 'backend[:mode+mode]' scenario, e.g. 'tevily_2:nocache+stream'
+
+    The summary records the stub upstream calls the scenario made.
+    """
+    name, _, mode_text = spec.partition(":")
+    modes = [m for m in mode_text.split("+") if m]
+    if name not in BACKEND_COMMANDS:
+        raise ValueError(f"Unknown backend: {name}")
+    unknown = [m for m in modes if m not in MODE_ENV]
+    if unknown:
+        raise ValueError(f"Unknown mode(s): {', '.join(unknown)}")
+    if "stream" in modes and name == "tevily":
+        raise ValueError("tevily has no streaming endpoint")
+    summarizer = scenario_summarizer(name, modes)
+
+    calls_before = dict(config.calls)
+    process, base_url = start_backend(name, backend_env(stub_url, modes, args.keep_guards))
+    try:
+        summary = drive_load(base_url, queries, args.requests, args.concurrency, "stream" in modes, args.timeout,
+                             args.warmup, summarizer)
+    finally:
+        stop_backend(process)
+    summary["summarizer"] = summarizer
+    summary["upstream_calls"] = {upstream: config.calls[upstream] - calls_before[upstream] for upstream in config.calls}
+    return summary
+
+
+def unmeasured_llm_scenarios(report):
+    """Scenarios asking for LLM answers during which the LLM stub was never called"""
+    return [spec for spec, summary in report["scenarios"].items()
+            if summary.get("summarizer") == "llm" and not summary["upstream_calls"]["llm"]]
+
+
+def compare_to_baseline(report, baseline, max_regression):
+    """List scenarios whose p95 latency or throughput regressed beyond max_regression (a fraction)"""
+    regressions = []
+    for spec, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(spec)
+        if not previous or not previous.get("latency_ms") or not current.get("latency_ms"):
+            continue
+        old_p95, new_p95 = previous["latency_ms"]["p95"], current["latency_ms"]["p95"]
+        if new_p95 > old_p95 * (1 + max_regression):
+            regressions.append(f"{spec}: p95 {old_p95} ms -> {new_p95} ms")
+        if previous.get("rps") and current.get("rps") and current["rps"] < previous["rps"] * (1 - max_regression):
+            regressions.append(f"{spec}: rps {previous['rps']} -> {current['rps']}")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_table(report):
+    print(f"{'scenario':<28}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'errors':>8}{'tavily':>8}{'llm':>6}")
+    for spec, summary in report["scenarios"].items():
+        latency = summary.get("latency_ms") or {}
+        calls = summary["upstream_calls"]
+        print(f"{spec:<28}{summary.get('rps') or 0:>8}{latency.get('p50', '-'):>9}{latency.get('p95', '-'):>9}"
+              f"{latency.get('p99', '-'):>9}{summary['errors']:>8}{calls['tavily']:>8}{calls['llm']:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the search backends against local stub upstreams")
+    parser.add_argument("--scenarios", default="tevily,tevily_2,tevily_2:nocache,tevily_2:stream,tevily_async",
+                        help="Comma-separated backend[:mode+mode] specs; modes: nocache, stream, and extractive or "
+                             "auto (the summarizer to request; llm otherwise)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--unique-queries", type=int, default=50, help="Distinct queries; repeats exercise the caches")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--tavily-latency", type=float, default=0.8, help="Median stub Tavily latency (s)")
+    parser.add_argument("--tavily-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=float, default=1.5, help="Median stub LLM latency (s)")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-tokens", type=int, default=150)
+    parser.add_argument("--latency-sigma", type=float, default=0.4, help="Log-normal spread of stub latencies")
+    parser.add_argument("--results", type=int, default=5, help="Results returned per stub Tavily search")
+    parser.add_argument("--content-chars", type=int, default=1500, help="Content length of each stub result")
+    parser.add_argument("--keep-guards", action="store_true", help="Keep the configured upstream rate limits")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.15)
+    args = parser.parse_args()
+
+    config = StubConfig(args)
+    stub, stub_url = start_stub_server(config)
+    queries = build_queries(args.unique_queries, args.seed)
+
+    report = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": git_commit(),
+        "config": vars(args),
+        "scenarios": {},
+    }
+    try:
+        for spec in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+            print(f"Running {spec}...", flush=True)
+            report["scenarios"][spec] = run_scenario(spec, args, stub_url, queries, config)
+    finally:
+        stub.shutdown()
+    report["upstream_calls"] = dict(config.calls)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print_table(report)
+    print(f"Results written to {args.output}")
+
+    unmeasured = unmeasured_llm_scenarios(report)
+    for spec in unmeasured:
+        print(f"NO LLM CALLS {spec}: the LLM path was not measured")
+    if unmeasured:
+        sys.exit(1)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_to_baseline(report, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,73 @@
-from langchain_openai import AzureChatOpenAI
-from langchain_pinecone import PineconeVectorStore
-from pinecone import Pinecone
-from langchain_openai.embeddings import OpenAIEmbeddings
 import logging
 # from langchain.tools.tavily_search import TavilySearchResults
 logger = logging.getLogger(__name__)
 import os
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
-OPENAI_API_KEY=os.environ["OPENAI_API_KEY"] 
-AZURE_OPENAI_API_KEY=os.environ["AZURE_OPENAI_API_KEY"]
 os.environ["OPENAI_API_VERSION"]="2024-08-01-preview"
-AZURE_OPENAI_ENDPOINT=os.environ["AZURE_OPENAI_ENDPOINT"]
 
-llm = AzureChatOpenAI(
-    azure_deployment="Alfred-gpt-4o",
-    api_version=os.environ.get("OPENAI_API_VERSION", "2024-08-01-preview"),  # Default version if not set
-    temperature=0,
-    max_tokens=None,)
\ No newline at end of file
+# Default LLM request timeout (seconds); deadline-bound requests pass a shorter one per call
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+
+# Heavy clients are built on first use, so processes that never call the LLM never import LangChain
+_llm = None
+_http_client = None
+_http_async_client = None
+_lock = threading.Lock()
+
+
+def get_llm():
+    """Azure OpenAI chat model, created once per process on first use"""
+    global _llm, _http_client, _http_async_client
+    if _llm is None:
+        with _lock:
+            if _llm is None:
+                import httpx
+                from langchain_openai import AzureChatOpenAI
+
+                # Fail early with a clear KeyError if the Azure settings are missing
+                os.environ["AZURE_OPENAI_API_KEY"]
+                os.environ["AZURE_OPENAI_ENDPOINT"]
+
+                limits = httpx.Limits(max_connections=32, max_keepalive_connections=16)
+                _http_client = httpx.Client(limits=limits)
+                _http_async_client = httpx.AsyncClient(limits=limits)
+                _llm = AzureChatOpenAI(
+                    azure_deployment="Alfred-gpt-4o",
+                    api_version=os.environ.get("OPENAI_API_VERSION", "2024-08-01-preview"),  # Default version if not set
+                    temperature=0,
+                    max_tokens=None,
+                    # Pooled keep-alive connections and an explicit timeout instead of the SDK defaults
+                    timeout=LLM_TIMEOUT,
+                    max_retries=int(os.getenv("LLM_MAX_RETRIES", "1")),
+                    http_client=_http_client,
+                    http_async_client=_http_async_client,)
+    return _llm
+
+
+def warm_up_llm():
+    """Build the LLM client and open a pooled connection to the Azure endpoint ahead of the first request"""
+    get_llm()
+    try:
+        _http_client.head(os.environ["AZURE_OPENAI_ENDPOINT"], timeout=5)
+    except Exception as e:
+        logger.warning(f"Azure OpenAI warm-up failed: {str(e)}")
+
+
+async def awarm_up_llm():
+    """Async variant of warm_up_llm, for event-loop servers"""
+    get_llm()
+    try:
+        await _http_async_client.head(os.environ["AZURE_OPENAI_ENDPOINT"], timeout=5)
+    except Exception as e:
+        logger.warning(f"Azure OpenAI warm-up failed: {str(e)}")
+
+
+def __getattr__(name):
+    # Backwards compatible `component_initilizer.llm`, resolved lazily
+    if name == "llm":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,122 @@
+import os
+import re
+
+import numpy as np
+
+# Context configuration
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+PASSAGE_WORDS = int(os.getenv("CONTEXT_PASSAGE_WORDS", "120"))
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how i in is it me my of on or the to what when where which who
+why will with andhra pradesh ap government govt
+""".split())
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)"""
+    return len(text) // 4 + 1
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def split_passages(text, passage_words=PASSAGE_WORDS):
+    """Split page text into passages of roughly passage_words words along paragraph boundaries"""
+    passages = []
+    current = []
+    for paragraph in re.split(r"\n\s*\n|\r\n|\n", text or ""):
+        words = paragraph.split()
+        if not words:
+            continue
+        # Long paragraphs are cut into fixed-size windows
+        while len(words) > passage_words:
+            if current:
+                passages.append(" ".join(current))
+                current = []
+            passages.append(" ".join(words[:passage_words]))
+            words = words[passage_words:]
+        if len(current) + len(words) > passage_words and current:
+            passages.append(" ".join(current))
+            current = []
+        current.extend(words)
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+def score_passages(query, passages):
+    """BM25 scores of passages against the query, computed with NumPy over a passage x term matrix"""
+    terms = [term for term in dict.fromkeys(tokenize(query)) if term not in STOPWORDS]
+    if not terms or not passages:
+        return np.zeros(len(passages))
+
+    term_ids = {term: i for i, term in enumerate(terms)}
+    passage_ids = []
+    token_ids = []
+    lengths = np.empty(len(passages))
+    for p, passage in enumerate(passages):
+        tokens = tokenize(passage)
+        lengths[p] = len(tokens)
+        for token in tokens:
+            term_id = term_ids.get(token)
+            if term_id is not None:
+                passage_ids.append(p)
+                token_ids.append(term_id)
+
+    tf = np.zeros((len(passages), len(terms)))
+    if token_ids:
+        flat = np.asarray(passage_ids) * len(terms) + np.asarray(token_ids)
+        tf = np.bincount(flat, minlength=tf.size).reshape(tf.shape).astype(float)
+
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log(1.0 + (len(passages) - df + 0.5) / (df + 0.5))
+    avg_length = max(lengths.mean(), 1.0)
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / avg_length)
+    return ((tf * (BM25_K1 + 1)) / (tf + norm[:, None]) * idf).sum(axis=1)
+
+
+def _result_header(n, result):
+    return f"\nResult {n}:\nTitle: {result.get('title', 'No title')}\nURL: {result.get('url', 'No URL')}\nContent: "
+
+
+def build_context(query, search_results, token_budget=CONTEXT_TOKEN_BUDGET):
+    """Format the most query-relevant passages of the results, grouped per source, within token_budget"""
+    candidates = []  # (result_index, passage_index, text)
+    for r, result in enumerate(search_results):
+        seen = set()
+        texts = split_passages(result.get('content') or '') + split_passages(result.get('raw_content') or '')
+        for text in texts:
+            key = " ".join(tokenize(text))
+            if key in seen:
+                continue
+            seen.add(key)
+            candidates.append((r, len(seen) - 1, text))
+
+    scores = score_passages(query, [text for _, _, text in candidates])
+    # Best score first; ties (e.g. no query overlap) favour leading passages of higher-ranked results
+    order = sorted(range(len(candidates)), key=lambda i: (-scores[i], candidates[i][1], candidates[i][0]))
+
+    selected = {}
+    used = 0
+    for i in order:
+        r, p, text = candidates[i]
+        cost = estimate_tokens(text)
+        if r not in selected:
+            cost += estimate_tokens(_result_header(r + 1, search_results[r]))
+        if used + cost > token_budget:
+            continue
+        selected.setdefault(r, []).append((p, text))
+        used += cost
+
+    formatted_results = ""
+    for n, r in enumerate(sorted(selected), 1):
+        passages = " ... ".join(text for _, text in sorted(selected[r]))
+        formatted_results += _result_header(n, search_results[r]) + passages + "\n\n"
+    return formatted_results
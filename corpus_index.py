@@ -0,0 +1,418 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from context_builder import tokenize, STOPWORDS
+from dedup import document_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Corpus index configuration
+CORPUS_INDEX_DIR = os.getenv("CORPUS_INDEX_DIR", "corpus_index")
+CORPUS_INDEX_ENABLED = os.getenv("CORPUS_INDEX_ENABLED", "1") == "1"
+CORPUS_FLUSH_DOCS = int(os.getenv("CORPUS_FLUSH_DOCS", "50"))
+CORPUS_FLUSH_INTERVAL = float(os.getenv("CORPUS_FLUSH_INTERVAL", "30"))
+CORPUS_MAX_SEGMENTS = int(os.getenv("CORPUS_MAX_SEGMENTS", "8"))
+CORPUS_RAW_CONTENT_CHARS = int(os.getenv("CORPUS_RAW_CONTENT_CHARS", "20000"))
+CORPUS_RELOAD_INTERVAL = float(os.getenv("CORPUS_RELOAD_INTERVAL", "30"))
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+MANIFEST_FILE = "manifest.json"
+WRITER_LOCK_FILE = ".writer.lock"
+
+
+class _Segment:
+    """Immutable block of the inverted index
+
+    Postings for term i are doc_deltas/tfs[offsets[i]:offsets[i + 1]], with doc ids
+    delta-encoded inside each term's run.
+    """
+
+    def __init__(self, name, terms, offsets, doc_deltas, tfs, doc_lengths, docs):
+        self.name = name
+        self.terms = terms
+        self.term_index = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.doc_deltas = doc_deltas
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.docs = docs
+        self.live = np.ones(len(docs), dtype=bool)
+
+    @classmethod
+    def build(cls, name, docs, term_ids, doc_ids, tfs, vocabulary, doc_lengths):
+        """Build a segment from unsorted (term_id, doc_id, tf) postings"""
+        order = np.lexsort((doc_ids, term_ids))
+        term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+
+        # Drop terms that no longer have postings and renumber the rest
+        used = np.unique(term_ids)
+        terms = [vocabulary[i] for i in used]
+        term_ids = np.searchsorted(used, term_ids)
+
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(term_ids, minlength=len(terms)))
+        doc_deltas = doc_ids.astype(np.uint32)
+        if len(doc_deltas) > 1:
+            doc_deltas[1:] -= doc_ids[:-1].astype(np.uint32)
+            starts = offsets[:-1][offsets[:-1] < len(doc_deltas)]
+            doc_deltas[starts] = doc_ids[starts]
+        return cls(name, terms, offsets, doc_deltas, tfs.astype(np.uint16), doc_lengths.astype(np.uint32), docs)
+
+    def postings(self, term):
+        i = self.term_index.get(term)
+        if i is None:
+            return None, None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return np.cumsum(self.doc_deltas[start:end], dtype=np.int64), self.tfs[start:end]
+
+    def expand(self):
+        """All postings as absolute (term_id, doc_id, tf) arrays"""
+        counts = np.diff(self.offsets)
+        term_ids = np.repeat(np.arange(len(self.terms)), counts)
+        cumulative = np.cumsum(self.doc_deltas, dtype=np.int64)
+        run_base = np.zeros(len(self.terms), dtype=np.int64)
+        starts = self.offsets[:-1]
+        has_prior = (starts > 0) & (counts > 0)
+        run_base[has_prior] = cumulative[starts[has_prior] - 1]
+        return term_ids, cumulative - np.repeat(run_base, counts), self.tfs.astype(np.int64)
+
+    def save(self, directory):
+        np.savez(
+            os.path.join(directory, f"{self.name}.npz"),
+            terms=np.array(self.terms, dtype=str),
+            offsets=self.offsets,
+            doc_deltas=self.doc_deltas,
+            tfs=self.tfs,
+            doc_lengths=self.doc_lengths,
+        )
+        with open(os.path.join(directory, f"{self.name}.docs.jsonl"), "w", encoding="utf-8") as f:
+            for doc in self.docs:
+                f.write(json.dumps(doc) + "\n")
+
+    @classmethod
+    def load(cls, directory, name):
+        with np.load(os.path.join(directory, f"{name}.npz")) as data:
+            arrays = {key: data[key] for key in data.files}
+        with open(os.path.join(directory, f"{name}.docs.jsonl"), encoding="utf-8") as f:
+            docs = [json.loads(line) for line in f]
+        return cls(name, arrays["terms"].tolist(), arrays["offsets"], arrays["doc_deltas"],
+                   arrays["tfs"], arrays["doc_lengths"], docs)
+
+    def delete_files(self, directory):
+        for suffix in (".npz", ".docs.jsonl"):
+            try:
+                os.remove(os.path.join(directory, f"{self.name}{suffix}"))
+            except OSError:
+                pass
+
+
+def _document_text(doc):
+    return " ".join(filter(None, (doc.get('title'), doc.get('content'), doc.get('raw_content'))))
+
+
+class CorpusIndex:
+    """Persistent BM25 index fed incrementally with every search result the service fetches
+
+    New documents are queued and flushed off the request path into on-disk segments;
+    segments are merged once there are more than max_segments. A later fetch of the same
+    URL supersedes the earlier document. With several worker processes only the one holding
+    the writer lock indexes; the others periodically reload what it has written.
+    """
+
+    def __init__(self, directory=CORPUS_INDEX_DIR, flush_docs=CORPUS_FLUSH_DOCS,
+                 flush_interval=CORPUS_FLUSH_INTERVAL, max_segments=CORPUS_MAX_SEGMENTS):
+        self.directory = directory
+        self.flush_docs = flush_docs
+        self.flush_interval = flush_interval
+        self.max_segments = max_segments
+        self._segments = []
+        self._latest = {}  # url -> (segment, local doc id)
+        self._next_segment = 1
+        self._lock = threading.RLock()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._writer = None  # unknown until the first add_results
+        self._writer_lock_file = None
+        self._manifest_mtime = None
+        self._last_reload_check = time.monotonic()
+        self._load()
+
+    # ---- persistence -------------------------------------------------
+
+    def _load(self):
+        path = os.path.join(self.directory, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return
+        try:
+            mtime = os.path.getmtime(path)
+            with open(path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            for name in manifest["segments"]:
+                self._register_segment(_Segment.load(self.directory, name))
+            self._next_segment = manifest["next_segment"]
+            self._manifest_mtime = mtime
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Could not load corpus index from {self.directory}: {str(e)}")
+
+    def _acquire_writer(self):
+        """Take the per-directory writer lock without blocking; True if this process may write"""
+        try:
+            import fcntl
+        except ImportError:
+            return True  # No flock (Windows): assume a single process
+        os.makedirs(self.directory, exist_ok=True)
+        lock_file = open(os.path.join(self.directory, WRITER_LOCK_FILE), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._writer_lock_file = lock_file
+        return True
+
+    def _maybe_reload(self):
+        """Processes not holding the writer lock pick up segments written by the writer (checked every CORPUS_RELOAD_INTERVAL)
+
+        That includes processes that have not added anything yet and so never tried for the lock.
+        """
+        if self._writer or time.monotonic() - self._last_reload_check < CORPUS_RELOAD_INTERVAL:
+            return
+        with self._lock:
+            self._last_reload_check = time.monotonic()
+            if self._writer is False and self._acquire_writer():
+                self._writer = True  # the previous writer exited; take over
+            self._reload_if_changed()
+
+    def _reload_if_changed(self):
+        """Reload the segments if the manifest changed since it was last read; the caller holds _lock"""
+        try:
+            mtime = os.path.getmtime(os.path.join(self.directory, MANIFEST_FILE))
+        except OSError:
+            return
+        if mtime != self._manifest_mtime:
+            self._segments = []
+            self._latest = {}
+            self._load()
+
+    def _write_manifest(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, MANIFEST_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"segments": [s.name for s in self._segments], "next_segment": self._next_segment}, f)
+        os.replace(path + ".tmp", path)
+
+    def _register_segment(self, segment):
+        """Add a segment and tombstone older copies of the URLs it contains"""
+        self._segments.append(segment)
+        for doc_id, doc in enumerate(segment.docs):
+            previous = self._latest.get(doc['url'])
+            if previous is not None:
+                previous[0].live[previous[1]] = False
+            self._latest[doc['url']] = (segment, doc_id)
+
+    def _new_segment_name(self):
+        name = f"seg_{self._next_segment:06d}"
+        self._next_segment += 1
+        return name
+
+    # ---- ingestion ---------------------------------------------------
+
+    def add_results(self, results):
+        """Queue Tavily results for indexing; returns immediately"""
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = self._acquire_writer()
+                    if self._writer:
+                        # Continue from what an earlier writer left, not from this process's last reload
+                        self._reload_if_changed()
+        if not self._writer:
+            return
+        for result in results or []:
+            if result.get('url') and result.get('retrieval') is None:
+                self._queue.put({
+                    "url": result['url'],
+                    "title": result.get('title') or '',
+                    "content": result.get('content') or '',
+                    "raw_content": (result.get('raw_content') or '')[:CORPUS_RAW_CONTENT_CHARS],
+                    "fetched_at": time.time(),
+                    "minhash": result.get('minhash'),  # reused by index_documents when already computed
+                })
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name="corpus-index", daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        pending = []
+        last_flush = time.monotonic()
+        while True:
+            try:
+                pending.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                pass
+            due = time.monotonic() - last_flush >= self.flush_interval
+            if pending and (len(pending) >= self.flush_docs or due):
+                try:
+                    self.index_documents(pending)
+                except Exception as e:
+                    logger.error(f"Corpus index flush failed: {str(e)}")
+                pending = []
+                last_flush = time.monotonic()
+
+    def index_documents(self, docs):
+        """Write docs as a new segment (merging segments if there are too many)"""
+        # Only the newest copy of a URL within the batch is kept
+        docs = list({doc['url']: doc for doc in docs}.values())
+        vocabulary = {}
+        term_ids, doc_ids, tfs = [], [], []
+        doc_lengths = np.zeros(len(docs), dtype=np.int64)
+        for doc_id, doc in enumerate(docs):
+            # Stored with the document so deduplicating corpus hits needs no rehashing
+            doc['minhash'] = document_fingerprint(doc)
+            tokens = tokenize(_document_text(doc))
+            doc_lengths[doc_id] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_ids.append(doc_id)
+                tfs.append(min(tf, 65535))
+
+        # Sort the vocabulary so segments share term order
+        terms = sorted(vocabulary)
+        remap = np.empty(len(vocabulary), dtype=np.int64)
+        for new_id, term in enumerate(terms):
+            remap[vocabulary[term]] = new_id
+
+        with self._lock:
+            segment = _Segment.build(
+                self._new_segment_name(), docs,
+                remap[np.asarray(term_ids, dtype=np.int64)], np.asarray(doc_ids, dtype=np.int64),
+                np.asarray(tfs, dtype=np.int64), terms, doc_lengths,
+            )
+            os.makedirs(self.directory, exist_ok=True)
+            segment.save(self.directory)
+            self._register_segment(segment)
+            self._write_manifest()
+            if len(self._segments) > self.max_segments:
+                self.merge()
+
+    def merge(self):
+        """Merge all segments into one, dropping superseded documents"""
+        with self._lock:
+            if len(self._segments) < 2:
+                return
+            old_segments = self._segments
+            vocabulary = sorted(set().union(*(segment.terms for segment in old_segments)))
+            term_lookup = {term: i for i, term in enumerate(vocabulary)}
+
+            docs, lengths = [], []
+            all_terms, all_docs, all_tfs = [], [], []
+            for segment in old_segments:
+                # Map live local doc ids to ids in the merged segment, -1 for deleted
+                remap = np.full(len(segment.docs), -1, dtype=np.int64)
+                live_ids = np.flatnonzero(segment.live)
+                remap[live_ids] = np.arange(len(docs), len(docs) + len(live_ids))
+                docs.extend(segment.docs[i] for i in live_ids)
+                lengths.append(segment.doc_lengths[live_ids])
+
+                term_ids, doc_ids, tfs = segment.expand()
+                keep = remap[doc_ids] >= 0
+                global_terms = np.array([term_lookup[t] for t in segment.terms], dtype=np.int64)
+                all_terms.append(global_terms[term_ids[keep]])
+                all_docs.append(remap[doc_ids[keep]])
+                all_tfs.append(tfs[keep])
+
+            merged = _Segment.build(
+                self._new_segment_name(), docs,
+                np.concatenate(all_terms), np.concatenate(all_docs), np.concatenate(all_tfs),
+                vocabulary, np.concatenate(lengths),
+            )
+            merged.save(self.directory)
+            self._segments = []
+            self._latest = {}
+            self._register_segment(merged)
+            self._write_manifest()
+            for segment in old_segments:
+                segment.delete_files(self.directory)
+            logger.info(f"Merged {len(old_segments)} corpus segments into {merged.name} ({len(docs)} docs)")
+
+    # ---- search ------------------------------------------------------
+
+    def search(self, query, top_k=5):
+        """BM25 top-k over live documents; returns Tavily-shaped results with scores scaled to 0..1"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        terms = [term for term in terms if term not in STOPWORDS] or terms
+        self._maybe_reload()
+        with self._lock:
+            segments = list(self._segments)
+        if not terms or not segments:
+            return []
+
+        live_docs = sum(int(segment.live.sum()) for segment in segments)
+        if live_docs == 0:
+            return []
+        total_length = sum(float(segment.doc_lengths[segment.live].sum()) for segment in segments)
+        avg_length = max(total_length / live_docs, 1.0)
+
+        postings = [{term: segment.postings(term) for term in terms} for segment in segments]
+        df = {term: sum(len(p[term][0]) for p in postings if p[term][0] is not None) for term in terms}
+
+        candidates = []
+        for segment, segment_postings in zip(segments, postings):
+            scores = np.zeros(len(segment.docs))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * segment.doc_lengths / avg_length)
+            for term in terms:
+                doc_ids, tfs = segment_postings[term]
+                if doc_ids is None:
+                    continue
+                idf = np.log(1.0 + (live_docs - df[term] + 0.5) / (df[term] + 0.5))
+                np.add.at(scores, doc_ids, idf * tfs * (BM25_K1 + 1) / (tfs + norm[doc_ids]))
+            scores[~segment.live] = 0
+            k = min(top_k, len(scores))
+            for doc_id in np.argpartition(-scores, k - 1)[:k]:
+                if scores[doc_id] > 0:
+                    candidates.append((float(scores[doc_id]), segment.docs[doc_id]))
+
+        candidates.sort(key=lambda candidate: -candidate[0])
+        candidates = candidates[:top_k]
+        if not candidates:
+            return []
+        best = candidates[0][0]
+        return [
+            {
+                "url": doc['url'],
+                "title": doc['title'],
+                "content": doc['content'],
+                "raw_content": doc['raw_content'],
+                "score": round(score / best, 4),
+                "minhash": doc.get('minhash'),
+                "retrieval": "local_corpus",
+            }
+            for score, doc in candidates
+        ]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "segments": len(self._segments),
+                "documents": sum(int(segment.live.sum()) for segment in self._segments),
+                "queued": self._queue.qsize(),
+            }
+
+
+# Shared corpus fed by every backend process
+corpus_index = CorpusIndex() if CORPUS_INDEX_ENABLED else None
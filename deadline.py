@@ -0,0 +1,106 @@
+import os
+import time
+
+from metrics import STAGE_SECONDS, TAVILY_SECONDS
+
+# Request budget configuration
+SEARCH_DEADLINE_MS = int(os.getenv("SEARCH_DEADLINE_MS", "20000"))  # used when a request sends no deadline_ms
+MIN_DEADLINE_MS = int(os.getenv("MIN_DEADLINE_MS", "500"))
+MAX_DEADLINE_MS = int(os.getenv("MAX_DEADLINE_MS", "60000"))
+DEADLINE_REDUCED_MAX_RESULTS = int(os.getenv("DEADLINE_REDUCED_MAX_RESULTS", "3"))
+
+# Stage cost estimates (ms) used until enough latencies have been observed
+DEADLINE_TAVILY_ADVANCED_MS = int(os.getenv("DEADLINE_TAVILY_ADVANCED_MS", "3000"))
+DEADLINE_TAVILY_BASIC_MS = int(os.getenv("DEADLINE_TAVILY_BASIC_MS", "1500"))
+DEADLINE_LLM_MS = int(os.getenv("DEADLINE_LLM_MS", "6000"))
+DEADLINE_RESERVE_MS = int(os.getenv("DEADLINE_RESERVE_MS", "250"))  # filtering, extractive summary, response
+DEADLINE_ESTIMATE_QUANTILE = float(os.getenv("DEADLINE_ESTIMATE_QUANTILE", "0.9"))
+DEADLINE_MIN_SAMPLES = 20
+
+# Shortest upstream timeout worth attempting (seconds)
+MIN_UPSTREAM_TIMEOUT = 0.5
+
+
+def parse_deadline(data):
+    """deadline_ms from a request body, clamped to the allowed range; the server default if absent or invalid"""
+    try:
+        deadline_ms = int((data or {}).get('deadline_ms') or SEARCH_DEADLINE_MS)
+    except (TypeError, ValueError):
+        deadline_ms = SEARCH_DEADLINE_MS
+    return min(max(deadline_ms, MIN_DEADLINE_MS), MAX_DEADLINE_MS)
+
+
+def estimate(histogram, default_ms, *label_values):
+    """Observed latency quantile for a stage (seconds), or the configured default until there are enough samples"""
+    observed = histogram.quantile(DEADLINE_ESTIMATE_QUANTILE, *label_values, min_count=DEADLINE_MIN_SAMPLES)
+    return observed if observed is not None else default_ms / 1000
+
+
+def tavily_estimate(search_depth):
+    default_ms = DEADLINE_TAVILY_ADVANCED_MS if search_depth == 'advanced' else DEADLINE_TAVILY_BASIC_MS
+    return estimate(TAVILY_SECONDS, default_ms, search_depth)
+
+
+def llm_estimate():
+    return estimate(STAGE_SECONDS, DEADLINE_LLM_MS, "llm")
+
+
+class Budget:
+    """Time left for one request, and the degradations applied to stay within it"""
+
+    def __init__(self, deadline_ms):
+        self.deadline_ms = deadline_ms
+        self.expires = time.monotonic() + deadline_ms / 1000
+        self.degradations = []
+
+    def remaining(self):
+        return max(self.expires - time.monotonic(), 0.0)
+
+    def affords(self, seconds):
+        """Whether a stage estimated to take seconds still fits, leaving the reserve for the response"""
+        return self.remaining() >= seconds + DEADLINE_RESERVE_MS / 1000
+
+    def timeout(self, cap):
+        """Upstream timeout that ends the call before the deadline (never above cap)"""
+        return max(min(cap, self.remaining() - DEADLINE_RESERVE_MS / 1000), MIN_UPSTREAM_TIMEOUT)
+
+    def degrade(self, degradation):
+        if degradation not in self.degradations:
+            self.degradations.append(degradation)
+
+
+def plan_search(params, budget):
+    """Pick search depth, result count and raw content so retrieval plus the answer fit the budget"""
+    if params['search_scope'] == 'local_corpus':
+        return
+    answer_cost = llm_estimate() if params['summarizer'] != 'extractive' else 0.0
+
+    if params['search_depth'] == 'advanced' and not budget.affords(tavily_estimate('advanced') + answer_cost):
+        params['search_depth'] = 'basic'
+        budget.degrade("search_depth:basic")
+
+    if not budget.affords(tavily_estimate(params['search_depth']) + answer_cost):
+        # Fewer, lighter results: a faster search and a shorter prompt
+        if params['max_results'] > DEADLINE_REDUCED_MAX_RESULTS:
+            params['max_results'] = DEADLINE_REDUCED_MAX_RESULTS
+            budget.degrade(f"max_results:{DEADLINE_REDUCED_MAX_RESULTS}")
+        params['include_raw_content'] = False
+        budget.degrade("raw_content:skipped")
+
+
+def plan_summarizer(summarizer, budget, cached_answer):
+    """Keep the LLM only if the remaining budget covers the call or cached_answer() has its answer"""
+    if summarizer != 'llm' or budget.affords(llm_estimate()):
+        return summarizer
+    if cached_answer() is not None:
+        budget.degrade("answer:cached")
+        return summarizer
+    budget.degrade("summarizer:extractive")
+    return 'extractive'
+
+
+def report_budget(response, budget):
+    """Response body annotated with the degradations applied to meet the deadline"""
+    if budget is None or not budget.degradations:
+        return response
+    return dict(response, degradations=list(budget.degradations))
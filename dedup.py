@@ -0,0 +1,155 @@
+import hashlib
+import os
+
+import numpy as np
+
+from context_builder import tokenize
+from domain_registry import registry, url_hostname
+
+# Near-duplicate detection configuration
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") == "1"
+DEDUP_MIN_SIMILARITY = float(os.getenv("DEDUP_MIN_SIMILARITY", "0.7"))  # estimated Jaccard of word shingles
+DEDUP_SHINGLE_SIZE = 3
+DEDUP_TEXT_CHARS = 20000  # only the start of long pages is fingerprinted
+# Preferred hosts for the copy that is kept, most authoritative first
+DEDUP_AUTHORITATIVE_DOMAINS = [
+    domain.strip().lower() for domain in os.getenv("DEDUP_AUTHORITATIVE_DOMAINS", "goir.ap.gov.in,ap.gov.in").split(",")
+    if domain.strip()
+]
+
+# MinHash signature: 64 hash functions, banded 16 x 4 for locality-sensitive bucketing
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240801)  # fixed seed: signatures must match across processes and restarts
+_A = _rng.integers(1, _PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def _shingle_hashes(text):
+    """31-bit hashes of the distinct word shingles of text"""
+    tokens = tokenize(text[:DEDUP_TEXT_CHARS])
+    if len(tokens) < DEDUP_SHINGLE_SIZE:
+        shingles = {" ".join(tokens)} if tokens else set()
+    else:
+        shingles = {" ".join(tokens[i:i + DEDUP_SHINGLE_SIZE]) for i in range(len(tokens) - DEDUP_SHINGLE_SIZE + 1)}
+    digests = b"".join(hashlib.blake2b(s.encode(), digest_size=4).digest() for s in shingles)
+    return np.frombuffer(digests, dtype=np.uint32).astype(np.uint64) % _PRIME
+
+
+def minhash(text):
+    """MinHash signature of text's word shingles as a hex string ('' for empty text)"""
+    hashes = _shingle_hashes(text or "")
+    if not len(hashes):
+        return ""
+    # (permutations x shingles) universal hashes, minimum per permutation
+    signature = ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+    return signature.astype(np.uint32).tobytes().hex()
+
+
+def document_fingerprint(doc):
+    """MinHash of a result or stored document (reusing one already stored under 'minhash')"""
+    fingerprint = doc.get('minhash')
+    if fingerprint is None:
+        fingerprint = minhash(doc.get('raw_content') or doc.get('content') or '')
+    return fingerprint
+
+
+def fingerprint_results(results):
+    """Store each result's MinHash under 'minhash', for results about to be cached, so hits are not hashed again"""
+    if not DEDUP_ENABLED:
+        return
+    for result in results or []:
+        result['minhash'] = document_fingerprint(result)
+
+
+def _signature(fingerprint):
+    return np.frombuffer(bytes.fromhex(fingerprint), dtype=np.uint32)
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two fingerprints"""
+    if not a or not b:
+        return 0.0
+    return float(np.mean(_signature(a) == _signature(b)))
+
+
+def cluster_fingerprints(fingerprints, min_similarity=DEDUP_MIN_SIMILARITY):
+    """Group indices of near-duplicate fingerprints; returns a list of clusters (lists of indices)
+
+    Signatures are split into bands and only items sharing a band bucket are compared, so the
+    work grows with the number of documents rather than the number of pairs.
+    """
+    parent = list(range(len(fingerprints)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    signatures = [_signature(fingerprint) if fingerprint else None for fingerprint in fingerprints]
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    buckets = {}
+    for i, signature in enumerate(signatures):
+        if signature is None:
+            continue  # empty text: nothing to compare
+        for band in range(LSH_BANDS):
+            key = (band, signature[band * rows:(band + 1) * rows].tobytes())
+            for j in buckets.setdefault(key, []):
+                if find(i) != find(j) and np.mean(signature == signatures[j]) >= min_similarity:
+                    parent[find(i)] = find(j)
+            buckets[key].append(i)
+
+    clusters = {}
+    for i in range(len(fingerprints)):
+        clusters.setdefault(find(i), []).append(i)
+    return sorted(clusters.values(), key=lambda cluster: cluster[0])
+
+
+def authority_rank(result):
+    """Sort key preferring listed authoritative hosts, then AP government hosts, then score"""
+    hostname = url_hostname(result.get('url'))
+    hostname = hostname[4:] if hostname.startswith("www.") else hostname
+    try:
+        preferred = DEDUP_AUTHORITATIVE_DOMAINS.index(hostname)
+    except ValueError:
+        preferred = len(DEDUP_AUTHORITATIVE_DOMAINS)
+    return (
+        preferred,
+        not registry.is_ap_gov(result.get('url', '')),
+        -(result.get('score') or 0.0),
+        len(result.get('url') or ''),
+    )
+
+
+def dedupe_results(results, min_similarity=DEDUP_MIN_SIMILARITY):
+    """Collapse near-duplicate results into their most authoritative copy
+
+    The kept result lists the other copies' URLs under 'mirrors', takes the position of the
+    cluster's best-ranked member (so the original ranking is preserved) and carries the cluster's
+    best score, so a low-scored official copy is not filtered out in favour of nothing.
+    """
+    results = list(results or [])
+    if not DEDUP_ENABLED or len(results) < 2:
+        return results
+    fingerprints = [document_fingerprint(result) for result in results]
+
+    deduped = []
+    for cluster in cluster_fingerprints(fingerprints, min_similarity):
+        if len(cluster) == 1:
+            deduped.append(results[cluster[0]])
+            continue
+        keep = min(cluster, key=lambda i: authority_rank(results[i]))
+        mirrors = [results[i]['url'] for i in cluster if i != keep and results[i].get('url')]
+        kept = dict(results[keep], mirrors=mirrors)
+        scores = [results[i]['score'] for i in cluster if results[i].get('score') is not None]
+        if kept.get('score') is not None and scores:
+            kept['score'] = max(scores)
+        deduped.append(kept)
+    return deduped
+
+
+def extract_mirrors(results):
+    """{url: [mirror urls]} for results that absorbed near-duplicates"""
+    return {result['url']: result['mirrors'] for result in results if result.get('mirrors') and result.get('url')}
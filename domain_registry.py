@@ -0,0 +1,137 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+AP_DOMAINS_FILE = os.getenv(
+    "AP_DOMAINS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "ap_domains.json"),
+)
+# How often (seconds) to check the domains file for changes
+AP_DOMAINS_RELOAD_INTERVAL = float(os.getenv("AP_DOMAINS_RELOAD_INTERVAL", "5"))
+
+_TERMINAL = object()  # trie key marking the end of a registered domain
+
+
+def url_hostname(url):
+    """Return the lowercase hostname of a URL (scheme optional), or '' if there is none"""
+    if not url:
+        return ""
+    try:
+        parts = urlsplit(url if "//" in url else f"//{url}")
+        return (parts.hostname or "").rstrip(".")
+    except ValueError:
+        return ""
+
+
+class _Snapshot:
+    """Immutable compiled view of the domain file"""
+
+    def __init__(self, categories):
+        self.categories = {}
+        self.domains = []
+        self.trie = {}
+        seen = set()
+        for category, domains in categories.items():
+            self.categories[category] = []
+            for domain in domains:
+                domain = domain.strip().lower().rstrip(".")
+                if not domain or domain in seen:
+                    continue
+                seen.add(domain)
+                self.categories[category].append(domain)
+                self.domains.append(domain)
+                # Index labels right-to-left: webland.ap.gov.in -> in / gov / ap / webland
+                node = self.trie
+                for label in reversed(domain.split(".")):
+                    node = node.setdefault(label, {})
+                node[_TERMINAL] = (domain, category)
+
+        canonical = json.dumps(self.categories, sort_keys=True).encode("utf-8")
+        self.etag = hashlib.sha1(canonical).hexdigest()
+
+    def match(self, hostname):
+        """Most specific registered domain that hostname equals or is a subdomain of"""
+        node = self.trie
+        found = None
+        for label in reversed(hostname.split(".")):
+            node = node.get(label)
+            if node is None:
+                break
+            found = node.get(_TERMINAL, found)
+        return found
+
+
+class DomainRegistry:
+    """AP government domains grouped by category, hot-reloaded from a JSON file"""
+
+    def __init__(self, path=AP_DOMAINS_FILE, reload_interval=AP_DOMAINS_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._snapshot = _Snapshot({})
+        self.reload()
+
+    def reload(self):
+        """Re-read the domains file; keeps the previous snapshot if it cannot be parsed"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.path.getmtime(self.path)
+                if mtime == self._mtime:
+                    return False
+                with open(self.path, encoding="utf-8") as f:
+                    data = json.load(f)
+                self._snapshot = _Snapshot(data.get("categories", {}))
+                self._mtime = mtime
+                logger.info(f"Loaded {len(self._snapshot.domains)} AP domains from {self.path}")
+                return True
+            except (OSError, ValueError, AttributeError) as e:
+                logger.error(f"Could not load AP domains from {self.path}: {str(e)}")
+                return False
+
+    def _current(self):
+        if time.monotonic() - self._checked_at >= self.reload_interval:
+            self.reload()
+        return self._snapshot
+
+    @property
+    def domains(self):
+        return self._current().domains
+
+    @property
+    def categories(self):
+        return self._current().categories
+
+    @property
+    def etag(self):
+        return self._current().etag
+
+    def classify(self, url):
+        """Return (domain, category) for an AP government URL, or None"""
+        hostname = url_hostname(url)
+        if not hostname:
+            return None
+        return self._current().match(hostname)
+
+    def is_ap_gov(self, url):
+        return self.classify(url) is not None
+
+    def to_dict(self):
+        snapshot = self._current()
+        return {
+            "ap_government_domains": snapshot.domains,
+            "total_domains": len(snapshot.domains),
+            "categories": snapshot.categories,
+        }
+
+
+# Shared registry used by the backends and the Streamlit UI
+registry = DomainRegistry()
@@ -0,0 +1,114 @@
+import json
+import os
+import sqlite3
+import threading
+
+# History configuration
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "search_history.db")
+HISTORY_RECENT_LIMIT = int(os.getenv("HISTORY_RECENT_LIMIT", "20"))
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "10"))
+HISTORY_MAX_PER_SESSION = int(os.getenv("HISTORY_MAX_PER_SESSION", "1000"))
+PREVIEW_CHARS = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    query TEXT NOT NULL,
+    search_scope TEXT,
+    timestamp TEXT,
+    total_results INTEGER,
+    preview TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS searches_session ON searches (session_id, id);
+"""
+
+SUMMARY_COLUMNS = "id, query, search_scope, timestamp, total_results, preview"
+
+
+def _escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class HistoryStore:
+    """SQLite search history per session; listings return compact rows, full results load by id"""
+
+    def __init__(self, path=HISTORY_DB_PATH, max_per_session=HISTORY_MAX_PER_SESSION):
+        self.max_per_session = max_per_session
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def _summary(self, row):
+        return {
+            "id": row["id"],
+            "query": row["query"],
+            "search_scope": row["search_scope"],
+            "timestamp": row["timestamp"],
+            "total_results": row["total_results"],
+            "preview": row["preview"],
+        }
+
+    def add(self, session_id, query, search_scope, result, timestamp):
+        """Persist one search and return its compact entry; the oldest beyond the per-session cap are pruned"""
+        response = result.get('response') or ""
+        preview = response if len(response) <= PREVIEW_CHARS else response[:PREVIEW_CHARS].rsplit(" ", 1)[0] + "..."
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO searches (session_id, query, search_scope, timestamp, total_results, preview, result) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (session_id, query, search_scope, timestamp, result.get('total_results'), preview, json.dumps(result)),
+            )
+            self._conn.execute(
+                "DELETE FROM searches WHERE session_id = ? AND id <= ("
+                "SELECT id FROM searches WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (session_id, session_id, self.max_per_session),
+            )
+            row = self._conn.execute(f"SELECT {SUMMARY_COLUMNS} FROM searches WHERE id = ?", (cursor.lastrowid,)).fetchone()
+        return self._summary(row)
+
+    def _filter(self, session_id, search, exclude_id):
+        """WHERE clause and arguments for a session's entries, optionally matching search in the query or response"""
+        clause, args = "session_id = ?", [session_id]
+        if search:
+            # Match the full stored response, not just the preview shown in listings
+            clause += " AND (query LIKE ? ESCAPE '\\' OR json_extract(result, '$.response') LIKE ? ESCAPE '\\')"
+            pattern = f"%{_escape_like(search)}%"
+            args += [pattern, pattern]
+        if exclude_id is not None:
+            clause += " AND id != ?"
+            args.append(exclude_id)
+        return clause, args
+
+    def count(self, session_id, search=None, exclude_id=None):
+        clause, args = self._filter(session_id, search, exclude_id)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM searches WHERE {clause}", args).fetchone()[0]
+
+    def page(self, session_id, page=1, page_size=HISTORY_PAGE_SIZE, search=None, exclude_id=None):
+        """Compact entries for one page, newest first (page numbers start at 1)"""
+        clause, args = self._filter(session_id, search, exclude_id)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {SUMMARY_COLUMNS} FROM searches WHERE {clause} ORDER BY id DESC LIMIT ? OFFSET ?",
+                args + [page_size, (max(page, 1) - 1) * page_size],
+            ).fetchall()
+        return [self._summary(row) for row in rows]
+
+    def recent(self, session_id, limit=HISTORY_RECENT_LIMIT):
+        """Newest entries, oldest first, for seeding the in-memory recent list"""
+        return list(reversed(self.page(session_id, 1, limit)))
+
+    def get_result(self, entry_id):
+        """Full result dict for one entry (loaded only when it is displayed)"""
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM searches WHERE id = ?", (entry_id,)).fetchone()
+        return json.loads(row["result"]) if row else None
+
+    def clear(self, session_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM searches WHERE session_id = ?", (session_id,))
@@ -0,0 +1,117 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Transport configuration
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+
+# Hedging: send a duplicate once a call has run longer than the observed p95
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.5"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "5"))
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WORKERS = int(os.getenv("HEDGE_WORKERS", "16"))
+
+_hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+
+
+def build_session(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE):
+    """requests.Session with a keep-alive connection pool sized for concurrent callers"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def prime_connections(session, urls, timeout=5):
+    """Open keep-alive connections (DNS, TCP and TLS) to each URL ahead of the first real request"""
+    for url in urls:
+        try:
+            session.head(url, timeout=(HTTP_CONNECT_TIMEOUT, timeout))
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Connection warm-up to {url} failed: {str(e)}")
+
+
+class LatencyTracker:
+    """Rolling window of call latencies used to pick the hedge delay"""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.hedged = 0
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(p / 100 * len(samples)))]
+
+    def hedge_delay(self):
+        if len(self._samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, self.percentile(95))
+
+
+def hedged_call(fn, tracker, delay=None):
+    """Call fn; if it has not returned after delay (default: p95), race a duplicate and take the first success"""
+    started = time.monotonic()
+    primary = _hedge_executor.submit(fn)
+    done, _ = wait([primary], timeout=tracker.hedge_delay() if delay is None else delay)
+    if done:
+        result = primary.result()
+        tracker.record(time.monotonic() - started)
+        return result
+
+    tracker.hedged += 1
+    backup = _hedge_executor.submit(fn)
+    error = None
+    for future in as_completed([primary, backup]):
+        try:
+            result = future.result()
+        except Exception as e:
+            error = e
+            continue
+        tracker.record(time.monotonic() - started)
+        return result
+    raise error
+
+
+class HttpTransport:
+    """Pooled keep-alive HTTP client with per-call read timeouts and optional hedging"""
+
+    def __init__(self, pool_maxsize=HTTP_POOL_MAXSIZE, connect_timeout=HTTP_CONNECT_TIMEOUT):
+        self.session = build_session(pool_maxsize=pool_maxsize)
+        self.connect_timeout = connect_timeout
+        self.tracker = LatencyTracker()
+
+    def request(self, method, url, read_timeout, hedge=False, **kwargs):
+        def send():
+            return self.session.request(method, url, timeout=(self.connect_timeout, read_timeout), **kwargs)
+
+        if hedge and not kwargs.get("stream"):
+            return hedged_call(send, self.tracker)
+        started = time.monotonic()
+        response = send()
+        self.tracker.record(time.monotonic() - started)
+        return response
+
+    def get(self, url, read_timeout, **kwargs):
+        return self.request("GET", url, read_timeout, **kwargs)
+
+    def post(self, url, read_timeout, **kwargs):
+        return self.request("POST", url, read_timeout, **kwargs)
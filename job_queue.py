@@ -0,0 +1,271 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from structured_log import start_trace
+
+logger = logging.getLogger(__name__)
+
+# Job configuration
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "search_jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_DEADLINE_MS = int(os.getenv("JOB_DEADLINE_MS", "60000"))  # jobs are not bound to the interactive deadline
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(24 * 3600)))  # seconds finished jobs are kept
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "300"))  # running jobs without a heartbeat for this long are requeued
+JOB_HEARTBEAT_INTERVAL = 10.0
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))  # idle workers check the store this often
+
+# Priority classes, scheduled lowest value first
+PRIORITIES = {"interactive": 0, "normal": 1, "bulk": 2}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    request TEXT NOT NULL,
+    result TEXT,
+    status_code INTEGER,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, priority, created_at);
+"""
+
+
+def job_priority(data):
+    """Priority class for a job: explicit 'priority', else quick basic searches first and large advanced ones last"""
+    requested = (data or {}).get('priority')
+    if requested in PRIORITIES:
+        return requested
+    advanced = data.get('search_depth', 'advanced') == 'advanced'
+    try:
+        max_results = int(data.get('max_results') or 0)
+    except (TypeError, ValueError):
+        max_results = 0
+    if not advanced and max_results <= 5:
+        return "interactive"
+    if advanced and max_results > 5:
+        return "bulk"
+    return "normal"
+
+
+class JobStore:
+    """SQLite job records, shared by every worker process
+
+    The connection is opened lazily in each process: a connection inherited across fork (the app
+    is imported before gunicorn forks its workers) must not be used.
+    """
+
+    def __init__(self, path=JOBS_DB_PATH):
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        # Called with self._lock held
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.row_factory = sqlite3.Row
+            with self._conn:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._conn
+
+    def create(self, request, priority):
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT INTO jobs (id, status, priority, request, created_at) VALUES (?, 'queued', ?, ?, ?)",
+                    (job_id, PRIORITIES[priority], json.dumps(request), time.time()),
+                )
+        return job_id
+
+    def claim_next(self):
+        """Mark the most urgent queued job running and return it; None if nothing is queued
+
+        Any process may claim a job: a worker with free capacity picks up another process's backlog.
+        """
+        with self._lock:
+            conn = self._connection()
+            while True:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY priority, created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    return None
+                now = time.time()
+                with conn:
+                    cursor = conn.execute(
+                        "UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ? "
+                        "WHERE id = ? AND status = 'queued'",
+                        (now, now, row['id']),
+                    )
+                if cursor.rowcount == 1:
+                    return dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone())
+                # Claimed by another process in the meantime: try the next one
+
+    def heartbeat(self, job_ids):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running'",
+                                 [(time.time(), job_id) for job_id in job_ids])
+
+    def finish(self, job_id, payload, status_code, error=None):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, result = ?, status_code = ?, error = ?, finished_at = ? WHERE id = ?",
+                    ("failed" if error else "done", json.dumps(payload), status_code, error, time.time(), job_id),
+                )
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def recover(self):
+        """Requeue jobs whose worker stopped heartbeating and drop expired finished jobs; returns the number requeued"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = 'queued' WHERE status = 'running' AND heartbeat_at < ?",
+                    (now - JOB_STALE_AFTER,),
+                )
+                conn.execute("DELETE FROM jobs WHERE finished_at < ?", (now - JOB_RETENTION,))
+        return cursor.rowcount
+
+
+class JobQueue:
+    """Worker pool running queued search jobs from the shared store in priority order
+
+    runner(request, progress) executes one request and returns (payload, status_code); it should
+    collect stage timings into progress (see metrics.begin_request) so pollers can follow along.
+    Idle workers poll the store, so jobs submitted to a busy process are picked up by any other.
+    """
+
+    def __init__(self, runner, store=None, workers=JOB_WORKERS):
+        self.runner = runner
+        self.store = store if store is not None else JobStore()
+        self.workers = workers
+        self._pending = threading.Condition()
+        self._progress = {}  # job id -> stage timings of jobs running in this process
+        self._started = False
+        self._lock = threading.Lock()
+
+    def submit(self, data):
+        """Persist a /search request body as a queued job; returns (job_id, priority class)"""
+        request = dict(data)
+        request.setdefault('deadline_ms', JOB_DEADLINE_MS)
+        priority = job_priority(request)
+        job_id = self.store.create(request, priority)
+        self.start()
+        with self._pending:
+            self._pending.notify()  # a local idle worker can start now instead of at its next poll
+        return job_id, priority
+
+    def start(self):
+        """Start the worker threads, after requeueing jobs interrupted by a previous process"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self.store.recover()
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True).start()
+        threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True).start()
+
+    def _work(self):
+        while True:
+            try:
+                job = self.store.claim_next()
+                if job is None:
+                    with self._pending:
+                        self._pending.wait(JOB_POLL_INTERVAL)
+                    continue
+                self._run(job)
+            except Exception as e:
+                # e.g. "database is locked": keep the worker alive and retry after a pause
+                logger.error(f"Job worker error: {str(e)}")
+                time.sleep(JOB_POLL_INTERVAL)
+
+    def _run(self, job):
+        job_id = job['id']
+        progress = self._progress[job_id] = []
+        start_trace(job_id)  # the job's log records share its id
+        try:
+            payload, status_code = self.runner(json.loads(job['request']), progress)
+            self.store.finish(job_id, payload, status_code)
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            self.store.finish(job_id, {"error": f"An error occurred: {str(e)}"}, 500, error=str(e))
+        finally:
+            self._progress.pop(job_id, None)
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                running = list(self._progress)
+                if running:
+                    self.store.heartbeat(running)
+                # Jobs of a worker process that died while this one keeps running
+                self.store.recover()
+            except sqlite3.Error as e:
+                logger.warning(f"Job heartbeat failed: {str(e)}")
+
+    def status(self, job_id):
+        """Job status for GET /jobs/<id>; None if unknown"""
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        priority = next(name for name, value in PRIORITIES.items() if value == job['priority'])
+        body = {"job_id": job_id, "status": job['status'], "priority": priority, "created_at": job['created_at']}
+        if job['status'] == 'running':
+            progress = self._progress.get(job_id)
+            # Stage names completed so far (only known to the process running the job)
+            body["progress"] = [name for name, _ in progress] if progress is not None else None
+        elif job['status'] in ('done', 'failed'):
+            body.update(finished_at=job['finished_at'], status_code=job['status_code'], result=json.loads(job['result']))
+        return body
+
+
+def submitted_response(job_id, priority):
+    """202 body returned by POST /search?async=1"""
+    return {"job_id": job_id, "status": "queued", "priority": priority, "status_url": f"/jobs/{job_id}",
+            "events_url": f"/jobs/{job_id}/events"}
+
+
+def job_events(jobs, job_id, poll_interval=0.5):
+    """Yield (event, data) whenever a job's status or progress changes, ending with 'done'
+
+    An event of None means: wait data seconds before iterating again (so sync and async servers can share this).
+    """
+    last = None
+    while True:
+        body = jobs.status(job_id)
+        if body is None:
+            yield "error", {"error": "Unknown job"}
+            return
+        if body['status'] in ('done', 'failed'):
+            yield "done", body
+            return
+        if body != last:
+            yield "progress", body
+            last = body
+        yield None, poll_interval
@@ -0,0 +1,223 @@
+import argparse
+import asyncio
+import html
+import json
+import logging
+import os
+import re
+import threading
+
+import numpy as np
+
+from context_builder import split_passages
+from semantic_cache import build_embedder, SEMANTIC_CACHE_EMBEDDER
+
+logger = logging.getLogger(__name__)
+
+# Local index configuration
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "local_index")
+LOCAL_INDEX_MIN_SCORE = float(os.getenv("LOCAL_INDEX_MIN_SCORE", "0.80"))
+LOCAL_INDEX_MIN_HITS = int(os.getenv("LOCAL_INDEX_MIN_HITS", "2"))
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "local_first")  # 'web', 'local_first' or 'local_only'
+
+VECTORS_FILE = "vectors.npy"
+METADATA_FILE = "metadata.jsonl"
+MANIFEST_FILE = "manifest.json"
+DOCUMENT_EXTENSIONS = ('.txt', '.md', '.html', '.htm')
+EMBED_BATCH_SIZE = 64
+
+
+def _read_document(path):
+    """Return (url, title, text) for a saved page; 'URL:' and 'Title:' header lines are optional"""
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        text = f.read()
+
+    if path.lower().endswith(('.html', '.htm')):
+        title_match = re.search(r"<title[^>]*>(.*?)</title>", text, re.I | re.S)
+        text = re.sub(r"<(script|style)[^>]*>.*?</\1>", " ", text, flags=re.I | re.S)
+        text = re.sub(r"<(br|p|div|li|h[1-6]|tr)[^>]*>", "\n", text, flags=re.I)
+        text = html.unescape(re.sub(r"<[^>]+>", " ", text))
+        title = html.unescape(title_match.group(1).strip()) if title_match else None
+    else:
+        title = None
+
+    url = None
+    lines = text.lstrip().splitlines()
+    while lines and re.match(r"^(URL|Title):", lines[0], re.I):
+        key, value = lines.pop(0).split(":", 1)
+        if key.lower() == "url":
+            url = value.strip()
+        else:
+            title = value.strip()
+    return url or f"file://{os.path.abspath(path)}", title or os.path.basename(path), "\n".join(lines)
+
+
+def ingest_directory(docs_dir, index_dir=LOCAL_INDEX_DIR, embedder_name=None):
+    """Chunk and embed every document under docs_dir into an on-disk index at index_dir"""
+    embedder_name = embedder_name or SEMANTIC_CACHE_EMBEDDER
+    embedder = build_embedder(embedder_name)
+
+    chunks = []
+    for root, dirs, files in os.walk(docs_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.lower().endswith(DOCUMENT_EXTENSIONS):
+                continue
+            url, title, text = _read_document(os.path.join(root, name))
+            for passage in split_passages(text):
+                chunks.append({"url": url, "title": title, "content": passage})
+
+    if not chunks:
+        raise ValueError(f"No documents found under {docs_dir}")
+
+    vectors = []
+    for start in range(0, len(chunks), EMBED_BATCH_SIZE):
+        batch = chunks[start:start + EMBED_BATCH_SIZE]
+        vectors.extend(embedder.embed_documents([f"{c['title']}\n{c['content']}" for c in batch]))
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms == 0, 1, norms)
+
+    os.makedirs(index_dir, exist_ok=True)
+    np.save(os.path.join(index_dir, VECTORS_FILE), matrix)
+    with open(os.path.join(index_dir, METADATA_FILE), "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write(json.dumps(chunk) + "\n")
+    with open(os.path.join(index_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump({"embedder": embedder_name, "dimensions": matrix.shape[1], "chunks": len(chunks)}, f)
+
+    logger.info(f"Indexed {len(chunks)} chunks from {docs_dir} into {index_dir}")
+    return len(chunks)
+
+
+class LocalIndex:
+    """Read-only view of an ingested index; vectors are memory-mapped rather than loaded"""
+
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, MANIFEST_FILE), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.vectors = np.load(os.path.join(index_dir, VECTORS_FILE), mmap_mode="r")
+        with open(os.path.join(index_dir, METADATA_FILE), encoding="utf-8") as f:
+            self.metadata = [json.loads(line) for line in f]
+        self.embedder = build_embedder(self.manifest["embedder"])
+
+    def _normalize(self, embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def embed(self, text):
+        return self._normalize(self.embedder.embed_query(text))
+
+    async def aembed(self, text):
+        if hasattr(self.embedder, "aembed_query"):
+            return self._normalize(await self.embedder.aembed_query(text))
+        return await asyncio.to_thread(self.embed, text)
+
+    def compatible(self, vector):
+        """Whether a query vector from the semantic cache's embedder can be searched here as is"""
+        return (vector is not None and self.manifest["embedder"] == SEMANTIC_CACHE_EMBEDDER
+                and vector.shape[0] == self.manifest["dimensions"])
+
+    def search(self, vector, top_k):
+        """Top-k chunks by cosine similarity, merged per source URL into Tavily-shaped results"""
+        if vector is None or len(self.metadata) == 0:
+            return []
+        scores = np.asarray(self.vectors @ vector)
+        k = min(top_k * 3, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = {}
+        for i in top:
+            chunk = self.metadata[i]
+            result = results.get(chunk["url"])
+            if result is None:
+                if len(results) >= top_k:
+                    continue
+                results[chunk["url"]] = {
+                    "url": chunk["url"],
+                    "title": chunk["title"],
+                    "content": chunk["content"],
+                    "score": float(scores[i]),
+                    "retrieval": "local",
+                }
+            else:
+                result["content"] += "\n\n" + chunk["content"]
+        return list(results.values())
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_local_index():
+    """Load the local index on first use; None if it has not been built"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None and os.path.exists(os.path.join(LOCAL_INDEX_DIR, MANIFEST_FILE)):
+                try:
+                    _index = LocalIndex(LOCAL_INDEX_DIR)
+                except Exception as e:
+                    logger.error(f"Could not load local index from {LOCAL_INDEX_DIR}: {str(e)}")
+    return _index
+
+
+def _local_response(params, results):
+    """Tavily-shaped response if local recall is sufficient for the request, else None"""
+    confident = [r for r in results if r["score"] >= LOCAL_INDEX_MIN_SCORE]
+    if params.get('retrieval_mode') == 'local_only':
+        return {"answer": None, "results": confident, "retrieval": "local"}
+    if len(confident) >= min(LOCAL_INDEX_MIN_HITS, params['max_results']):
+        return {"answer": None, "results": confident, "retrieval": "local"}
+    return None
+
+
+def _uses_local_index(params):
+    return params.get('retrieval_mode') in ('local_first', 'local_only') and params['search_scope'] != 'general'
+
+
+def _unavailable_response(params):
+    """Empty local response for local_only requests the index cannot serve (never falls back to the web)"""
+    if params['search_scope'] == 'general':
+        logger.warning("retrieval_mode local_only does not cover search_scope general; returning no results")
+    else:
+        logger.warning(f"retrieval_mode local_only but no local index in {LOCAL_INDEX_DIR}; returning no results")
+    return {"answer": None, "results": [], "retrieval": "local"}
+
+
+def retrieve_local(params):
+    """Answer a request from the local index when it covers the query well enough
+
+    Reuses the query vector the semantic cache already computed (params['query_vector']) when
+    it comes from the same embedder.
+    """
+    index = get_local_index() if _uses_local_index(params) else None
+    if index is None:
+        return _unavailable_response(params) if params.get('retrieval_mode') == 'local_only' else None
+    vector = params.get('query_vector')
+    if not index.compatible(vector):
+        vector = index.embed(params['query'])
+    return _local_response(params, index.search(vector, params['max_results']))
+
+
+async def aretrieve_local(params):
+    """Async variant of retrieve_local"""
+    index = get_local_index() if _uses_local_index(params) else None
+    if index is None:
+        return _unavailable_response(params) if params.get('retrieval_mode') == 'local_only' else None
+    vector = params.get('query_vector')
+    if not index.compatible(vector):
+        vector = await index.aembed(params['query'])
+    return _local_response(params, index.search(vector, params['max_results']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the local AP government document index")
+    parser.add_argument("docs_dir", help="Directory of saved pages / extracted PDF text")
+    parser.add_argument("--index-dir", default=LOCAL_INDEX_DIR)
+    parser.add_argument("--embedder", default=None, help="'openai' or 'hashing'")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(f"Indexed {ingest_directory(args.docs_dir, args.index_dir, args.embedder)} chunks")
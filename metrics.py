@@ -0,0 +1,208 @@
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets (seconds) shared by stage and upstream histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40)
+TOKEN_BUCKETS = (250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 10, 15, 20)
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with optional labels"""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def quantile(self, q, *label_values, min_count=1):
+        """Upper bound of the bucket holding the q-quantile; None with fewer than min_count samples"""
+        with self._lock:
+            series = list(self._series.get(label_values) or ())
+        if not series or series[-1] < min_count:
+            return None
+        target, cumulative = q * series[-1], 0
+        for bound, count in zip(self.buckets, series):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return self.buckets[-1]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                labels = _label_text(self.labels + ("le",), label_values + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _label_text(self.labels + ("le",), label_values + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {values[-1]}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, label_values)} {values[-2]:.6f}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, label_values)} {values[-1]}")
+        return lines
+
+
+class Counter:
+    """Prometheus-style counter with optional labels"""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            lines.append(f"{self.name}{_label_text(self.labels, label_values)} {value}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("quantell_stage_seconds", "Time spent in each search pipeline stage", labels=("stage",))
+UPSTREAM_SECONDS = Histogram("quantell_upstream_seconds", "Latency of calls to upstream services", labels=("upstream", "outcome"))
+TAVILY_SECONDS = Histogram("quantell_tavily_seconds", "Tavily search latency by search depth", labels=("depth",))
+REQUEST_SECONDS = Histogram("quantell_request_seconds", "End-to-end request latency", labels=("endpoint", "status"))
+PROMPT_TOKENS = Histogram("quantell_prompt_tokens", "Estimated tokens in each LLM prompt", buckets=TOKEN_BUCKETS)
+RESULT_COUNT = Histogram("quantell_results", "Results kept after filtering, per search scope", buckets=COUNT_BUCKETS, labels=("scope",))
+CACHE_LOOKUPS = Counter("quantell_cache_lookups_total", "Cache lookups by cache tier and outcome", labels=("cache", "result"))
+
+_metrics = [STAGE_SECONDS, UPSTREAM_SECONDS, TAVILY_SECONDS, REQUEST_SECONDS, PROMPT_TOKENS, RESULT_COUNT, CACHE_LOOKUPS]
+_collectors = []
+
+# Stage timings of the request being handled, for the Server-Timing header
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def register_collector(fn):
+    """Register fn() -> iterable of exposition lines, evaluated only when /metrics is scraped"""
+    _collectors.append(fn)
+    return fn
+
+
+def counter_lines(name, help_text, labels, samples):
+    """Exposition lines for counters read from existing stats at scrape time"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+    for label_values, value in samples:
+        lines.append(f"{name}{_label_text(labels, label_values)} {value}")
+    return lines
+
+
+def render_metrics():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
+
+
+def begin_request(timings=None):
+    """Start collecting stage timings for the current request (into timings, if given)"""
+    timings = [] if timings is None else timings
+    _request_timings.set(timings)
+    return timings
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage into the stage histogram and the current request's Server-Timing"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def timed(name):
+    """Decorator form of stage()"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing(timings, total=None):
+    """Server-Timing header value, e.g. 'tavily;dur=812.4, llm;dur=2310.0, total;dur=3190.2'"""
+    entries = [f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in timings]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def instrument_flask(app):
+    """Record request latency and attach a Server-Timing header to every Flask response"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+        g.request_timings = begin_request()
+
+    @app.after_request
+    def _add_server_timing(response):
+        started = g.get('request_started')
+        if started is not None:
+            total = time.perf_counter() - started
+            REQUEST_SECONDS.observe(total, request.endpoint or "unknown", str(response.status_code))
+            response.headers['Server-Timing'] = server_timing(g.request_timings, total)
+        return response
+
+
+def instrument_quart(app):
+    """Quart variant of instrument_flask (hooks are coroutines so the context variable is shared)"""
+    from quart import g, request
+
+    @app.before_request
+    async def _start_timer():
+        g.request_started = time.perf_counter()
+        g.request_timings = begin_request()
+
+    @app.after_request
+    async def _add_server_timing(response):
+        started = g.get('request_started')
+        if started is not None:
+            total = time.perf_counter() - started
+            REQUEST_SECONDS.observe(total, request.endpoint or "unknown", str(response.status_code))
+            response.headers['Server-Timing'] = server_timing(g.request_timings, total)
+        return response
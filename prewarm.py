@@ -0,0 +1,242 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from search_cache import tavily_cache, tavily_cache_key, normalize_query, TAVILY_CACHE_TTL
+from upstream_guard import TokenBucket, tavily_guard, llm_guard
+
+logger = logging.getLogger(__name__)
+
+# Pre-warming configuration
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "0") == "1"
+PREWARM_SEED_FILE = os.getenv("PREWARM_SEED_FILE", "prewarm_queries.json")
+PREWARM_INTERVAL = float(os.getenv("PREWARM_INTERVAL", "60"))  # seconds between scheduling passes
+PREWARM_REFRESH_AHEAD = float(os.getenv("PREWARM_REFRESH_AHEAD", "120"))  # refresh this long before TTL expiry
+PREWARM_TOP_N = int(os.getenv("PREWARM_TOP_N", "50"))
+PREWARM_HALF_LIFE = float(os.getenv("PREWARM_HALF_LIFE", str(6 * 3600)))  # popularity decay
+PREWARM_MIN_SCORE = float(os.getenv("PREWARM_MIN_SCORE", "2"))  # decayed hits before traffic queries qualify
+PREWARM_TRACK_MAX = int(os.getenv("PREWARM_TRACK_MAX", "2000"))
+# Upstream calls the pre-warmer may spend per hour, on top of the shared guards. The budgets are kept in
+# memory per process, so a deployment with SERVE_WORKERS workers may spend up to SERVE_WORKERS times these
+PREWARM_TAVILY_PER_HOUR = float(os.getenv("PREWARM_TAVILY_PER_HOUR", "120"))
+PREWARM_LLM_PER_HOUR = float(os.getenv("PREWARM_LLM_PER_HOUR", "60"))
+# Fraction of the shared rate-limit burst and concurrency limit always left to interactive requests
+PREWARM_RESERVE = float(os.getenv("PREWARM_RESERVE", "0.5"))
+
+# Request fields needed to replay a query
+REPLAY_FIELDS = ('query', 'search_scope', 'search_depth', 'max_results', 'retrieval_mode', 'summarizer')
+
+
+def replay_request(params):
+    """Request body that reproduces a parsed request (without its deadline)"""
+    return {field: params[field] for field in REPLAY_FIELDS}
+
+
+def replay_key(request):
+    return (normalize_query(request['query']),) + tuple(request.get(field) for field in REPLAY_FIELDS[1:])
+
+
+def load_seed_queries(path=PREWARM_SEED_FILE):
+    """Curated request bodies to keep warm; entries may be plain query strings"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read pre-warm seed file {path}: {str(e)}")
+        return []
+    return [{"query": entry} if isinstance(entry, str) else dict(entry) for entry in entries
+            if isinstance(entry, str) or (isinstance(entry, dict) and entry.get('query'))]
+
+
+class QueryPopularity:
+    """Exponentially decayed hit counts per replayable request"""
+
+    def __init__(self, half_life=PREWARM_HALF_LIFE, max_entries=PREWARM_TRACK_MAX):
+        self.decay = math.log(2) / half_life
+        self.max_entries = max_entries
+        self._entries = {}  # key -> [score, updated_at, request]
+        self._lock = threading.Lock()
+
+    def _decayed(self, entry, now):
+        return entry[0] * math.exp(-self.decay * (now - entry[1]))
+
+    def record(self, request):
+        now = time.monotonic()
+        key = replay_key(request)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if len(self._entries) >= self.max_entries:
+                    # Forget the least popular query to stay bounded
+                    coldest = min(self._entries, key=lambda k: self._decayed(self._entries[k], now))
+                    del self._entries[coldest]
+                self._entries[key] = [1.0, now, request]
+            else:
+                entry[:] = [self._decayed(entry, now) + 1.0, now, request]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def top(self, n, min_score=0.0):
+        """[(score, request)] for the n most popular requests, most popular first"""
+        now = time.monotonic()
+        with self._lock:
+            scored = [(self._decayed(entry, now), entry[2]) for entry in self._entries.values()]
+        scored = [item for item in scored if item[0] >= min_score]
+        scored.sort(key=lambda item: -item[0])
+        return scored[:n]
+
+
+# Traffic seen by this process
+popularity = QueryPopularity()
+
+
+def record_query(params):
+    popularity.record(replay_request(params))
+
+
+class PrewarmScheduler:
+    """Refreshes popular and curated queries ahead of cache expiry, off the request path
+
+    parse(request) returns request parameters and refresh(params) runs the search, bypassing the
+    Tavily cache and storing fresh results; LLM answers are regenerated only when the sources
+    changed. Refreshes draw on the same upstream guards as interactive requests, but only while
+    those have headroom, and within their own hourly budget (per process, like the guards).
+    """
+
+    def __init__(self, parse, refresh, seeds=None):
+        self.parse = parse
+        self.refresh = refresh
+        self.seeds = load_seed_queries() if seeds is None else seeds
+        self.tavily_budget = TokenBucket(PREWARM_TAVILY_PER_HOUR / 3600, max(int(PREWARM_TAVILY_PER_HOUR / 12), 1))
+        self.llm_budget = TokenBucket(PREWARM_LLM_PER_HOUR / 3600, max(int(PREWARM_LLM_PER_HOUR / 12), 1))
+        self._refreshed_at = {}  # replay key -> monotonic time of the last refresh
+        self._started = False
+        self._lock = threading.Lock()
+        self.refreshed = 0
+        self.skipped = 0
+
+    def candidates(self):
+        """Requests worth keeping warm: curated seeds first, then traffic by popularity"""
+        return list(self.seeds) + [request for _, request in popularity.top(PREWARM_TOP_N, PREWARM_MIN_SCORE)]
+
+    def due(self, params):
+        """Whether the cached search for params expires within the refresh window"""
+        now = time.monotonic()
+        last = self._refreshed_at.get(replay_key(replay_request(params)))
+        # Answers served without Tavily (local index, corpus) leave no cache entry to watch
+        if last is not None and now - last < TAVILY_CACHE_TTL - PREWARM_REFRESH_AHEAD:
+            return False
+        key = tavily_cache_key(params['enhanced_query'], params['search_scope'], params['search_depth'])
+        return tavily_cache.ttl_remaining(key) <= PREWARM_REFRESH_AHEAD
+
+    def _admit(self, params):
+        """Take pre-warm budget for one refresh if the shared guards have headroom"""
+        uses_llm = params['summarizer'] != 'extractive'
+        if not tavily_guard.has_headroom(PREWARM_RESERVE):
+            return False
+        if uses_llm and not llm_guard.has_headroom(PREWARM_RESERVE):
+            return False
+        # Check both budgets before taking from either, so a refresh refused by one spends nothing
+        if self.tavily_budget.available() < 1:
+            return False
+        if uses_llm and self.llm_budget.available() < 1:
+            return False
+        self.tavily_budget.acquire(0)
+        if uses_llm:
+            self.llm_budget.acquire(0)
+        return True
+
+    def _plan(self):
+        """Parsed parameters of the due candidates, most important first"""
+        planned, seen = [], set()
+        for request in self.candidates():
+            try:
+                params = self.parse(request)
+            except ValueError as e:
+                logger.warning(f"Skipping invalid pre-warm query {request!r}: {str(e)}")
+                continue
+            if params is None or params['search_scope'] == 'local_corpus':
+                continue
+            key = replay_key(replay_request(params))
+            if key not in seen and self.due(params):
+                params['refresh'] = True
+                planned.append(params)
+            seen.add(key)
+        return planned
+
+    def _mark(self, params):
+        self._refreshed_at[replay_key(replay_request(params))] = time.monotonic()
+
+    def run_once(self):
+        """One scheduling pass; returns the number of queries refreshed"""
+        refreshed = 0
+        for params in self._plan():
+            if not self._admit(params):
+                self.skipped += 1
+                break  # out of budget or headroom: try again next pass
+            try:
+                self.refresh(params)
+                refreshed += 1
+            except Exception as e:
+                logger.warning(f"Pre-warm refresh failed for {params['query']!r}: {str(e)}")
+            self._mark(params)
+        self.refreshed += refreshed
+        return refreshed
+
+    async def arun_once(self):
+        """run_once for a coroutine refresh function"""
+        refreshed = 0
+        for params in self._plan():
+            if not self._admit(params):
+                self.skipped += 1
+                break
+            try:
+                await self.refresh(params)
+                refreshed += 1
+            except Exception as e:
+                logger.warning(f"Pre-warm refresh failed for {params['query']!r}: {str(e)}")
+            self._mark(params)
+        self.refreshed += refreshed
+        return refreshed
+
+    def start(self):
+        """Run passes every PREWARM_INTERVAL on a daemon thread (no-op unless PREWARM_ENABLED)"""
+        with self._lock:
+            if not PREWARM_ENABLED or self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._loop, name="prewarm", daemon=True).start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Pre-warm pass failed: {str(e)}")
+            time.sleep(PREWARM_INTERVAL)
+
+    def start_async(self):
+        """Async variant of start: runs passes as a task on the current event loop"""
+        if not PREWARM_ENABLED or self._started:
+            return None
+        self._started = True
+        return asyncio.get_running_loop().create_task(self._aloop())
+
+    async def _aloop(self):
+        while True:
+            try:
+                await self.arun_once()
+            except Exception as e:
+                logger.error(f"Pre-warm pass failed: {str(e)}")
+            await asyncio.sleep(PREWARM_INTERVAL)
+
+    def stats(self):
+        return {"tracked": len(popularity), "seeds": len(self.seeds),
+                "refreshed": self.refreshed, "skipped": self.skipped}
@@ -0,0 +1,155 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import CACHE_LOOKUPS
+
+# Cache configuration (seconds / bytes)
+TAVILY_CACHE_TTL = int(os.getenv("TAVILY_CACHE_TTL", "900"))
+TAVILY_CACHE_MAX_BYTES = int(os.getenv("TAVILY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+
+def normalize_query(query):
+    """Lowercase and collapse whitespace so trivially different queries share a key"""
+    return " ".join(str(query).lower().split())
+
+
+def approximate_size(value):
+    """Rough in-memory size of a JSON-like value, used for cache accounting"""
+    if isinstance(value, (str, bytes)):
+        return len(value) + 48
+    if isinstance(value, dict):
+        return 64 + sum(approximate_size(k) + approximate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 56 + sum(approximate_size(item) for item in value)
+    return 24
+
+
+class TTLCache:
+    """Thread-safe cache with per-entry TTL and LRU eviction bounded by memory size"""
+
+    def __init__(self, ttl, max_bytes):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = approximate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            # Evict least recently used entries until we are back under budget
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def ttl_remaining(self, key):
+        """Seconds until an entry expires (0 if absent or expired), without touching LRU order or counters"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return max(entry[0] - time.monotonic(), 0.0) if entry is not None else 0.0
+
+    def peek(self, key):
+        """Return a live entry without touching LRU order or hit counters"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            return entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# Tier 1: raw Tavily responses
+tavily_cache = TTLCache(TAVILY_CACHE_TTL, TAVILY_CACHE_MAX_BYTES)
+
+# Tier 2: generated LLM answers
+llm_cache = TTLCache(LLM_CACHE_TTL, LLM_CACHE_MAX_BYTES)
+
+
+def tavily_cache_key(enhanced_query, search_scope, search_depth):
+    return (normalize_query(enhanced_query), search_scope, search_depth)
+
+
+def get_cached_search(enhanced_query, search_scope, search_depth, max_results):
+    """Return a cached Tavily response able to satisfy max_results, or None"""
+    entry = tavily_cache.get(tavily_cache_key(enhanced_query, search_scope, search_depth))
+    if entry is None or entry["max_results"] < max_results:
+        CACHE_LOOKUPS.inc("tavily", "miss")
+        return None
+    CACHE_LOOKUPS.inc("tavily", "hit")
+
+    # A larger cached request can serve a smaller one by truncating its results
+    response = dict(entry["response"])
+    response["results"] = list(response.get("results") or [])[:max_results]
+    return response
+
+
+def store_search(enhanced_query, search_scope, search_depth, max_results, response):
+    """Cache a Tavily response unless a larger one for the same key is already cached"""
+    key = tavily_cache_key(enhanced_query, search_scope, search_depth)
+    existing = tavily_cache.peek(key)
+    if existing is not None and existing["max_results"] > max_results:
+        return
+    tavily_cache.set(key, {"max_results": max_results, "response": response})
+
+
+def results_digest(results):
+    """Stable hash of the URLs of the results an answer was generated from"""
+    urls = "\n".join(result.get('url', '') for result in results)
+    return hashlib.sha1(urls.encode("utf-8")).hexdigest()
+
+
+def llm_cache_key(query, results):
+    return (normalize_query(query), results_digest(results))
+
+
+def get_cached_answer(query, results):
+    answer = llm_cache.get(llm_cache_key(query, results))
+    CACHE_LOOKUPS.inc("llm", "miss" if answer is None else "hit")
+    return answer
+
+
+def store_answer(query, results, answer):
+    llm_cache.set(llm_cache_key(query, results), answer)
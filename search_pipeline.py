@@ -0,0 +1,429 @@
+import json
+import logging
+import os
+import time
+
+from context_builder import build_context, estimate_tokens
+from corpus_index import corpus_index
+from dedup import dedupe_results, extract_mirrors, fingerprint_results
+from deadline import Budget, parse_deadline, plan_search, plan_summarizer, report_budget
+from domain_registry import registry
+from local_index import retrieve_local, aretrieve_local, RETRIEVAL_MODE
+from metrics import server_timing, stage, timed, PROMPT_TOKENS, RESULT_COUNT, TAVILY_SECONDS
+from search_cache import get_cached_answer, get_cached_search, store_search, normalize_query
+from summarizer import choose_summarizer, extractive_summary, SUMMARIZER_DEFAULT, SUMMARIZER_MODES
+from upstream_guard import UpstreamUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Read timeout (seconds) for a single Tavily search
+TAVILY_TIMEOUT = float(os.getenv("TAVILY_TIMEOUT", "20"))
+
+# Largest max_results a request may ask for (Tavily's own limit)
+MAX_RESULTS_LIMIT = int(os.getenv("SEARCH_MAX_RESULTS_LIMIT", "20"))
+
+NO_RESULTS_MESSAGE = "Sorry, could not find any relevant data from Andhra Pradesh government sources"
+NO_RELEVANT_DATA_MESSAGE = "Sorry, could not find any relevant data from the specified sources"
+DEGRADED_PREFIX = "The AI summary service is busy right now, so here are excerpts from the sources."
+
+# System instruction for LLM
+SYSTEM_INSTRUCTION = """
+You are a helpful AI assistant that answers questions based on search results from Andhra Pradesh government websites and other sources.
+
+Your task is to:
+1. Analyze the provided search results and extract relevant information
+2. Provide a clear, comprehensive answer that directly addresses the user's question
+3. Focus on the most important and relevant details from the search results
+4. Maintain accuracy and avoid speculation beyond what's provided in the search results
+5. If information is insufficient, acknowledge the limitations
+6. When information comes from AP government sources, mention that it's from official sources
+7. Structure your response in a clear, easy-to-understand format
+8. Provide step-by-step instructions when applicable
+
+User Query: {query}
+
+Search Results:
+{search_results}
+
+Please provide a comprehensive answer based on the above search results.
+"""
+
+
+def parse_max_results(value):
+    """max_results as an int in 1..MAX_RESULTS_LIMIT (numeric strings are accepted); ValueError otherwise"""
+    try:
+        max_results = int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"max_results must be an integer between 1 and {MAX_RESULTS_LIMIT}") from None
+    if not 1 <= max_results <= MAX_RESULTS_LIMIT:
+        raise ValueError(f"max_results must be an integer between 1 and {MAX_RESULTS_LIMIT}")
+    return max_results
+
+
+def parse_search_request(data, default_max_results, default_summarizer=SUMMARIZER_DEFAULT):
+    """Validate a /search request body and derive the Tavily parameters
+
+    Returns None if the query is missing and raises ValueError for an invalid field.
+    """
+    if not isinstance(data, dict) or 'query' not in data:
+        return None
+
+    # The budget starts when the request is parsed, i.e. on arrival
+    budget = Budget(parse_deadline(data))
+
+    query = data['query']
+
+    # Optional parameters with defaults
+    search_depth = data.get('search_depth', 'advanced')  # 'basic' or 'advanced'
+    max_results = data.get('max_results')
+    max_results = parse_max_results(default_max_results if max_results is None else max_results)
+
+    # Get search scope from request, default to AP Gov only
+    search_scope = data.get('search_scope', 'ap_gov_only')
+
+    # 'web', 'local_first' (local index, Tavily fallback) or 'local_only'
+    retrieval_mode = data.get('retrieval_mode', RETRIEVAL_MODE)
+
+    # 'extractive' (no LLM), 'llm' or 'auto' (extractive for simple lookups)
+    summarizer = data.get('summarizer', default_summarizer)
+    if summarizer not in SUMMARIZER_MODES:
+        summarizer = default_summarizer
+
+    # Set domains based on search scope
+    if search_scope == 'ap_gov_only':
+        include_domains = registry.domains
+        exclude_domains = None
+    elif search_scope == 'include_ap_gov':
+        # Include AP gov domains but also search other sources
+        include_domains = None
+        exclude_domains = None
+    else:  # 'general' or 'local_corpus'
+        include_domains = None
+        exclude_domains = None
+
+    # Add AP/Andhra Pradesh context to query for better results
+    if search_scope in ['ap_gov_only', 'include_ap_gov']:
+        enhanced_query = f"{query} Andhra Pradesh AP government"
+    else:
+        enhanced_query = query
+
+    params = {
+        "query": query,
+        "enhanced_query": enhanced_query,
+        "search_depth": search_depth,
+        "max_results": max_results,
+        "search_scope": search_scope,
+        "retrieval_mode": retrieval_mode,
+        "summarizer": summarizer,
+        "include_domains": include_domains,
+        "exclude_domains": exclude_domains,
+        "include_raw_content": True,
+        "budget": budget,
+    }
+    # Degrade depth, result count and raw content up front when the deadline is tight
+    plan_search(params, budget)
+    return params
+
+
+def search_request_key(params):
+    """Key identifying requests that would produce the same answer"""
+    return (
+        normalize_query(params['query']),
+        params['search_scope'],
+        params['search_depth'],
+        params['max_results'],
+        params['retrieval_mode'],
+        params['summarizer'],
+        params['include_raw_content'],
+    )
+
+
+def semantic_cache_attributes(params):
+    """Request fields besides the scope that a semantically cached answer must match"""
+    return {
+        "search_depth": params['search_depth'],
+        "max_results": params['max_results'],
+        "retrieval_mode": params['retrieval_mode'],
+        "summarizer": params['summarizer'],
+    }
+
+
+def tavily_search_kwargs(params):
+    """Keyword arguments for TavilyClient.search for the given request parameters"""
+    return {
+        "query": params['enhanced_query'],
+        "search_depth": params['search_depth'],
+        "include_answer": True,
+        "include_raw_content": params['include_raw_content'],
+        "max_results": params['max_results'],
+        "include_domains": params['include_domains'],
+        "exclude_domains": params['exclude_domains'],
+        "timeout": params['budget'].timeout(TAVILY_TIMEOUT),
+    }
+
+
+def corpus_search_response(params):
+    """Tavily-shaped response answered from the local BM25 corpus"""
+    results = corpus_index.search(params['query'], params['max_results']) if corpus_index is not None else []
+    return {"answer": None, "results": results, "retrieval": "local_corpus"}
+
+
+def _corpus_fallback(params, error):
+    """Serve corpus results when Tavily fails; re-raise the Tavily error if the corpus has nothing"""
+    fallback = corpus_search_response(params)
+    if not fallback['results']:
+        raise error
+    return fallback
+
+
+def fetch_search_results(client, params):
+    """Perform Tavily search (served from cache when a recent identical search exists)"""
+    if params['search_scope'] == 'local_corpus':
+        with stage("corpus"):
+            return corpus_search_response(params)
+
+    # Answer from the local document index first when it covers the query
+    with stage("local_index"):
+        local_response = retrieve_local(params)
+    if local_response is not None:
+        return local_response
+
+    cache_args = (params['enhanced_query'], params['search_scope'], params['search_depth'])
+    # Pre-warm refreshes bypass the cache to replace entries that are about to expire
+    response = None if params.get('refresh') else get_cached_search(*cache_args, params['max_results'])
+    if response is None:
+        try:
+            started = time.perf_counter()
+            with stage("tavily"):
+                response = client.search(budget=params['budget'], **tavily_search_kwargs(params))
+            TAVILY_SECONDS.observe(time.perf_counter() - started, params['search_depth'])
+        except Exception as e:
+            return _corpus_fallback(params, e)
+        # Fingerprinted once here, so near-duplicate detection on cache hits and in the corpus reuses it
+        fingerprint_results(response.get('results'))
+        # Responses without raw content would shortchange later requests that can afford it
+        if params['include_raw_content']:
+            store_search(*cache_args, params['max_results'], response)
+        if corpus_index is not None:
+            corpus_index.add_results(response.get('results'))
+    return response
+
+
+async def afetch_search_results(client, params):
+    """Async variant of fetch_search_results for AsyncTavilyClient"""
+    if params['search_scope'] == 'local_corpus':
+        with stage("corpus"):
+            return corpus_search_response(params)
+
+    with stage("local_index"):
+        local_response = await aretrieve_local(params)
+    if local_response is not None:
+        return local_response
+
+    cache_args = (params['enhanced_query'], params['search_scope'], params['search_depth'])
+    # Pre-warm refreshes bypass the cache to replace entries that are about to expire
+    response = None if params.get('refresh') else get_cached_search(*cache_args, params['max_results'])
+    if response is None:
+        try:
+            started = time.perf_counter()
+            with stage("tavily"):
+                response = await client.search(budget=params['budget'], **tavily_search_kwargs(params))
+            TAVILY_SECONDS.observe(time.perf_counter() - started, params['search_depth'])
+        except Exception as e:
+            return _corpus_fallback(params, e)
+        # Fingerprinted once here, so near-duplicate detection on cache hits and in the corpus reuses it
+        fingerprint_results(response.get('results'))
+        # Responses without raw content would shortchange later requests that can afford it
+        if params['include_raw_content']:
+            store_search(*cache_args, params['max_results'], response)
+        if corpus_index is not None:
+            corpus_index.add_results(response.get('results'))
+    return response
+
+
+@timed("filter")
+def select_results(response, search_scope):
+    """Collapse near-duplicates, then filter results by confidence score and, if requested, to AP government sources"""
+    # Portals republish the same circulars; keep one copy per near-duplicate cluster
+    results = dedupe_results(response.get('results'))
+
+    # Filter results by confidence score (0.5 threshold for government sites as they might have lower scores)
+    confidence_threshold = 0.5 if search_scope == 'ap_gov_only' else 0.75
+    if search_scope == 'local_corpus':
+        # Corpus scores are relative to the best hit, not Tavily confidences
+        confidence_threshold = 0.0
+    high_confidence_results = []
+
+    for result in results:
+        # Tavily doesn't always provide score, so we'll check if it exists
+        score = result.get('score', 1.0)  # Default to 1.0 if no score
+        if score >= confidence_threshold:
+            high_confidence_results.append(result)
+
+    # If no high confidence results, use all results but mention lower confidence
+    if not high_confidence_results:
+        high_confidence_results = results
+
+    # Filter to ensure we only have AP government sources if requested
+    if search_scope == 'ap_gov_only':
+        ap_gov_results = []
+        for result in high_confidence_results:
+            if registry.is_ap_gov(result.get('url', '')):
+                ap_gov_results.append(result)
+
+        if ap_gov_results:
+            high_confidence_results = ap_gov_results
+        # If no AP gov results found, keep all results but mention this in response
+
+    RESULT_COUNT.observe(len(high_confidence_results), search_scope)
+    return high_confidence_results
+
+
+def extract_sources(results):
+    """Extract sources (URLs)"""
+    return [result['url'] for result in results if result.get('url')]
+
+
+def excerpt_summary(query, results, search_scope, prefix=None):
+    """Extractive summary of the results, used for the cheap path and when no LLM answer is available"""
+    with stage("extractive"):
+        summary_response = extractive_summary(query, results)
+    if not summary_response:
+        # No sentence long enough to stand alone: fall back to the opening of the top results
+        summary_parts = [result['content'][:300] + "..." for result in results[:3] if result.get('content')]
+        if not summary_parts:
+            return NO_RELEVANT_DATA_MESSAGE
+        summary_response = " ".join(summary_parts)
+    if search_scope == 'ap_gov_only':
+        summary_response = f"Based on Andhra Pradesh government sources: {summary_response}"
+    if prefix:
+        summary_response = f"{prefix} {summary_response}"
+    return summary_response
+
+
+@timed("prompt")
+def build_llm_prompt(query, search_results):
+    """Format the most relevant passages of the search results into the LLM prompt"""
+    prompt = SYSTEM_INSTRUCTION.format(
+        query=query,
+        search_results=build_context(query, search_results)
+    )
+    PROMPT_TOKENS.observe(estimate_tokens(prompt))
+    return prompt
+
+
+def no_results_response(search_scope):
+    """Response body used when Tavily returned no results at all"""
+    return {
+        "response": NO_RESULTS_MESSAGE,
+        "source_found": None,
+        "search_scope": search_scope
+    }
+
+
+def build_final_response(answer, sources, search_scope, total_results, mirrors=None):
+    """Prepare final response"""
+    if sources:
+        final_response = {
+            "response": answer,
+            "source_found": ", ".join(sources),
+            "search_scope": search_scope,
+            "total_results": total_results
+        }
+        if mirrors:
+            # Near-duplicate copies of a source, e.g. the same circular on a department subdomain
+            final_response["mirrors"] = mirrors
+        return final_response
+    return {
+        "response": NO_RESULTS_MESSAGE,
+        "source_found": None,
+        "search_scope": search_scope,
+        "total_results": 0
+    }
+
+
+def error_response(error):
+    """Response body returned when the pipeline raised"""
+    return {
+        "error": f"An error occurred: {str(error)}",
+        "response": "Sorry, could not find any relevant data",
+        "source_found": None
+    }
+
+
+def format_sse(event, data):
+    """Encode one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def semantic_cache_lookup(semantic_cache, params, query_vector):
+    """Stored response of a semantically similar earlier request, or None on a miss
+
+    The query vector is kept on params for the local index and for storing this request's answer.
+    """
+    params['query_vector'] = query_vector
+    cached_response = semantic_cache.lookup(
+        params['query'], params['search_scope'], vector=query_vector, **semantic_cache_attributes(params)
+    )
+    if cached_response is None:
+        return None
+    return report_budget(cached_response, params['budget'])
+
+
+def plan_answer(params, results):
+    """Summarizer for the answer: extractive for simple lookups, falling back from the LLM when the budget is short"""
+    query = params['query']
+    summarizer = choose_summarizer(query, results, params['summarizer'])
+    return plan_summarizer(summarizer, params['budget'], lambda: get_cached_answer(query, results))
+
+
+def llm_fallback_answer(query, results, search_scope, error):
+    """Answer served when the LLM call failed: source excerpts while it is unavailable, an apology otherwise"""
+    if isinstance(error, UpstreamUnavailable):
+        # Degrade to source excerpts while the LLM is throttled or unhealthy
+        logger.warning(f"LLM unavailable, serving excerpts: {str(error)}")
+        return excerpt_summary(query, results, search_scope, prefix=DEGRADED_PREFIX)
+    logger.error(f"Error generating LLM response: {str(error)}")
+    return f"Sorry, I encountered an error while processing the search results: {str(error)}"
+
+
+def assemble_response(params, results, answer, summarizer, degraded=False, semantic_cache=None):
+    """Final response for an answer; complete LLM answers are also stored in the semantic cache"""
+    final_response = build_final_response(
+        answer, extract_sources(results), params['search_scope'], len(results), mirrors=extract_mirrors(results)
+    )
+    final_response['summarizer'] = summarizer
+    if degraded:
+        final_response['degraded'] = True
+    elif summarizer == 'llm' and semantic_cache is not None:
+        semantic_cache.add(
+            params['query'], params['search_scope'], final_response,
+            vector=params.get('query_vector'), **semantic_cache_attributes(params)
+        )
+    return report_budget(final_response, params['budget'])
+
+
+def sources_event(results, search_scope):
+    """SSE event announcing the sources an answer will be based on"""
+    return format_sse("sources", {
+        "sources": extract_sources(results),
+        "mirrors": extract_mirrors(results),
+        "search_scope": search_scope,
+        "total_results": len(results)
+    })
+
+
+def cached_stream_events(cached_response, search_scope):
+    """SSE sources and token events replaying a semantic-cache hit"""
+    cached_sources = (cached_response.get('source_found') or '').split(', ')
+    yield format_sse("sources", {
+        "sources": [source for source in cached_sources if source],
+        "search_scope": search_scope,
+        "total_results": cached_response.get('total_results', 0)
+    })
+    yield format_sse("token", {"text": cached_response['response']})
+
+
+def done_event(final_response, timings):
+    """Final SSE event; headers went out before any stage ran, so stream timings ride on it"""
+    return format_sse("done", dict(final_response, server_timing=server_timing(timings)))
@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from metrics import CACHE_LOOKUPS
+from search_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# Semantic cache configuration
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+SEMANTIC_CACHE_EMBEDDER = os.getenv("SEMANTIC_CACHE_EMBEDDER", "openai")  # 'openai' or 'hashing'
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+class HashingEmbedder:
+    """Deterministic local embedder using signed feature hashing of words and character trigrams
+
+    Exposes the same embed_query/embed_documents interface as LangChain embeddings,
+    so it can stand in for OpenAIEmbeddings offline.
+    """
+
+    def __init__(self, dimensions=512):
+        self.dimensions = dimensions
+
+    def _features(self, text):
+        features = []
+        for word in TOKEN_PATTERN.findall(text.lower()):
+            features.append(word)
+            padded = f"#{word}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed_query(self, text):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature in self._features(text):
+            digest = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            vector[digest % self.dimensions] += sign
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def build_embedder(name=None):
+    """Create the embedder selected by SEMANTIC_CACHE_EMBEDDER"""
+    name = name or SEMANTIC_CACHE_EMBEDDER
+    if name == "hashing":
+        return HashingEmbedder()
+    if name == "openai":
+        from langchain_openai.embeddings import OpenAIEmbeddings
+        return OpenAIEmbeddings()
+    raise ValueError(f"Unknown embedder: {name}")
+
+
+class SemanticCache:
+    """Answer cache looked up by cosine similarity of query embeddings
+
+    Vectors live in a preallocated NumPy matrix of unit rows, so a lookup is a
+    single matrix-vector product. Adding the same query with the same scope and
+    attributes again replaces its entry; when full, the oldest slot is overwritten.
+    """
+
+    def __init__(self, embedder, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES, ttl=SEMANTIC_CACHE_TTL):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._matrix = None
+        self._entries = [None] * max_entries  # slot -> metadata dict
+        self._next_slot = 0
+        self._size = 0
+        self._slots = {}  # entry key -> slot
+        self._lock = threading.Lock()
+
+    def embed(self, text):
+        """Return a unit-length float32 vector for text, or None if embedding fails"""
+        try:
+            return self._normalize(self.embedder.embed_query(text))
+        except Exception as e:
+            logger.warning(f"Semantic cache embedding failed: {str(e)}")
+            return None
+
+    async def aembed(self, text):
+        """Async variant of embed, using the embedder's aembed_query when it has one"""
+        try:
+            if hasattr(self.embedder, "aembed_query"):
+                return self._normalize(await self.embedder.aembed_query(text))
+            return self._normalize(await asyncio.to_thread(self.embedder.embed_query, text))
+        except Exception as e:
+            logger.warning(f"Semantic cache embedding failed: {str(e)}")
+            return None
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return vector / norm
+
+    def query(self, vector, top_k=1, filter=None):
+        """Pinecone-style nearest neighbour query over the cached vectors"""
+        with self._lock:
+            if vector is None or self._size == 0:
+                return {"matches": []}
+            scores = self._matrix[:self._size] @ vector
+            now = time.monotonic()
+            matches = []
+            for slot in np.argsort(-scores):
+                entry = self._entries[slot]
+                if entry is None or entry["expires_at"] < now:
+                    continue
+                if filter and any(entry["metadata"].get(k) != v for k, v in filter.items()):
+                    continue
+                matches.append({
+                    "id": entry["id"],
+                    "score": float(scores[slot]),
+                    "metadata": entry["metadata"],
+                })
+                if len(matches) >= top_k:
+                    break
+            return {"matches": matches}
+
+    def lookup(self, query, search_scope, vector=None, **attributes):
+        """Return the stored payload of the closest earlier query above the threshold
+
+        Only entries added with the same search_scope and attributes (e.g. depth, summarizer) match.
+        """
+        if vector is None:
+            vector = self.embed(query)
+        result = self.query(vector, top_k=1, filter={"search_scope": search_scope, **attributes})
+        if not result["matches"] or result["matches"][0]["score"] < self.threshold:
+            CACHE_LOOKUPS.inc("semantic", "miss")
+            return None
+        CACHE_LOOKUPS.inc("semantic", "hit")
+        match = result["matches"][0]
+        payload = dict(match["metadata"]["payload"])
+        payload["semantic_match"] = {
+            "query": match["metadata"]["query"],
+            "similarity": round(match["score"], 4),
+        }
+        return payload
+
+    @staticmethod
+    def _entry_key(query, search_scope, attributes):
+        return (normalize_query(query), search_scope, tuple(sorted(attributes.items())))
+
+    def add(self, query, search_scope, payload, vector=None, **attributes):
+        """Remember the payload answered for query within search_scope and the given attributes
+
+        An earlier entry for the same query, scope and attributes (e.g. from a pre-warm refresh) is replaced.
+        """
+        if vector is None:
+            vector = self.embed(query)
+        if vector is None:
+            return
+        key = self._entry_key(query, search_scope, attributes)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._next_slot
+                evicted = self._entries[slot]
+                if evicted is not None:
+                    self._slots.pop(evicted["key"], None)
+                self._next_slot = (slot + 1) % self.max_entries
+                self._size = max(self._size, slot + 1)
+                self._slots[key] = slot
+            self._matrix[slot] = vector
+            self._entries[slot] = {
+                "id": f"q{slot}-{int(time.time() * 1000)}",
+                "key": key,
+                "expires_at": time.monotonic() + self.ttl,
+                "metadata": {"query": query, "search_scope": search_scope, "payload": payload, **attributes},
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries = [None] * self.max_entries
+            self._slots = {}
+            self._next_slot = 0
+            self._size = 0
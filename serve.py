@@ -0,0 +1,97 @@
+import argparse
+import gc
+import importlib
+import logging
+import multiprocessing
+import os
+
+from structured_log import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Serving configuration
+SERVE_BIND = os.getenv("SERVE_BIND", "0.0.0.0:8000")
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", str(min(multiprocessing.cpu_count() * 2 + 1, 8))))
+SERVE_THREADS = int(os.getenv("SERVE_THREADS", "16"))  # per worker, for the Flask backends
+SERVE_TIMEOUT = int(os.getenv("SERVE_TIMEOUT", "120"))
+SERVE_MAX_REQUESTS = int(os.getenv("SERVE_MAX_REQUESTS", "0"))  # recycle workers after N requests (0 = never)
+
+FLASK_BACKENDS = ("tevily", "tevily_2")
+ASYNC_BACKENDS = ("tevily_async",)
+
+
+def preload(module_name):
+    """Import the backend once in the parent process and load read-only state before forking
+
+    Workers then share these pages copy-on-write. gc.freeze() moves everything allocated so far
+    out of the collector's generations, so collections in the workers do not touch (and copy) them.
+    """
+    module = importlib.import_module(module_name)
+    from local_index import get_local_index
+    get_local_index()  # memory-mapped vectors and chunk metadata
+    gc.collect()
+    gc.freeze()
+    return module
+
+
+def serve_flask(module_name, bind, workers, threads):
+    """Run a Flask backend under gunicorn with a preloaded app and per-worker warm-up"""
+    from gunicorn.app.base import BaseApplication
+
+    module = preload(module_name)
+
+    class ProductionApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", bind)
+            self.cfg.set("workers", workers)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", threads)
+            self.cfg.set("timeout", SERVE_TIMEOUT)
+            self.cfg.set("keepalive", 75)
+            self.cfg.set("preload_app", True)
+            if SERVE_MAX_REQUESTS:
+                self.cfg.set("max_requests", SERVE_MAX_REQUESTS)
+                self.cfg.set("max_requests_jitter", SERVE_MAX_REQUESTS // 10)
+            self.cfg.set("post_worker_init", warm_up_worker)
+
+        def load(self):
+            return module.app
+
+    def warm_up_worker(worker):
+        # Runs in each worker after fork and before it accepts connections, so no sockets are shared
+        if hasattr(module, "warm_up"):
+            try:
+                module.warm_up()
+            except Exception as e:
+                worker.log.warning(f"Warm-up failed: {str(e)}")
+
+    ProductionApplication().run()
+
+
+def serve_async(module_name, bind, workers):
+    """Run the Quart backend under hypercorn; warm-up runs in each worker's before_serving hook"""
+    from hypercorn.config import Config
+    from hypercorn.run import run
+
+    config = Config()
+    config.application_path = f"{module_name}:app"
+    config.bind = [bind]
+    config.workers = workers
+    config.keep_alive_timeout = 75
+    # hypercorn imports the app in each worker (no preload), so read-only state is loaded per worker
+    run(config)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a search backend with multiple production workers")
+    parser.add_argument("backend", choices=FLASK_BACKENDS + ASYNC_BACKENDS)
+    parser.add_argument("--bind", default=SERVE_BIND)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--threads", type=int, default=SERVE_THREADS)
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.backend in ASYNC_BACKENDS:
+        serve_async(args.backend, args.bind, args.workers)
+    else:
+        serve_flask(args.backend, args.bind, args.workers, args.threads)
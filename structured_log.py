@@ -0,0 +1,233 @@
+import atexit
+import contextvars
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+# Logging configuration
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json (one object per line) or text
+LOG_FIELD_MAX_CHARS = int(os.getenv("LOG_FIELD_MAX_CHARS", "512"))  # longer strings are cut
+LOG_FIELD_MAX_ITEMS = int(os.getenv("LOG_FIELD_MAX_ITEMS", "10"))  # list items / dict keys kept per level
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))  # share of traces logging payloads
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # records beyond this are dropped, never waited on
+LOG_FIELD_MAX_DEPTH = 4
+
+# Incoming header carrying a caller's trace id; echoed on every response
+TRACE_HEADER = "X-Request-ID"
+
+_trace = contextvars.ContextVar("trace", default=None)  # (trace id, payloads sampled)
+
+
+def start_trace(trace_id=None):
+    """Start a trace for the current request or job and decide whether it logs payloads; returns the id"""
+    trace_id = str(trace_id)[:64] if trace_id else uuid.uuid4().hex[:16]
+    _trace.set((trace_id, random.random() < LOG_PAYLOAD_SAMPLE_RATE))
+    return trace_id
+
+
+def current_trace_id():
+    trace = _trace.get()
+    return trace[0] if trace is not None else None
+
+
+def truncate(value, max_chars=LOG_FIELD_MAX_CHARS, max_items=LOG_FIELD_MAX_ITEMS, depth=LOG_FIELD_MAX_DEPTH):
+    """Copy of a JSON-like value with long strings, long collections and deep nesting cut down
+
+    Only the parts that are kept are visited, so the cost is bounded however large the value is.
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        if len(value) <= max_chars:
+            return value
+        return f"{value[:max_chars]}...(+{len(value) - max_chars} chars)"
+    if depth == 0:
+        return f"<{type(value).__name__}>"
+    if isinstance(value, dict):
+        kept = {str(key): truncate(item, max_chars, max_items, depth - 1)
+                for key, item in itertools.islice(value.items(), max_items)}
+        if len(value) > max_items:
+            kept["..."] = f"+{len(value) - max_items} keys"
+        return kept
+    if isinstance(value, (list, tuple)):
+        kept = [truncate(item, max_chars, max_items, depth - 1) for item in value[:max_items]]
+        if len(value) > max_items:
+            kept.append(f"...(+{len(value) - max_items} items)")
+        return kept
+    return truncate(str(value), max_chars, max_items, depth)
+
+
+def log_event(logger, level, message, **fields):
+    """Log message with structured fields; fields are capped here and serialized off the calling thread"""
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={"fields": truncate(fields)})
+
+
+def log_payload(logger, message, **fields):
+    """Debug-log large payloads (upstream responses, prompts) for the sampled share of traces only"""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    trace = _trace.get()
+    sampled = trace[1] if trace is not None else random.random() < LOG_PAYLOAD_SAMPLE_RATE
+    if sampled:
+        logger.debug(message, extra={"fields": truncate(fields, max_chars=LOG_PAYLOAD_MAX_CHARS)})
+
+
+class TraceFilter(logging.Filter):
+    """Stamp records with the trace id of the request or job that logged them"""
+
+    def filter(self, record):
+        record.trace_id = current_trace_id() or "-"
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the writer thread; drops them (and counts the drops) rather than wait when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Resolve arguments now (they may change later) but leave formatting to the writer thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, trace id, message and structured fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "trace_id": getattr(record, "trace_id", "-"),
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines with the trace id and key=value fields"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s")
+
+    def format(self, record):
+        if not hasattr(record, "trace_id"):
+            record.trace_id = "-"
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={json.dumps(value, ensure_ascii=False, default=str)}"
+                                   for key, value in fields.items())
+        return line
+
+
+_handler = None
+_listener = None
+_configured_pid = None
+_lock = threading.Lock()
+
+
+def configure_logging(level=LOG_LEVEL, stream=None):
+    """Route the root logger through a bounded queue to a background writer thread
+
+    Safe to call more than once: it only reconfigures in a new process, since the writer thread
+    of a parent process does not survive a fork.
+    """
+    global _handler, _listener, _configured_pid
+    with _lock:
+        if _configured_pid == os.getpid():
+            return
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        _handler = NonBlockingQueueHandler(log_queue)
+        _handler.addFilter(TraceFilter())
+        root.addHandler(_handler)
+        root.setLevel(level)
+
+        _listener = QueueListener(log_queue, output)
+        _listener.start()
+        if _configured_pid is None:
+            atexit.register(_flush)
+        _configured_pid = os.getpid()
+
+
+def _flush():
+    """Write out queued records before the process exits"""
+    global _listener
+    if _listener is not None and _configured_pid == os.getpid():
+        _listener.stop()
+        _listener = None
+
+
+def trace_flask(app):
+    """Start a trace per Flask request (reusing the caller's X-Request-ID) and log one access record"""
+    from flask import g, request
+
+    access_logger = logging.getLogger("access")
+
+    @app.before_request
+    def _start_trace():
+        g.trace_id = start_trace(request.headers.get(TRACE_HEADER))
+        g.trace_started = time.perf_counter()
+
+    @app.after_request
+    def _log_request(response):
+        started = g.get('trace_started')
+        if started is not None:
+            response.headers[TRACE_HEADER] = g.trace_id
+            log_event(access_logger, logging.INFO, "request", method=request.method, path=request.path,
+                      status=response.status_code, duration_ms=round((time.perf_counter() - started) * 1000, 1))
+        return response
+
+
+def trace_quart(app):
+    """Quart variant of trace_flask"""
+    from quart import g, request
+
+    access_logger = logging.getLogger("access")
+
+    @app.before_request
+    async def _start_trace():
+        g.trace_id = start_trace(request.headers.get(TRACE_HEADER))
+        g.trace_started = time.perf_counter()
+
+    @app.after_request
+    async def _log_request(response):
+        started = g.get('trace_started')
+        if started is not None:
+            response.headers[TRACE_HEADER] = g.trace_id
+            log_event(access_logger, logging.INFO, "request", method=request.method, path=request.path,
+                      status=response.status_code, duration_ms=round((time.perf_counter() - started) * 1000, 1))
+        return response
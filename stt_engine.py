@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import speech_recognition as sr
+
+logger = logging.getLogger(__name__)
+
+# STT configuration
+STT_ENGINE = os.getenv("STT_ENGINE", "google")  # 'google', 'vosk' (offline) or 'whisper' (offline)
+STT_LANGUAGE = os.getenv("STT_LANGUAGE", "en-IN")
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "models/vosk-model-small-en-in")
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base.en")
+STT_CALIBRATION_FILE = os.getenv("STT_CALIBRATION_FILE", ".stt_calibration.json")
+STT_CALIBRATION_MAX_AGE = int(os.getenv("STT_CALIBRATION_MAX_AGE", "3600"))
+STT_PAUSE_THRESHOLD = float(os.getenv("STT_PAUSE_THRESHOLD", "0.6"))
+STT_VAD_AGGRESSIVENESS = int(os.getenv("STT_VAD_AGGRESSIVENESS", "2"))
+
+VAD_SAMPLE_RATE = 16000
+VAD_FRAME_MS = 30
+VAD_PADDING_MS = 150
+
+
+class GoogleEngine:
+    """Google Web Speech API via SpeechRecognition (network)"""
+
+    name = "google"
+
+    def __init__(self, language=STT_LANGUAGE):
+        self.language = language
+
+    def transcribe(self, recognizer, audio):
+        return recognizer.recognize_google(audio, language=self.language)
+
+
+class VoskEngine:
+    """Offline Kaldi recognition; the model is loaded once and reused"""
+
+    name = "vosk"
+
+    def __init__(self, model_path=VOSK_MODEL_PATH):
+        from vosk import Model, KaldiRecognizer
+        self._recognizer_class = KaldiRecognizer
+        self.model = Model(model_path)
+
+    def transcribe(self, recognizer, audio):
+        kaldi = self._recognizer_class(self.model, VAD_SAMPLE_RATE)
+        kaldi.AcceptWaveform(audio.get_raw_data(convert_rate=VAD_SAMPLE_RATE, convert_width=2))
+        text = json.loads(kaldi.FinalResult()).get("text", "")
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+
+class WhisperEngine:
+    """Offline Whisper recognition via SpeechRecognition's local whisper backend"""
+
+    name = "whisper"
+
+    def __init__(self, model=WHISPER_MODEL):
+        self.model = model
+
+    def transcribe(self, recognizer, audio):
+        text = recognizer.recognize_whisper(audio, model=self.model, language="english").strip()
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+
+ENGINES = {"google": GoogleEngine, "vosk": VoskEngine, "whisper": WhisperEngine}
+
+
+def build_engine(name=None):
+    name = name or STT_ENGINE
+    if name not in ENGINES:
+        raise ValueError(f"Unknown STT engine: {name}")
+    return ENGINES[name]()
+
+
+def _calibration_fresh(measured_at):
+    return measured_at is not None and time.time() - measured_at <= STT_CALIBRATION_MAX_AGE
+
+
+def _load_calibration(path):
+    """(energy_threshold, measured_at) of a stored calibration that is still fresh, else None"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if _calibration_fresh(data["measured_at"]):
+            return float(data["energy_threshold"]), float(data["measured_at"])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def _save_calibration(path, energy_threshold, measured_at):
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"energy_threshold": energy_threshold, "measured_at": measured_at}, f)
+    except OSError as e:
+        logger.warning(f"Could not save STT calibration: {str(e)}")
+
+
+def _voiced_frames_energy(frames, energy_threshold):
+    """Energy fallback when webrtcvad is not installed: frame RMS above the calibrated threshold"""
+    return [np.sqrt(np.mean(frame.astype(np.float32) ** 2)) > energy_threshold for frame in frames]
+
+
+def _voiced_frames_vad(frames, aggressiveness):
+    import webrtcvad
+    vad = webrtcvad.Vad(aggressiveness)
+    return [vad.is_speech(frame.tobytes(), VAD_SAMPLE_RATE) for frame in frames]
+
+
+def trim_silence(audio, energy_threshold, aggressiveness=STT_VAD_AGGRESSIVENESS):
+    """Cut leading and trailing non-speech from a capture (16 kHz mono); raises UnknownValueError if none is voiced"""
+    samples = np.frombuffer(audio.get_raw_data(convert_rate=VAD_SAMPLE_RATE, convert_width=2), dtype=np.int16)
+    frame_size = VAD_SAMPLE_RATE * VAD_FRAME_MS // 1000
+    frames = [samples[i:i + frame_size] for i in range(0, len(samples) - frame_size + 1, frame_size)]
+    if not frames:
+        return audio
+
+    try:
+        voiced = _voiced_frames_vad(frames, aggressiveness)
+    except ImportError:
+        voiced = _voiced_frames_energy(frames, energy_threshold)
+
+    voiced_indices = [i for i, is_voiced in enumerate(voiced) if is_voiced]
+    if not voiced_indices:
+        raise sr.UnknownValueError()
+    padding = VAD_PADDING_MS // VAD_FRAME_MS
+    start = max(0, voiced_indices[0] - padding) * frame_size
+    end = min(len(frames), voiced_indices[-1] + 1 + padding) * frame_size
+    return sr.AudioData(samples[start:end].tobytes(), VAD_SAMPLE_RATE, 2)
+
+
+class SpeechToText:
+    """Microphone capture with a persisted noise calibration, VAD trimming and a pluggable recognizer"""
+
+    def __init__(self, engine=None, calibration_file=STT_CALIBRATION_FILE):
+        self.engine = engine or build_engine()
+        self.calibration_file = calibration_file
+        self.recognizer = sr.Recognizer()
+        self.recognizer.pause_threshold = STT_PAUSE_THRESHOLD
+        self._lock = threading.Lock()
+        self.measured_at = None  # wall-clock time of the calibration in use
+        calibration = _load_calibration(calibration_file)
+        if calibration is not None:
+            self.recognizer.energy_threshold, self.measured_at = calibration
+
+    def listen(self, source, timeout=10, phrase_time_limit=10):
+        """Record one utterance; ambient noise is measured again once the calibration is older than STT_CALIBRATION_MAX_AGE"""
+        with self._lock:
+            if not _calibration_fresh(self.measured_at):
+                self.recognizer.adjust_for_ambient_noise(source, duration=1)
+                self.measured_at = time.time()
+                # Only a real measurement is persisted, so its age keeps counting from when it was taken
+                _save_calibration(self.calibration_file, self.recognizer.energy_threshold, self.measured_at)
+            audio = self.recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
+        return audio
+
+    def transcribe(self, audio):
+        return self.engine.transcribe(self.recognizer, trim_silence(audio, self.recognizer.energy_threshold))
+
+    def recalibrate(self):
+        """Force a fresh ambient-noise measurement on the next capture"""
+        self.measured_at = None
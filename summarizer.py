@@ -0,0 +1,156 @@
+import os
+import re
+
+import numpy as np
+
+from context_builder import tokenize, STOPWORDS
+
+# Summarizer configuration
+SUMMARIZER_DEFAULT = os.getenv("SUMMARIZER_DEFAULT", "llm")  # 'extractive', 'llm' or 'auto' (opt-in)
+SUMMARIZER_MODES = ('extractive', 'llm', 'auto')
+EXTRACTIVE_MAX_SENTENCES = int(os.getenv("EXTRACTIVE_MAX_SENTENCES", "5"))
+EXTRACTIVE_MAX_CHARS = int(os.getenv("EXTRACTIVE_MAX_CHARS", "1200"))
+EXTRACTIVE_MMR_LAMBDA = float(os.getenv("EXTRACTIVE_MMR_LAMBDA", "0.7"))
+# 'auto' uses the extractive path for short lookups whose best sentence matches the query this well
+AUTO_EXTRACTIVE_MIN_RELEVANCE = float(os.getenv("AUTO_EXTRACTIVE_MIN_RELEVANCE", "0.35"))
+AUTO_EXTRACTIVE_MAX_TERMS = int(os.getenv("AUTO_EXTRACTIVE_MAX_TERMS", "4"))
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])|\n+")
+MIN_SENTENCE_WORDS = 5
+MAX_SENTENCE_WORDS = 60
+MAX_CANDIDATE_SENTENCES = 400
+RELEVANCE_WEIGHT = 0.75  # versus centrality
+
+LOOKUP_TERMS = frozenset("""
+address contact phone number helpline email website timings hours office fee fees toll free url link portal
+""".split())
+
+
+def split_sentences(text):
+    """Sentences of a result's text, skipping fragments too short or too long to stand alone"""
+    sentences = []
+    for sentence in SENTENCE_PATTERN.split(text or ""):
+        sentence = " ".join(sentence.split()).strip(" -•*|")
+        if MIN_SENTENCE_WORDS <= len(sentence.split()) <= MAX_SENTENCE_WORDS:
+            sentences.append(sentence)
+    return sentences
+
+
+def _tfidf(token_lists, vocabulary):
+    """Row-normalized TF-IDF matrix (documents x vocabulary) built with bincount"""
+    rows, cols = [], []
+    for i, tokens in enumerate(token_lists):
+        for token in tokens:
+            j = vocabulary.get(token)
+            if j is not None:
+                rows.append(i)
+                cols.append(j)
+    shape = (len(token_lists), len(vocabulary))
+    tf = np.zeros(shape)
+    if cols:
+        flat = np.asarray(rows) * shape[1] + np.asarray(cols)
+        tf = np.bincount(flat, minlength=tf.size).reshape(shape).astype(float)
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log((1.0 + shape[0]) / (1.0 + df)) + 1.0
+    matrix = np.log1p(tf) * idf
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms), idf
+
+
+def _candidates(results):
+    """(sentence, result index, position) for every usable sentence, in result order"""
+    candidates = []
+    seen = set()
+    for r, result in enumerate(results):
+        for p, sentence in enumerate(split_sentences(result.get('content') or '')):
+            key = sentence.lower()
+            if key not in seen:
+                seen.add(key)
+                candidates.append((sentence, r, p))
+            if len(candidates) >= MAX_CANDIDATE_SENTENCES:
+                return candidates
+    return candidates
+
+
+def rank_sentences(query, results):
+    """Return (candidates, scores, relevance, similarity) for the sentences of the results"""
+    candidates = _candidates(results)
+    if not candidates:
+        return candidates, np.zeros(0), np.zeros(0), np.zeros((0, 0))
+
+    token_lists = [[t for t in tokenize(sentence) if t not in STOPWORDS] for sentence, _, _ in candidates]
+    vocabulary = {}
+    for tokens in token_lists:
+        for token in tokens:
+            vocabulary.setdefault(token, len(vocabulary))
+    if not vocabulary:
+        return candidates, np.zeros(len(candidates)), np.zeros(len(candidates)), np.zeros((len(candidates),) * 2)
+
+    matrix, idf = _tfidf(token_lists, vocabulary)
+    query_vector = np.zeros(len(vocabulary))
+    for token in tokenize(query):
+        j = vocabulary.get(token)
+        if j is not None and token not in STOPWORDS:
+            query_vector[j] = idf[j]
+    norm = np.linalg.norm(query_vector)
+    relevance = matrix @ (query_vector / norm) if norm else np.zeros(len(candidates))
+
+    similarity = matrix @ matrix.T
+    # Centrality: how much a sentence agrees with the rest of the retrieved text
+    centrality = (similarity.sum(axis=1) - 1.0) / max(len(candidates) - 1, 1)
+    if centrality.max() > 0:
+        centrality = centrality / centrality.max()
+    # Small preference for higher-ranked results
+    rank_prior = np.asarray([1.0 / (1.0 + 0.1 * r) for _, r, _ in candidates])
+    scores = (RELEVANCE_WEIGHT * relevance + (1 - RELEVANCE_WEIGHT) * centrality) * rank_prior
+    return candidates, scores, relevance, similarity
+
+
+def select_mmr(scores, similarity, max_sentences, lambda_=EXTRACTIVE_MMR_LAMBDA):
+    """Maximal marginal relevance: trade sentence score against similarity to what is already chosen"""
+    selected = []
+    remaining = np.ones(len(scores), dtype=bool)
+    max_similarity = np.zeros(len(scores))
+    while remaining.any() and len(selected) < max_sentences:
+        mmr = np.where(remaining, lambda_ * scores - (1 - lambda_) * max_similarity, -np.inf)
+        best = int(np.argmax(mmr))
+        if scores[best] <= 0 and selected:
+            break
+        selected.append(best)
+        remaining[best] = False
+        max_similarity = np.maximum(max_similarity, similarity[best])
+    return selected
+
+
+def extractive_summary(query, results, max_sentences=EXTRACTIVE_MAX_SENTENCES, max_chars=EXTRACTIVE_MAX_CHARS):
+    """Answer assembled from the most query-relevant, non-redundant sentences of the results ('' if none)"""
+    candidates, scores, _, similarity = rank_sentences(query, results)
+    if not candidates:
+        return ""
+
+    chosen, length = [], 0
+    for index in select_mmr(scores, similarity, max_sentences):
+        sentence = candidates[index][0]
+        if chosen and length + len(sentence) > max_chars:
+            break
+        chosen.append(index)
+        length += len(sentence) + 1
+    # Keep source order so the answer reads like the pages it came from
+    chosen.sort(key=lambda i: candidates[i][1:])
+    return " ".join(candidates[i][0] for i in chosen)
+
+
+def choose_summarizer(query, results, requested, llm_available=True):
+    """Resolve 'auto' to 'extractive' or 'llm' for one request"""
+    if requested == 'extractive' or not llm_available:
+        return 'extractive'
+    if requested == 'llm':
+        return 'llm'
+    # auto: short lookups whose answer is stated verbatim in a result do not need the LLM
+    terms = [t for t in tokenize(query) if t not in STOPWORDS]
+    if len(terms) > AUTO_EXTRACTIVE_MAX_TERMS and not LOOKUP_TERMS.intersection(terms):
+        return 'llm'
+    _, _, relevance, _ = rank_sentences(query, results)
+    if len(relevance) and relevance.max() >= AUTO_EXTRACTIVE_MIN_RELEVANCE:
+        return 'extractive'
+    return 'llm'
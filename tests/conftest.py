@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# Modules read their configuration at import time: keep indexes and stores out of the working tree
+_scratch = tempfile.mkdtemp(prefix="quantell-tests-")
+os.environ.setdefault("CORPUS_INDEX_DIR", os.path.join(_scratch, "corpus_index"))
+os.environ.setdefault("LOCAL_INDEX_DIR", os.path.join(_scratch, "local_index"))
+os.environ.setdefault("SEARCH_DEADLINE_MS", "20000")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,67 @@
+import dedup
+from dedup import dedupe_results, document_fingerprint, extract_mirrors, fingerprint_results
+from search_pipeline import select_results
+
+CIRCULAR = ("G.O.Ms.No. 12 Revenue (Land Registration) Department. Orders are issued revising the market value "
+            "guidelines for agricultural land in all districts with effect from the first of April. ") * 8
+
+
+def result(url, score, content=CIRCULAR):
+    return {"url": url, "title": "Circular", "content": content, "score": score}
+
+
+def test_near_duplicates_collapse_into_authoritative_copy():
+    results = [
+        result("https://www.example-news.com/ap-circular", 0.9),
+        result("https://goir.ap.gov.in/circular-12", 0.3),
+        result("https://igrs.ap.gov.in/fees", 0.8, content="Registration fees and stamp duty table. " * 20),
+    ]
+
+    deduped = dedupe_results(results)
+
+    assert [r["url"] for r in deduped] == ["https://goir.ap.gov.in/circular-12", "https://igrs.ap.gov.in/fees"]
+    assert deduped[0]["score"] == 0.9  # the cluster's best score travels with the kept copy
+    assert extract_mirrors(deduped) == {"https://goir.ap.gov.in/circular-12": ["https://www.example-news.com/ap-circular"]}
+
+
+def test_low_scored_official_copy_survives_confidence_filter():
+    response = {"results": [
+        result("https://www.example-news.com/ap-circular", 0.9),
+        result("https://goir.ap.gov.in/circular-12", 0.3),
+    ]}
+
+    selected = select_results(response, "ap_gov_only")
+
+    assert [r["url"] for r in selected] == ["https://goir.ap.gov.in/circular-12"]
+    assert selected[0]["mirrors"] == ["https://www.example-news.com/ap-circular"]
+
+
+def test_distinct_results_are_kept():
+    results = [
+        result("https://igrs.ap.gov.in/fees", 0.8, content="Registration fees and stamp duty table. " * 20),
+        result("https://meeseva.ap.gov.in/pension", 0.7, content="Pension applications are accepted at village secretariats. " * 20),
+    ]
+
+    assert dedupe_results(results) == results
+
+
+def test_fingerprinting_does_not_modify_the_result():
+    doc = result("https://goir.ap.gov.in/circular-12", 0.3)
+
+    fingerprint = document_fingerprint(doc)
+
+    assert fingerprint
+    assert "minhash" not in doc
+    assert document_fingerprint(dict(doc, minhash="stored")) == "stored"
+
+
+def test_cached_results_reuse_their_fingerprints(monkeypatch):
+    results = [result("https://goir.ap.gov.in/circular-12", 0.3), result("https://www.example-news.com/ap-circular", 0.9)]
+    fingerprint_results(results)
+    assert all(r["minhash"] for r in results)
+
+    def fail(text):
+        raise AssertionError("fingerprint computed again")
+    monkeypatch.setattr(dedup, "minhash", fail)
+
+    assert [r["url"] for r in dedupe_results(results)] == ["https://goir.ap.gov.in/circular-12"]
@@ -0,0 +1,81 @@
+import sqlite3
+import time
+
+import pytest
+
+import job_queue
+from job_queue import JobStore, job_priority
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"))
+
+
+def test_claims_follow_priority_then_age(store):
+    bulk = store.create({"query": "b"}, "bulk")
+    normal = store.create({"query": "n"}, "normal")
+    first = store.create({"query": "i1"}, "interactive")
+    second = store.create({"query": "i2"}, "interactive")
+
+    claimed = [store.claim_next()["id"] for _ in range(4)]
+
+    assert claimed == [first, second, normal, bulk]
+    assert store.claim_next() is None
+    assert store.get(first)["status"] == "running"
+
+
+def test_a_job_is_claimed_once_across_stores(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    job_id = JobStore(path).create({"query": "q"}, "normal")
+
+    assert JobStore(path).claim_next()["id"] == job_id
+    assert JobStore(path).claim_next() is None
+
+
+def test_recover_requeues_stale_running_jobs(store, monkeypatch):
+    job_id = store.create({"query": "q"}, "normal")
+    store.claim_next()
+    assert store.recover() == 0
+
+    monkeypatch.setattr(job_queue, "JOB_STALE_AFTER", -1)  # every heartbeat is now too old
+
+    assert store.recover() == 1
+    assert store.get(job_id)["status"] == "queued"
+    assert store.claim_next()["id"] == job_id
+
+
+def test_heartbeat_keeps_running_jobs(store, monkeypatch):
+    job_id = store.create({"query": "q"}, "normal")
+    store.claim_next()
+    monkeypatch.setattr(job_queue, "JOB_STALE_AFTER", 5)
+    with sqlite3.connect(store.path) as conn:
+        conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time() - 10, job_id))
+
+    store.heartbeat([job_id])
+
+    assert store.recover() == 0
+    assert store.get(job_id)["status"] == "running"
+
+
+def test_recover_drops_expired_finished_jobs(store, monkeypatch):
+    job_id = store.create({"query": "q"}, "normal")
+    store.claim_next()
+    store.finish(job_id, {"response": "done"}, 200)
+    assert store.get(job_id)["status"] == "done"
+
+    monkeypatch.setattr(job_queue, "JOB_RETENTION", -1)
+    store.recover()
+
+    assert store.get(job_id) is None
+
+
+@pytest.mark.parametrize("data, expected", [
+    ({"priority": "bulk", "search_depth": "basic"}, "bulk"),
+    ({"search_depth": "basic", "max_results": 3}, "interactive"),
+    ({"search_depth": "advanced", "max_results": 10}, "bulk"),
+    ({"search_depth": "advanced", "max_results": 3}, "normal"),
+    ({"priority": "urgent", "max_results": "x"}, "normal"),
+])
+def test_job_priority(data, expected):
+    assert job_priority(data) == expected
@@ -0,0 +1,101 @@
+import pytest
+
+from deadline import Budget, plan_search, plan_summarizer
+from domain_registry import registry
+from search_pipeline import MAX_RESULTS_LIMIT, parse_search_request
+
+
+def test_missing_query_or_non_object_body():
+    assert parse_search_request({}, default_max_results=2) is None
+    assert parse_search_request(None, default_max_results=2) is None
+    assert parse_search_request(["query"], default_max_results=2) is None
+
+
+def test_defaults():
+    params = parse_search_request({"query": "ration card status"}, default_max_results=2)
+
+    assert params["max_results"] == 2
+    assert params["search_depth"] == "advanced"
+    assert params["search_scope"] == "ap_gov_only"
+    assert params["include_domains"] == registry.domains
+    assert params["enhanced_query"] == "ration card status Andhra Pradesh AP government"
+    assert params["budget"].degradations == []
+
+
+@pytest.mark.parametrize("value, expected", [("5", 5), (" 3 ", 3), (None, 2), (MAX_RESULTS_LIMIT, MAX_RESULTS_LIMIT)])
+def test_max_results_accepted(value, expected):
+    params = parse_search_request({"query": "q", "max_results": value, "search_scope": "general"}, default_max_results=2)
+
+    assert params["max_results"] == expected
+
+
+@pytest.mark.parametrize("value", ["abc", 0, -1, MAX_RESULTS_LIMIT + 1, 2.5, [3]])
+def test_max_results_rejected(value):
+    with pytest.raises(ValueError, match="max_results"):
+        parse_search_request({"query": "q", "max_results": value}, default_max_results=2)
+
+
+def test_unknown_summarizer_falls_back_to_default():
+    params = parse_search_request({"query": "q", "summarizer": "gpt"}, default_max_results=2, default_summarizer="auto")
+
+    assert params["summarizer"] == "auto"
+
+
+def search_params(summarizer="llm", search_depth="advanced", max_results=6, search_scope="general"):
+    return {
+        "search_depth": search_depth,
+        "max_results": max_results,
+        "search_scope": search_scope,
+        "summarizer": summarizer,
+        "include_raw_content": True,
+    }
+
+
+def test_plan_search_keeps_full_search_within_budget():
+    params = search_params()
+
+    plan_search(params, Budget(20000))
+
+    assert (params["search_depth"], params["max_results"], params["include_raw_content"]) == ("advanced", 6, True)
+
+
+def test_plan_search_drops_to_basic_depth():
+    params, budget = search_params(), Budget(8000)
+
+    plan_search(params, budget)
+
+    assert params["search_depth"] == "basic"
+    assert params["max_results"] == 6
+    assert budget.degradations == ["search_depth:basic"]
+
+
+def test_plan_search_trims_results_and_raw_content():
+    params, budget = search_params(), Budget(3000)
+
+    plan_search(params, budget)
+
+    assert params["search_depth"] == "basic"
+    assert params["max_results"] == 3
+    assert params["include_raw_content"] is False
+    assert budget.degradations == ["search_depth:basic", "max_results:3", "raw_content:skipped"]
+
+
+def test_plan_search_leaves_local_corpus_alone():
+    params, budget = search_params(search_scope="local_corpus"), Budget(500)
+
+    plan_search(params, budget)
+
+    assert params == search_params(search_scope="local_corpus")
+    assert budget.degradations == []
+
+
+def test_plan_summarizer_prefers_cached_answer_then_extractive():
+    budget = Budget(3000)
+    assert plan_summarizer("llm", budget, lambda: "cached") == "llm"
+    assert budget.degradations == ["answer:cached"]
+
+    budget = Budget(3000)
+    assert plan_summarizer("llm", budget, lambda: None) == "extractive"
+    assert budget.degradations == ["summarizer:extractive"]
+
+    assert plan_summarizer("llm", Budget(20000), lambda: None) == "llm"
@@ -0,0 +1,54 @@
+import json
+import time
+
+import pytest
+
+stt_engine = pytest.importorskip("stt_engine")
+
+
+class FakeRecognizer:
+    def __init__(self):
+        self.energy_threshold = 300
+        self.adjustments = 0
+
+    def adjust_for_ambient_noise(self, source, duration=1):
+        self.adjustments += 1
+        self.energy_threshold = 400 + self.adjustments
+
+    def listen(self, source, timeout=None, phrase_time_limit=None):
+        self.energy_threshold += 50  # the dynamic threshold drifts while listening
+        return b"audio"
+
+
+def make_stt(path):
+    stt = stt_engine.SpeechToText(engine=object(), calibration_file=str(path))
+    stt.recognizer = FakeRecognizer()
+    return stt
+
+
+def test_calibration_is_measured_once_and_persisted(tmp_path):
+    path = tmp_path / "calibration.json"
+    stt = make_stt(path)
+
+    stt.listen(None)
+    saved = json.loads(path.read_text())
+    stt.listen(None)
+
+    assert stt.recognizer.adjustments == 1
+    assert saved["energy_threshold"] == 401
+    assert json.loads(path.read_text()) == saved  # captures do not refresh the stored age
+
+
+def test_stale_calibration_is_measured_again(tmp_path, monkeypatch):
+    path = tmp_path / "calibration.json"
+    path.write_text(json.dumps({"energy_threshold": 350, "measured_at": time.time()}))
+    stt = make_stt(path)
+    stt.recognizer.energy_threshold = 350
+    stt.listen(None)
+    assert stt.recognizer.adjustments == 0
+
+    monkeypatch.setattr(stt_engine, "STT_CALIBRATION_MAX_AGE", -1)
+    stt.listen(None)
+
+    assert stt.recognizer.adjustments == 1
+    assert stt_engine.SpeechToText(engine=object(), calibration_file=str(path)).measured_at is None
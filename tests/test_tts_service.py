@@ -0,0 +1,19 @@
+import pytest
+
+from tts_service import TTS_MAX_CHARS, parse_tts_request
+
+
+def test_text_is_returned():
+    assert parse_tts_request({"text": "Visit the MeeSeva centre."}) == "Visit the MeeSeva centre."
+
+
+@pytest.mark.parametrize("data", [None, ["text"], "text", 42])
+def test_non_object_body_is_rejected(data):
+    with pytest.raises(ValueError, match="JSON object"):
+        parse_tts_request(data)
+
+
+@pytest.mark.parametrize("data", [{}, {"text": "  "}, {"text": 5}, {"text": "x" * (TTS_MAX_CHARS + 1)}])
+def test_invalid_text_is_rejected(data):
+    with pytest.raises(ValueError):
+        parse_tts_request(data)
@@ -0,0 +1,122 @@
+import time
+
+import pytest
+
+from deadline import Budget
+from upstream_guard import CircuitBreaker, UpstreamGuard, UpstreamUnavailable
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def make_guard(failure_threshold=2, reset_timeout=60):
+    return UpstreamGuard("test", rate=0, burst=1, initial_limit=4, max_limit=8, target_latency=10,
+                         acquire_timeout=1, failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+
+
+def call(guard, error=None):
+    with guard.slot():
+        if error is not None:
+            raise error
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == "closed"
+
+
+def test_half_open_trial_closes_or_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    assert breaker.allow()  # the single trial call
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_guard_opens_on_upstream_failures():
+    guard = make_guard()
+    for _ in range(2):
+        with pytest.raises(HTTPError):
+            call(guard, HTTPError(503))
+
+    with pytest.raises(UpstreamUnavailable, match="circuit open"):
+        call(guard)
+    assert guard.rejected == 1
+
+
+@pytest.mark.parametrize("error", [HTTPError(400), HTTPError(422), ValueError("bad query")])
+def test_client_errors_do_not_open_the_breaker(error):
+    guard = make_guard()
+    for _ in range(5):
+        with pytest.raises(type(error)):
+            call(guard, error)
+
+    assert guard.breaker.state == "closed"
+    call(guard)
+
+
+def test_timeouts_count_as_failures():
+    guard = make_guard(failure_threshold=1)
+    with pytest.raises(TimeoutError):
+        call(guard, TimeoutError("read timed out"))
+
+    assert guard.breaker.state == "open"
+    assert not guard.has_headroom(0.5)
+
+
+def test_rejected_trial_is_given_back():
+    guard = make_guard(failure_threshold=1, reset_timeout=0.05)
+    with pytest.raises(HTTPError):
+        call(guard, HTTPError(503))
+    time.sleep(0.06)
+    guard.limiter.limit = guard.limiter.inflight = 1  # no concurrency left for the trial
+
+    with pytest.raises(UpstreamUnavailable, match="concurrent"):
+        with guard.slot(budget=Budget(500)):
+            pass
+    guard.limiter.inflight = 0
+
+    # The trial never reached the upstream, so the next call may make it
+    call(guard)
+    assert guard.breaker.state == "closed"
+
+
+def test_admission_wait_stops_at_the_deadline():
+    guard = make_guard()
+    guard.acquire_timeout = 5
+    guard.limiter.limit = guard.limiter.inflight = 1
+    budget = Budget(500)
+
+    started = time.monotonic()
+    with pytest.raises(UpstreamUnavailable):
+        with guard.slot(budget=budget):
+            pass
+
+    assert time.monotonic() - started < 1
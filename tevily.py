@@ -1,11 +1,29 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from tavily import TavilyClient
 import os
 from flask_cors import CORS
-from component_initilizer import *
+from domain_registry import registry
+from search_pipeline import (
+    parse_search_request, search_request_key, excerpt_summary, fetch_search_results, select_results,
+    extract_sources, no_results_response, build_final_response, error_response, format_sse,
+)
+from dedup import extract_mirrors
+from single_flight import SingleFlight
+from job_queue import JobQueue, job_events, submitted_response
+from deadline import report_budget
+from prewarm import PrewarmScheduler, record_query
+from metrics import begin_request, instrument_flask, render_metrics
+from structured_log import configure_logging, trace_flask
+from tts_service import get_tts_service, parse_tts_request
+from http_transport import build_session, prime_connections
+from upstream_guard import GuardedTavilyClient, UpstreamUnavailable
+import logging
+import time
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for Streamlit integration
+instrument_flask(app)  # Stage timings in Server-Timing headers and /metrics
+trace_flask(app)  # Per-request trace ids in logs and X-Request-ID headers
 
 # Initialize Tavily client
 from dotenv import load_dotenv
@@ -13,42 +31,14 @@ from dotenv import load_dotenv
 load_dotenv()  # Loads variables from .env into environment
 
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
-client = TavilyClient(TAVILY_API_KEY)
-
-# Andhra Pradesh Government Domains
-AP_GOV_DOMAINS = [
-    "ap.gov.in",
-    "apland.ap.gov.in",
-    "webland.ap.gov.in",
-    "registration.ap.gov.in",
-    "aponline.ap.gov.in",
-    "appolice.gov.in",
-    "aptransport.org",
-    "aphrdi.ap.gov.in",
-    "apgenco.gov.in",
-    "aptransco.gov.in",
-    "apspdcl.in",
-    "apepdcl.in",
-    "apcpdcl.gov.in",
-    "apssb.gov.in",
-    "appsc.gov.in",
-    "aptet.apcfss.in",
-    "school9.ap.gov.in",
-    "apfinance.gov.in",
-    "apwater.gov.in",
-    "aphorticulture.gov.in",
-    "apagri.gov.in",
-    "apforest.gov.in",
-    "aptourism.gov.in",
-    "apithelp.gov.in",
-    "webland.ap.gov.in",
-    "village.ap.gov.in",
-    "creditplus.ap.gov.in",
-    "epass.ap.gov.in",
-    "apmepma.gov.in",
-    "appost.in",
-    "andhrapradesh.gov.in"
-]
+TAVILY_API_BASE_URL = os.getenv("TAVILY_API_BASE_URL")  # None means the public Tavily API
+tavily_session = build_session()
+client = GuardedTavilyClient(TavilyClient(TAVILY_API_KEY, api_base_url=TAVILY_API_BASE_URL, session=tavily_session))
+
+logger = logging.getLogger(__name__)
+
+# Identical searches already in flight share one upstream execution
+search_flight = SingleFlight()
 
 # System instruction for summarization
 SYSTEM_INSTRUCTION = """
@@ -62,150 +52,145 @@ Your task is to:
 6. Always mention that the information is from Andhra Pradesh government sources
 """
 
+def run_search(data):
+    """Run the /search pipeline for one request body; returns (payload, status_code)"""
+    # No LLM here, so the deadline only has to cover the search
+    try:
+        params = parse_search_request(data, default_max_results=5, default_summarizer='extractive')
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    
+    # Validate required parameters
+    if params is None:
+        return {"error": "Query parameter is required"}, 400
+    record_query(params)
+    
+    # Concurrent duplicates wait for the first request's result instead of repeating the work
+    return search_flight.do(search_request_key(params), execute_search, params)
+
+def execute_search(params):
+    """Search, filter and summarize for parsed request parameters; returns (payload, status_code)"""
+    search_scope = params['search_scope']
+    response = fetch_search_results(client, params)
+    
+    # Check if results found
+    if not response.get('results'):
+        return report_budget(no_results_response(search_scope), params['budget']), 200
+    
+    high_confidence_results = select_results(response, search_scope)
+    sources = extract_sources(high_confidence_results)
+    
+    # Generate summary response
+    if response.get('answer') and search_scope != 'ap_gov_only':
+        # Use Tavily's built-in answer if available and not restricting to AP gov only
+        summary_response = response['answer']
+    else:
+        # Create summary from results
+        summary_response = excerpt_summary(params['query'], high_confidence_results, search_scope)
+    
+    final_response = build_final_response(
+        summary_response, sources, search_scope, len(high_confidence_results), mirrors=extract_mirrors(high_confidence_results)
+    )
+    return report_budget(final_response, params['budget']), 200
+
+def run_job(data, progress):
+    """Job runner: the /search pipeline with stage timings collected into progress"""
+    begin_request(progress)
+    return run_search(data)
+
+# Expensive searches can run in the background: POST /search?async=1, then GET /jobs/<id>
+jobs = JobQueue(run_job)
+
+def submit_job(data):
+    """Queue a /search request as a background job and answer 202 with its id"""
+    try:
+        if parse_search_request(data, default_max_results=5, default_summarizer='extractive') is None:
+            return jsonify({"error": "Query parameter is required"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    job_id, priority = jobs.submit(data)
+    return jsonify(submitted_response(job_id, priority)), 202
+
+# Keeps popular and curated queries warm ahead of cache expiry (PREWARM_ENABLED)
+prewarmer = PrewarmScheduler(
+    lambda data: parse_search_request(data, default_max_results=5, default_summarizer='extractive'), execute_search
+)
+
+def warm_up():
+    """Per-worker warm-up before serving: open the Tavily connection pool and start pre-warming"""
+    configure_logging()  # the log writer thread does not survive the fork
+    prime_connections(tavily_session, [TAVILY_API_BASE_URL or "https://api.tavily.com"])
+    prewarmer.start()
+    jobs.start()  # resume jobs left queued by a previous process
+
 @app.route('/search', methods=['POST'])
 def tavily_search():
     try:
-        # Get request data
-        data = request.get_json()
-        
-        # Validate required parameters
-        if not data or 'query' not in data:
-            return jsonify({
-                "error": "Query parameter is required"
-            }), 400
-        
-        query = data['query']
-        
-        # Optional parameters with defaults
-        search_depth = data.get('search_depth', 'advanced')  # 'basic' or 'advanced'
-        max_results = data.get('max_results', 5)
-        
-        # Get search scope from request, default to AP Gov only
-        search_scope = data.get('search_scope', 'ap_gov_only')
-        
-        # Set domains based on search scope
-        if search_scope == 'ap_gov_only':
-            include_domains = AP_GOV_DOMAINS
-            exclude_domains = None
-        elif search_scope == 'include_ap_gov':
-            # Include AP gov domains but also search other sources
-            include_domains = None
-            exclude_domains = None
-        else:  # 'general'
-            include_domains = None
-            exclude_domains = None
-        
-        # Add AP/Andhra Pradesh context to query for better results
-        if search_scope in ['ap_gov_only', 'include_ap_gov']:
-            enhanced_query = f"{query} Andhra Pradesh AP government"
-        else:
-            enhanced_query = query
-        
-        # Perform Tavily search
-        response = client.search(
-            query=enhanced_query,
-            search_depth=search_depth,
-            include_answer=True,
-            include_raw_content=True,
-            max_results=max_results,
-            include_domains=include_domains,
-            exclude_domains=exclude_domains
-        )
-        
-        # Check if results found
-        if not response.get('results') or len(response['results']) == 0:
-            return jsonify({
-                "response": "Sorry, could not find any relevant data from Andhra Pradesh government sources",
-                "source_found": None,
-                "search_scope": search_scope
-            })
-        
-        # Filter results by confidence score (0.5 threshold for government sites as they might have lower scores)
-        confidence_threshold = 0.5 if search_scope == 'ap_gov_only' else 0.75
-        high_confidence_results = []
-        
-        for result in response['results']:
-            # Tavily doesn't always provide score, so we'll check if it exists
-            score = result.get('score', 1.0)  # Default to 1.0 if no score
-            if score >= confidence_threshold:
-                high_confidence_results.append(result)
-        
-        # If no high confidence results, use all results but mention lower confidence
-        if not high_confidence_results:
-            high_confidence_results = response['results']
-        
-        # Filter to ensure we only have AP government sources if requested
-        if search_scope == 'ap_gov_only':
-            ap_gov_results = []
-            for result in high_confidence_results:
-                url = result.get('url', '')
-                if any(domain in url.lower() for domain in AP_GOV_DOMAINS):
-                    ap_gov_results.append(result)
-            
-            if ap_gov_results:
-                high_confidence_results = ap_gov_results
-            # If no AP gov results found, keep all results but mention this in response
-        
-        # Extract sources (URLs)
-        sources = []
-        for result in high_confidence_results:
-            if result.get('url'):
-                sources.append(result['url'])
-        
-        # Generate summary response
-        if response.get('answer') and search_scope != 'ap_gov_only':
-            # Use Tavily's built-in answer if available and not restricting to AP gov only
-            summary_response = response['answer']
-        else:
-            # Create summary from results
-            summary_parts = []
-            for result in high_confidence_results[:3]:  # Top 3 results
-                if result.get('content'):
-                    summary_parts.append(result['content'][:300] + "...")
-            
-            if summary_parts:
-                summary_response = " ".join(summary_parts)
-                if search_scope == 'ap_gov_only':
-                    summary_response = f"Based on Andhra Pradesh government sources: {summary_response}"
+        if request.args.get('async') == '1':
+            return submit_job(request.get_json())
+        payload, status = run_search(request.get_json())
+        return jsonify(payload), status
+    
+    except UpstreamUnavailable as e:
+        # Fail fast while Tavily is throttled or unhealthy
+        return jsonify(error_response(e)), 503
+    
+    except Exception as e:
+        return jsonify(error_response(e)), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status of a background search job, with the result once it is done"""
+    body = jobs.status(job_id)
+    if body is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(body)
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_event_stream(job_id):
+    """Server-Sent Events with a job's progress, ending with a 'done' event carrying the result"""
+    def generate():
+        for event, data in job_events(jobs, job_id):
+            if event is None:
+                time.sleep(data)
             else:
-                summary_response = "Sorry, could not find any relevant data from the specified sources"
-        
-        # Prepare final response
-        if sources:
-            final_response = {
-                "response": summary_response,
-                "source_found": ", ".join(sources),
-                "search_scope": search_scope,
-                "total_results": len(high_confidence_results)
-            }
-        else:
-            final_response = {
-                "response": "Sorry, could not find any relevant data from Andhra Pradesh government sources",
-                "source_found": None,
-                "search_scope": search_scope,
-                "total_results": 0
-            }
-        
-        return jsonify(final_response)
+                yield format_sse(event, data)
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/tts', methods=['POST'])
+def text_to_speech():
+    """Synthesize speech for an answer; audio is streamed sentence by sentence and cached on disk"""
+    try:
+        text = parse_tts_request(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
+    try:
+        tts = get_tts_service()
+        audio = tts.stream(text)
     except Exception as e:
-        return jsonify({
-            "error": f"An error occurred: {str(e)}",
-            "response": "Sorry, could not find any relevant data",
-            "source_found": None
-        }), 500
+        logger.error(f"TTS error: {str(e)}")
+        return jsonify({"error": f"TTS error: {str(e)}"}), 502
+    return Response(stream_with_context(audio), mimetype=tts.mimetype, headers={'X-Accel-Buffering': 'no'})
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy", "ap_domains_count": len(AP_GOV_DOMAINS)})
+    return jsonify({"status": "healthy", "ap_domains_count": len(registry.domains)})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics: per-stage and upstream latency, cache hit ratio, result counts"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/domains', methods=['GET'])
 def get_ap_domains():
     """Get list of Andhra Pradesh government domains being searched"""
-    return jsonify({
-        "ap_government_domains": AP_GOV_DOMAINS,
-        "total_domains": len(AP_GOV_DOMAINS)
-    })
+    # ETag lets clients revalidate cheaply; unchanged lists are answered with 304
+    response = jsonify(registry.to_dict())
+    response.set_etag(registry.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 if __name__ == '__main__':
+    configure_logging()
     app.run(debug=True, host='0.0.0.0', port=8000)
\ No newline at end of file
@@ -1,25 +1,45 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from tavily import TavilyClient
 import os
 from flask_cors import CORS
+from domain_registry import registry
+from search_cache import get_cached_answer, store_answer
+from search_pipeline import (
+    parse_search_request, search_request_key, fetch_search_results, select_results,
+    extract_sources, build_llm_prompt, excerpt_summary, no_results_response, build_final_response,
+    error_response, format_sse, semantic_cache_lookup, plan_answer, llm_fallback_answer, assemble_response,
+    sources_event, cached_stream_events, done_event,
+)
+from batch_search import parse_batch_request, run_batch, ordered_batch_response, ndjson_lines
+from single_flight import SingleFlight
+from job_queue import JobQueue, job_events, submitted_response
+from metrics import begin_request, instrument_flask, render_metrics, stage
+from tts_service import get_tts_service, parse_tts_request
+from http_transport import build_session, prime_connections
+from upstream_guard import GuardedTavilyClient, UpstreamUnavailable, llm_guard
+from semantic_cache import SemanticCache, build_embedder, SEMANTIC_CACHE_ENABLED
+from deadline import report_budget
+from prewarm import PrewarmScheduler, record_query
+from structured_log import configure_logging, log_event, log_payload, trace_flask
 
-# LLM imports
-from langchain_openai import AzureChatOpenAI
-from langchain_pinecone import PineconeVectorStore
-from pinecone import Pinecone
-from langchain_openai.embeddings import OpenAIEmbeddings
-from component_initilizer import *
+# LLM is built lazily on first use (see component_initilizer.get_llm)
+from component_initilizer import get_llm, warm_up_llm, LLM_TIMEOUT
 import logging
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for Streamlit integration
+instrument_flask(app)  # Stage timings in Server-Timing headers and /metrics
+trace_flask(app)  # Per-request trace ids in logs and X-Request-ID headers
 
 # Initialize Tavily client
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
-client = TavilyClient(TAVILY_API_KEY)
+TAVILY_API_BASE_URL = os.getenv("TAVILY_API_BASE_URL")  # None means the public Tavily API
+tavily_session = build_session()
+client = GuardedTavilyClient(TavilyClient(TAVILY_API_KEY, api_base_url=TAVILY_API_BASE_URL, session=tavily_session))
 
 # Initialize LLM
 # llm = AzureChatOpenAI(
@@ -31,249 +51,293 @@ client = TavilyClient(TAVILY_API_KEY)
 
 logger = logging.getLogger(__name__)
 
-# Andhra Pradesh Government Domains
-AP_GOV_DOMAINS= [
-    # Main portals
-    "ap.gov.in",
-    "ap.nic.in", 
-    "goir.ap.gov.in",
+# Results per search when the request does not say
+DEFAULT_MAX_RESULTS = int(os.getenv("SEARCH_DEFAULT_MAX_RESULTS", "2"))
+
+# Semantic cache: paraphrased questions reuse an earlier answer
+semantic_cache = SemanticCache(build_embedder()) if SEMANTIC_CACHE_ENABLED else None
+
+# Identical searches already in flight share one upstream execution
+search_flight = SingleFlight()
+
+def _llm_timeout(budget):
+    """LLM read timeout, ending before the request's deadline when there is one"""
+    return budget.timeout(LLM_TIMEOUT) if budget is not None else LLM_TIMEOUT
+
+def generate_llm_response(query, search_results, search_scope='ap_gov_only', budget=None):
+    """Generate LLM response based on search results; returns (answer, degraded)
+
+    With a deadline budget, waiting for an LLM slot and the call itself stay within it.
+    """
+    # Reuse an earlier answer generated for the same query and the same sources
+    cached_answer = get_cached_answer(query, search_results)
+    if cached_answer is not None:
+        return cached_answer, False
+    
+    try:
+        # Create prompt for LLM
+        prompt = build_llm_prompt(query, search_results)
+        
+        # Get LLM response
+        with stage("llm"), llm_guard.slot(budget=budget):
+            response = get_llm().invoke(prompt, timeout=_llm_timeout(budget))
+        store_answer(query, search_results, response.content)
+        return response.content, False
     
-    # Police & Law
-    "citizen.appolice.gov.in",
-    "slprb.ap.gov.in",
-    "apsp.ap.gov.in",
+    except Exception as e:
+        return llm_fallback_answer(query, search_results, search_scope, e), True
+
+def stream_llm_response(query, search_results, search_scope='ap_gov_only', status=None, budget=None):
+    """Yield the LLM response incrementally as tokens arrive; sets status['degraded'] on fallback"""
+    status = status if status is not None else {}
+    cached_answer = get_cached_answer(query, search_results)
+    if cached_answer is not None:
+        yield cached_answer
+        return
     
-    # Transport
-    "aptransport.org",
+    parts = []
+    try:
+        with stage("llm"), llm_guard.slot(measure_latency=False, budget=budget):
+            for chunk in get_llm().stream(build_llm_prompt(query, search_results), timeout=_llm_timeout(budget)):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield chunk.content
+    except Exception as e:
+        status['degraded'] = True
+        yield llm_fallback_answer(query, search_results, search_scope, e)
+        return
     
-    # Power
-    "apspdcl.in",
-    "apeasternpower.com",
-    "apcpdcl.in",
-    "aperc.gov.in",
+    store_answer(query, search_results, "".join(parts))
+
+def lookup_semantic_cache(params):
+    """Response of a semantically similar earlier request, or None on a miss (or when refreshing)"""
+    if semantic_cache is None or params.get('refresh'):
+        return None
+    with stage("semantic_cache"):
+        return semantic_cache_lookup(semantic_cache, params, semantic_cache.embed(params['query']))
+
+def run_search(data):
+    """Run the /search pipeline for one request body; returns (payload, status_code)"""
+    try:
+        params = parse_search_request(data, default_max_results=DEFAULT_MAX_RESULTS)
+    except ValueError as e:
+        return {"error": str(e)}, 400
     
-    # Public Service
-    "psc.ap.gov.in",
-    "portal-psc.ap.gov.in",
+    # Validate required parameters
+    if params is None:
+        return {"error": "Query parameter is required"}, 400
+    record_query(params)
     
-    # Agriculture
-    "apagrisnet.gov.in",
-    "horticulture.ap.nic.in",
+    # Concurrent duplicates wait for the first request's result instead of repeating the work
+    return search_flight.do(search_request_key(params), execute_search, params)
+
+def execute_search(params):
+    """Search, filter and summarize for parsed request parameters; returns (payload, status_code)"""
+    query = params['query']
+    search_scope = params['search_scope']
     
-    # Education
-    "schooledu.ap.gov.in",
-    "cse.ap.gov.in",
-    "aptet.apcfss.in",
+    # Serve a stored answer if a semantically similar question was answered recently
+    cached_response = lookup_semantic_cache(params)
+    if cached_response is not None:
+        return cached_response, 200
     
-    # Land & Revenue
-    "webland.ap.gov.in",
+    response = fetch_search_results(client, params)
+    log_event(logger, logging.DEBUG, "search results", search_scope=search_scope,
+              enhanced_query=params['enhanced_query'], results=len(response.get('results') or []))
+    log_payload(logger, "search response", response=response)
     
-    # Water Resources
-    "irrigationap.cgg.gov.in",
-    "irrigation.ap.gov.in",
+    # Check if results found
+    if not response.get('results'):
+        return report_budget(no_results_response(search_scope), params['budget']), 200
     
-    # Forest
-    "forests.ap.gov.in",
+    high_confidence_results = select_results(response, search_scope)
     
-    # Finance
-    "apfinance.gov.in",
+    if not extract_sources(high_confidence_results):
+        return build_final_response(None, [], search_scope, 0), 200
     
-    # Services
-    "ap.meeseva.gov.in",
-    "apeprocurement.gov.in",
+    summarizer = plan_answer(params, high_confidence_results)
+    if summarizer == 'extractive':
+        answer, degraded = excerpt_summary(query, high_confidence_results, search_scope), False
+    else:
+        answer, degraded = generate_llm_response(
+            query, high_confidence_results, search_scope, budget=params['budget']
+        )
     
-    # Information
-    "apegazette.cgg.gov.in"
-]
+    return assemble_response(params, high_confidence_results, answer, summarizer, degraded, semantic_cache), 200
 
-# System instruction for LLM
-SYSTEM_INSTRUCTION = """
-You are a helpful AI assistant that answers questions based on search results from Andhra Pradesh government websites and other sources.
+def run_job(data, progress):
+    """Job runner: the /search pipeline with stage timings collected into progress"""
+    begin_request(progress)
+    return run_search(data)
 
-Your task is to:
-1. Analyze the provided search results and extract relevant information
-2. Provide a clear, comprehensive answer that directly addresses the user's question
-3. Focus on the most important and relevant details from the search results
-4. Maintain accuracy and avoid speculation beyond what's provided in the search results
-5. If information is insufficient, acknowledge the limitations
-6. When information comes from AP government sources, mention that it's from official sources
-7. Structure your response in a clear, easy-to-understand format
-8. Provide step-by-step instructions when applicable
+# Expensive searches can run in the background: POST /search?async=1, then GET /jobs/<id>
+jobs = JobQueue(run_job)
 
-User Query: {query}
+def submit_job(data):
+    """Queue a /search request as a background job and answer 202 with its id"""
+    try:
+        if parse_search_request(data, DEFAULT_MAX_RESULTS) is None:
+            return jsonify({"error": "Query parameter is required"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    job_id, priority = jobs.submit(data)
+    return jsonify(submitted_response(job_id, priority)), 202
 
-Search Results:
-{search_results}
+# Keeps popular and curated queries warm ahead of cache expiry (PREWARM_ENABLED)
+prewarmer = PrewarmScheduler(lambda data: parse_search_request(data, DEFAULT_MAX_RESULTS), execute_search)
 
-Please provide a comprehensive answer based on the above search results.
-"""
+def warm_up():
+    """Per-worker warm-up before serving: build the LLM, open upstream connections and start pre-warming"""
+    configure_logging()  # the log writer thread does not survive the fork
+    prime_connections(tavily_session, [TAVILY_API_BASE_URL or "https://api.tavily.com"])
+    warm_up_llm()
+    prewarmer.start()
+    jobs.start()  # resume jobs left queued by a previous process
 
-def generate_llm_response(query, search_results):
-    """Generate LLM response based on search results"""
+@app.route('/search', methods=['POST'])
+def tavily_search():
     try:
-        # Format search results for LLM
-        formatted_results = ""
-        for i, result in enumerate(search_results, 1):
-            title = result.get('title', 'No title')
-            content = result.get('content', 'No content')
-            url = result.get('url', 'No URL')
-            
-            formatted_results += f"""
-Result {i}:
-Title: {title}
-URL: {url}
-Content: {content}...
-
-"""
-        
-        # Create prompt for LLM
-        prompt = SYSTEM_INSTRUCTION.format(
-            query=query,
-            search_results=formatted_results
-        )
-        
-        # Get LLM response
-        response = llm.invoke(prompt)
-        return response.content
-        
+        if request.args.get('async') == '1':
+            return submit_job(request.get_json())
+        payload, status = run_search(request.get_json())
+        return jsonify(payload), status
+    
+    except UpstreamUnavailable as e:
+        # Fail fast while Tavily is throttled or unhealthy
+        return jsonify(error_response(e)), 503
+    
     except Exception as e:
-        logger.error(f"Error generating LLM response: {str(e)}")
-        return f"Sorry, I encountered an error while processing the search results: {str(e)}"
+        return jsonify(error_response(e)), 500
 
-@app.route('/search', methods=['POST'])
-def tavily_search():
+@app.route('/search/stream', methods=['POST'])
+def tavily_search_stream():
+    """Stream filtered sources, then LLM tokens, then the final response as Server-Sent Events"""
     try:
-        # Get request data
-        data = request.get_json()
-        
-        # Validate required parameters
-        if not data or 'query' not in data:
-            return jsonify({
-                "error": "Query parameter is required"
-            }), 400
-        
-        query = data['query']
-        
-        # Optional parameters with defaults
-        search_depth = data.get('search_depth', 'advanced')  # 'basic' or 'advanced'
-        max_results = data.get('max_results', 2)
-        
-        # Get search scope from request, default to AP Gov only
-        search_scope = data.get('search_scope', 'ap_gov_only')
-        print("search_scope is >>>>>>>>>>>>>>>>>>",search_scope)
-        
-        # Set domains based on search scope
-        if search_scope == 'ap_gov_only':
-            include_domains = AP_GOV_DOMAINS
-            exclude_domains = None
-        elif search_scope == 'include_ap_gov':
-            # Include AP gov domains but also search other sources
-            include_domains = None
-            exclude_domains = None
-        else:  # 'general'
-            include_domains = None
-            exclude_domains = None
-        
-        # Add AP/Andhra Pradesh context to query for better results
-        if search_scope in ['ap_gov_only', 'include_ap_gov']:
-            enhanced_query = f"{query} Andhra Pradesh AP government"
-        else:
-            enhanced_query = query
-        print("enhance search query is >>>>>>>>>>>.",enhanced_query)
-        # Perform Tavily search
-        response = client.search(
-            query=enhanced_query,
-            search_depth=search_depth,
-            include_answer=True,
-            include_raw_content=True,
-            max_results=max_results,
-            include_domains=include_domains,
-            exclude_domains=exclude_domains
-        )
-        print("response is >>>>>>>>>>>>>>",response)
-        
-        # Check if results found
-        if not response.get('results') or len(response['results']) == 0:
-            return jsonify({
-                "response": "Sorry, could not find any relevant data from Andhra Pradesh government sources",
-                "source_found": None,
-                "search_scope": search_scope
-            })
-        
-        # Filter results by confidence score (0.5 threshold for government sites as they might have lower scores)
-        confidence_threshold = 0.5 if search_scope == 'ap_gov_only' else 0.75
-        high_confidence_results = []
-        
-        for result in response['results']:
-            # Tavily doesn't always provide score, so we'll check if it exists
-            score = result.get('score', 1.0)  # Default to 1.0 if no score
-            if score >= confidence_threshold:
-                high_confidence_results.append(result)
-        
-        # If no high confidence results, use all results but mention lower confidence
-        if not high_confidence_results:
-            high_confidence_results = response['results']
-        
-        # Filter to ensure we only have AP government sources if requested
-        if search_scope == 'ap_gov_only':
-            ap_gov_results = []
-            for result in high_confidence_results:
-                url = result.get('url', '')
-                if any(domain in url.lower() for domain in AP_GOV_DOMAINS):
-                    ap_gov_results.append(result)
+        params = parse_search_request(request.get_json(silent=True), default_max_results=DEFAULT_MAX_RESULTS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if params is None:
+        return jsonify({"error": "Query parameter is required"}), 400
+    record_query(params)
+    timings = g.request_timings
+    
+    def generate():
+        query = params['query']
+        search_scope = params['search_scope']
+        try:
+            cached_response = lookup_semantic_cache(params)
+            if cached_response is not None:
+                yield from cached_stream_events(cached_response, search_scope)
+                yield done_event(cached_response, timings)
+                return
             
-            if ap_gov_results:
-                high_confidence_results = ap_gov_results
-            # If no AP gov results found, keep all results but mention this in response
-        
-        # Extract sources (URLs)
-        sources = []
-        for result in high_confidence_results:
-            if result.get('url'):
-                sources.append(result['url'])
-        
-        # Generate LLM response based on search results
-        if high_confidence_results:
-            llm_response = generate_llm_response(query, high_confidence_results)
-        else:
-            llm_response = "Sorry, could not find any relevant data from the specified sources"
-        
-        # Prepare final response
-        if sources:
-            final_response = {
-                "response": llm_response,
-                "source_found": ", ".join(sources),
-                "search_scope": search_scope,
-                "total_results": len(high_confidence_results)
-            }
-        else:
-            final_response = {
-                "response": "Sorry, could not find any relevant data from Andhra Pradesh government sources",
-                "source_found": None,
-                "search_scope": search_scope,
-                "total_results": 0
-            }
+            response = fetch_search_results(client, params)
+            high_confidence_results = select_results(response, search_scope)
+            yield sources_event(high_confidence_results, search_scope)
+            
+            if not extract_sources(high_confidence_results):
+                final_response = build_final_response(None, [], search_scope, 0)
+                yield format_sse("token", {"text": final_response['response']})
+                yield done_event(final_response, timings)
+                return
+            
+            summarizer = plan_answer(params, high_confidence_results)
+            parts = []
+            llm_status = {}
+            if summarizer == 'extractive':
+                # Nothing to stream token by token: the whole answer is ready at once
+                parts.append(excerpt_summary(query, high_confidence_results, search_scope))
+                yield format_sse("token", {"text": parts[0]})
+            else:
+                for token in stream_llm_response(
+                    query, high_confidence_results, search_scope, llm_status, budget=params['budget']
+                ):
+                    parts.append(token)
+                    yield format_sse("token", {"text": token})
+            
+            final_response = assemble_response(
+                params, high_confidence_results, "".join(parts), summarizer, llm_status.get('degraded', False), semantic_cache
+            )
+            yield done_event(final_response, timings)
         
-        return jsonify(final_response)
+        except Exception as e:
+            yield format_sse("error", error_response(e))
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/search/batch', methods=['POST'])
+def tavily_search_batch():
+    """Run many /search requests with bounded concurrency; ordered JSON or NDJSON as each completes"""
+    try:
+        queries, concurrency, stream = parse_batch_request(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
+    if stream:
+        def generate():
+            for indices, payload, status in run_batch(run_search, queries, concurrency, DEFAULT_MAX_RESULTS):
+                yield ndjson_lines(indices, payload, status)
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
+    return jsonify(ordered_batch_response(queries, run_batch(run_search, queries, concurrency, DEFAULT_MAX_RESULTS)))
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status of a background search job, with the result once it is done"""
+    body = jobs.status(job_id)
+    if body is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(body)
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_event_stream(job_id):
+    """Server-Sent Events with a job's progress, ending with a 'done' event carrying the result"""
+    def generate():
+        for event, data in job_events(jobs, job_id):
+            if event is None:
+                time.sleep(data)
+            else:
+                yield format_sse(event, data)
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/tts', methods=['POST'])
+def text_to_speech():
+    """Synthesize speech for an answer; audio is streamed sentence by sentence and cached on disk"""
+    try:
+        text = parse_tts_request(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        tts = get_tts_service()
+        audio = tts.stream(text)
     except Exception as e:
-        return jsonify({
-            "error": f"An error occurred: {str(e)}",
-            "response": "Sorry, could not find any relevant data",
-            "source_found": None
-        }), 500
+        logger.error(f"TTS error: {str(e)}")
+        return jsonify({"error": f"TTS error: {str(e)}"}), 502
+    return Response(stream_with_context(audio), mimetype=tts.mimetype, headers={'X-Accel-Buffering': 'no'})
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy", "ap_domains_count": len(AP_GOV_DOMAINS)})
+    return jsonify({"status": "healthy", "ap_domains_count": len(registry.domains)})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics: per-stage and upstream latency, cache hit ratio, prompt tokens, result counts"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/domains', methods=['GET'])
 def get_ap_domains():
     """Get list of Andhra Pradesh government domains being searched"""
-    return jsonify({
-        "ap_government_domains": AP_GOV_DOMAINS,
-        "total_domains": len(AP_GOV_DOMAINS)
-    })
+    # ETag lets clients revalidate cheaply; unchanged lists are answered with 304
+    response = jsonify(registry.to_dict())
+    response.set_etag(registry.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 if __name__ == '__main__':
+    configure_logging()
     app.run(debug=True, host='0.0.0.0', port=8000)
\ No newline at end of file
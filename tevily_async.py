@@ -0,0 +1,364 @@
+import asyncio
+from quart import Quart, request, jsonify, Response, g
+from quart_cors import cors
+from tavily import AsyncTavilyClient
+import os
+from domain_registry import registry
+from search_cache import get_cached_answer, store_answer
+from search_pipeline import (
+    parse_search_request, search_request_key, afetch_search_results, select_results, extract_sources,
+    build_llm_prompt, excerpt_summary, no_results_response, build_final_response, error_response, format_sse,
+    semantic_cache_lookup, plan_answer, llm_fallback_answer, assemble_response, sources_event, cached_stream_events,
+    done_event,
+)
+from batch_search import parse_batch_request, arun_batch, ordered_batch_response, ndjson_lines
+from single_flight import AsyncSingleFlight
+from job_queue import JobQueue, job_events, submitted_response
+from metrics import begin_request, instrument_quart, render_metrics, stage
+from structured_log import configure_logging, trace_quart
+from tts_service import get_tts_service, parse_tts_request
+from upstream_guard import GuardedAsyncTavilyClient, UpstreamUnavailable, llm_guard
+from semantic_cache import SemanticCache, build_embedder, SEMANTIC_CACHE_ENABLED
+from deadline import report_budget
+from prewarm import PrewarmScheduler, record_query
+from component_initilizer import get_llm, awarm_up_llm, LLM_TIMEOUT
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Async (ASGI) variant of tevily_2.py: same routes and JSON contract, but upstream
+# Tavily and Azure OpenAI calls are awaited on one event loop instead of holding a thread each.
+# Run with: hypercorn tevily_async:app --bind 0.0.0.0:8000
+app = Quart(__name__)
+app = cors(app, allow_origin="*")  # Enable CORS for Streamlit integration
+instrument_quart(app)  # Stage timings in Server-Timing headers and /metrics
+trace_quart(app)  # Per-request trace ids in logs and X-Request-ID headers
+
+# Initialize async Tavily client
+TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+TAVILY_API_BASE_URL = os.getenv("TAVILY_API_BASE_URL")  # None means the public Tavily API
+client = GuardedAsyncTavilyClient(AsyncTavilyClient(TAVILY_API_KEY, api_base_url=TAVILY_API_BASE_URL))
+
+logger = logging.getLogger(__name__)
+
+# Results per search when the request does not say
+DEFAULT_MAX_RESULTS = int(os.getenv("SEARCH_DEFAULT_MAX_RESULTS", "2"))
+
+# Semantic cache: paraphrased questions reuse an earlier answer
+semantic_cache = SemanticCache(build_embedder()) if SEMANTIC_CACHE_ENABLED else None
+
+# Identical searches already in flight share one upstream execution
+search_flight = AsyncSingleFlight()
+
+def _llm_timeout(budget):
+    """LLM read timeout, ending before the request's deadline when there is one"""
+    return budget.timeout(LLM_TIMEOUT) if budget is not None else LLM_TIMEOUT
+
+async def generate_llm_response(query, search_results, search_scope='ap_gov_only', budget=None):
+    """Generate LLM response based on search results; returns (answer, degraded)
+
+    With a deadline budget, waiting for an LLM slot and the call itself stay within it.
+    """
+    # Reuse an earlier answer generated for the same query and the same sources
+    cached_answer = get_cached_answer(query, search_results)
+    if cached_answer is not None:
+        return cached_answer, False
+
+    try:
+        prompt = build_llm_prompt(query, search_results)
+        with stage("llm"):
+            async with llm_guard.aslot(budget=budget):
+                response = await get_llm().ainvoke(prompt, timeout=_llm_timeout(budget))
+        store_answer(query, search_results, response.content)
+        return response.content, False
+
+    except Exception as e:
+        return llm_fallback_answer(query, search_results, search_scope, e), True
+
+async def stream_llm_response(query, search_results, search_scope='ap_gov_only', status=None, budget=None):
+    """Yield the LLM response incrementally as tokens arrive; sets status['degraded'] on fallback"""
+    status = status if status is not None else {}
+    cached_answer = get_cached_answer(query, search_results)
+    if cached_answer is not None:
+        yield cached_answer
+        return
+
+    parts = []
+    try:
+        prompt = build_llm_prompt(query, search_results)
+        with stage("llm"):
+            async with llm_guard.aslot(measure_latency=False, budget=budget):
+                async for chunk in get_llm().astream(prompt, timeout=_llm_timeout(budget)):
+                    if chunk.content:
+                        parts.append(chunk.content)
+                        yield chunk.content
+    except Exception as e:
+        status['degraded'] = True
+        yield llm_fallback_answer(query, search_results, search_scope, e)
+        return
+
+    store_answer(query, search_results, "".join(parts))
+
+async def lookup_semantic_cache(params):
+    """Response of a semantically similar earlier request, or None on a miss (or when refreshing)"""
+    if semantic_cache is None or params.get('refresh'):
+        return None
+    with stage("semantic_cache"):
+        return semantic_cache_lookup(semantic_cache, params, await semantic_cache.aembed(params['query']))
+
+async def run_search(data):
+    """Run the /search pipeline for one request body; returns (payload, status_code)"""
+    try:
+        params = parse_search_request(data, default_max_results=DEFAULT_MAX_RESULTS)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    # Validate required parameters
+    if params is None:
+        return {"error": "Query parameter is required"}, 400
+    record_query(params)
+
+    # Concurrent duplicates wait for the first request's result instead of repeating the work
+    return await search_flight.do(search_request_key(params), execute_search, params)
+
+async def execute_search(params):
+    """Search, filter and summarize for parsed request parameters; returns (payload, status_code)"""
+    query = params['query']
+    search_scope = params['search_scope']
+
+    # Serve a stored answer if a semantically similar question was answered recently
+    cached_response = await lookup_semantic_cache(params)
+    if cached_response is not None:
+        return cached_response, 200
+
+    response = await afetch_search_results(client, params)
+
+    # Check if results found
+    if not response.get('results'):
+        return report_budget(no_results_response(search_scope), params['budget']), 200
+
+    high_confidence_results = select_results(response, search_scope)
+
+    if not extract_sources(high_confidence_results):
+        return build_final_response(None, [], search_scope, 0), 200
+
+    summarizer = plan_answer(params, high_confidence_results)
+    if summarizer == 'extractive':
+        answer, degraded = excerpt_summary(query, high_confidence_results, search_scope), False
+    else:
+        answer, degraded = await generate_llm_response(
+            query, high_confidence_results, search_scope, budget=params['budget']
+        )
+
+    return assemble_response(params, high_confidence_results, answer, summarizer, degraded, semantic_cache), 200
+
+# Event loop the app serves on; job worker threads run their searches on it
+serving_loop = None
+
+def run_job(data, progress):
+    """Job runner: the /search pipeline, run on the serving loop with stage timings collected into progress"""
+    async def run():
+        begin_request(progress)
+        return await run_search(data)
+    return asyncio.run_coroutine_threadsafe(run(), serving_loop).result()
+
+# Expensive searches can run in the background: POST /search?async=1, then GET /jobs/<id>
+jobs = JobQueue(run_job)
+
+async def submit_job(data):
+    """Queue a /search request as a background job and answer 202 with its id"""
+    try:
+        if parse_search_request(data, DEFAULT_MAX_RESULTS) is None:
+            return jsonify({"error": "Query parameter is required"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    job_id, priority = await asyncio.to_thread(jobs.submit, data)  # the job store is blocking SQLite
+    return jsonify(submitted_response(job_id, priority)), 202
+
+# Keeps popular and curated queries warm ahead of cache expiry (PREWARM_ENABLED)
+prewarmer = PrewarmScheduler(lambda data: parse_search_request(data, DEFAULT_MAX_RESULTS), execute_search)
+
+@app.before_serving
+async def warm_up():
+    """Per-worker warm-up before serving: build the LLM, open its connection pool and start pre-warming"""
+    global serving_loop
+    configure_logging()
+    serving_loop = asyncio.get_running_loop()
+    await awarm_up_llm()
+    prewarmer.start_async()
+    jobs.start()  # resume jobs left queued by a previous process
+
+@app.route('/search', methods=['POST'])
+async def tavily_search():
+    try:
+        if request.args.get('async') == '1':
+            return await submit_job(await request.get_json())
+        payload, status = await run_search(await request.get_json())
+        return jsonify(payload), status
+
+    except UpstreamUnavailable as e:
+        # Fail fast while Tavily is throttled or unhealthy
+        return jsonify(error_response(e)), 503
+
+    except Exception as e:
+        return jsonify(error_response(e)), 500
+
+@app.route('/search/stream', methods=['POST'])
+async def tavily_search_stream():
+    """Stream filtered sources, then LLM tokens, then the final response as Server-Sent Events"""
+    try:
+        params = parse_search_request(await request.get_json(silent=True), default_max_results=DEFAULT_MAX_RESULTS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if params is None:
+        return jsonify({"error": "Query parameter is required"}), 400
+    record_query(params)
+    timings = g.request_timings
+
+    async def generate():
+        query = params['query']
+        search_scope = params['search_scope']
+        try:
+            cached_response = await lookup_semantic_cache(params)
+            if cached_response is not None:
+                for event in cached_stream_events(cached_response, search_scope):
+                    yield event
+                yield done_event(cached_response, timings)
+                return
+
+            response = await afetch_search_results(client, params)
+            high_confidence_results = select_results(response, search_scope)
+            yield sources_event(high_confidence_results, search_scope)
+
+            if not extract_sources(high_confidence_results):
+                final_response = build_final_response(None, [], search_scope, 0)
+                yield format_sse("token", {"text": final_response['response']})
+                yield done_event(final_response, timings)
+                return
+
+            summarizer = plan_answer(params, high_confidence_results)
+            parts = []
+            llm_status = {}
+            if summarizer == 'extractive':
+                # Nothing to stream token by token: the whole answer is ready at once
+                parts.append(excerpt_summary(query, high_confidence_results, search_scope))
+                yield format_sse("token", {"text": parts[0]})
+            else:
+                async for token in stream_llm_response(
+                    query, high_confidence_results, search_scope, llm_status, budget=params['budget']
+                ):
+                    parts.append(token)
+                    yield format_sse("token", {"text": token})
+
+            final_response = assemble_response(
+                params, high_confidence_results, "".join(parts), summarizer, llm_status.get('degraded', False), semantic_cache
+            )
+            yield done_event(final_response, timings)
+
+        except Exception as e:
+            yield format_sse("error", error_response(e))
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.timeout = None  # streams may outlive the default response timeout
+    return response
+
+@app.route('/search/batch', methods=['POST'])
+async def tavily_search_batch():
+    """Run many /search requests with bounded concurrency; ordered JSON or NDJSON as each completes"""
+    try:
+        queries, concurrency, stream = parse_batch_request(await request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if stream:
+        async def generate():
+            async for indices, payload, status in arun_batch(run_search, queries, concurrency, DEFAULT_MAX_RESULTS):
+                yield ndjson_lines(indices, payload, status)
+        response = Response(generate(), mimetype='application/x-ndjson')
+        response.timeout = None
+        return response
+
+    completed = [entry async for entry in arun_batch(run_search, queries, concurrency, DEFAULT_MAX_RESULTS)]
+    return jsonify(ordered_batch_response(queries, completed))
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+async def get_job(job_id):
+    """Status of a background search job, with the result once it is done"""
+    body = await asyncio.to_thread(jobs.status, job_id)
+    if body is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(body)
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+async def job_event_stream(job_id):
+    """Server-Sent Events with a job's progress, ending with a 'done' event carrying the result"""
+    async def generate():
+        events = job_events(jobs, job_id)
+        # Each step reads the job store, so it runs off the event loop
+        while True:
+            item = await asyncio.to_thread(next, events, None)
+            if item is None:
+                return
+            event, data = item
+            if event is None:
+                await asyncio.sleep(data)
+            else:
+                yield format_sse(event, data)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.timeout = None
+    return response
+
+@app.route('/tts', methods=['POST'])
+async def text_to_speech():
+    """Synthesize speech for an answer; audio is streamed sentence by sentence and cached on disk"""
+    try:
+        text = parse_tts_request(await request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        tts = get_tts_service()
+        audio = await asyncio.to_thread(tts.stream, text)
+    except Exception as e:
+        logger.error(f"TTS error: {str(e)}")
+        return jsonify({"error": f"TTS error: {str(e)}"}), 502
+
+    async def generate():
+        # Synthesis blocks, so pull each chunk on a worker thread
+        while True:
+            chunk = await asyncio.to_thread(next, audio, None)
+            if chunk is None:
+                break
+            yield chunk
+
+    response = Response(generate(), mimetype=tts.mimetype)
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.timeout = None
+    return response
+
+@app.route('/health', methods=['GET'])
+async def health_check():
+    return jsonify({"status": "healthy", "ap_domains_count": len(registry.domains)})
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Prometheus metrics: per-stage and upstream latency, cache hit ratio, prompt tokens, result counts"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/domains', methods=['GET'])
+async def get_ap_domains():
+    """Get list of Andhra Pradesh government domains being searched"""
+    # ETag lets clients revalidate cheaply; unchanged lists are answered with 304
+    response = jsonify(registry.to_dict())
+    response.set_etag(registry.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return await response.make_conditional(request)
+
+if __name__ == '__main__':
+    configure_logging()
+    app.run(debug=True, host='0.0.0.0', port=8000)
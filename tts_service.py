@@ -0,0 +1,306 @@
+import hashlib
+import itertools
+import logging
+import math
+import os
+import re
+import struct
+import tempfile
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# TTS configuration
+TTS_ENGINE = os.getenv("TTS_ENGINE", "gtts")  # 'gtts', 'pyttsx3' or 'stub'
+TTS_LANG = os.getenv("TTS_LANG", "en")
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "tts_cache")
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "4"))
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", "300"))
+TTS_MAX_CHARS = int(os.getenv("TTS_MAX_CHARS", "20000"))
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?।])\s+")
+
+
+def split_sentences(text, max_chars=TTS_CHUNK_CHARS):
+    """Split text into sentence-aligned chunks of at most max_chars (a longer sentence is split on words)"""
+    chunks, current = [], ""
+    for sentence in SENTENCE_PATTERN.split(" ".join(text.split())):
+        pieces = [sentence]
+        if len(sentence) > max_chars:
+            pieces, words = [], ""
+            for word in sentence.split():
+                if words and len(words) + len(word) + 1 > max_chars:
+                    pieces.append(words)
+                    words = word
+                else:
+                    words = f"{words} {word}".strip()
+            pieces.append(words)
+        for piece in pieces:
+            if current and len(current) + len(piece) + 1 > max_chars:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current} {piece}".strip()
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class GTTSEngine:
+    """Google Text-to-Speech (network); MP3 output"""
+
+    name = "gtts"
+    extension = "mp3"
+    mimetype = "audio/mpeg"
+
+    def __init__(self, lang=TTS_LANG):
+        from gtts import gTTS
+        self._gtts = gTTS
+        self.lang = lang
+        self.voice = lang
+
+    def synthesize(self, text):
+        audio_buffer = BytesIO()
+        self._gtts(text=text, lang=self.lang, slow=False).write_to_fp(audio_buffer)
+        return audio_buffer.getvalue()
+
+
+class Pyttsx3Engine:
+    """Offline system voices via pyttsx3; WAV output, one synthesis at a time"""
+
+    name = "pyttsx3"
+    extension = "wav"
+    mimetype = "audio/wav"
+
+    def __init__(self, rate=None):
+        import pyttsx3
+        self._engine = pyttsx3.init()
+        if rate:
+            self._engine.setProperty('rate', rate)
+        self.voice = str(self._engine.getProperty('voice'))
+        # pyttsx3 drivers are not thread-safe
+        self._lock = threading.Lock()
+
+    def synthesize(self, text):
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            with self._lock:
+                self._engine.save_to_file(text, path)
+                self._engine.runAndWait()
+            with open(path, "rb") as f:
+                return f.read()
+        finally:
+            os.remove(path)
+
+
+class StubEngine:
+    """Deterministic tone per word, for offline tests and benchmarks; WAV output"""
+
+    name = "stub"
+    extension = "wav"
+    mimetype = "audio/wav"
+    voice = "stub"
+    framerate = 16000
+
+    def synthesize(self, text):
+        frames = bytearray()
+        for word in text.split():
+            pitch = 200 + (sum(map(ord, word)) % 400)
+            for n in range(int(self.framerate * 0.08)):
+                frames += struct.pack("<h", int(8000 * math.sin(2 * math.pi * pitch * n / self.framerate)))
+            frames += bytes(int(self.framerate * 0.02) * 2)
+        buffer = BytesIO()
+        with wave.open(buffer, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(self.framerate)
+            w.writeframes(bytes(frames))
+        return buffer.getvalue()
+
+
+ENGINES = {"gtts": GTTSEngine, "pyttsx3": Pyttsx3Engine, "stub": StubEngine}
+
+
+def build_engine(name=None):
+    name = name or TTS_ENGINE
+    if name not in ENGINES:
+        raise ValueError(f"Unknown TTS engine: {name}")
+    return ENGINES[name]()
+
+
+class AudioCache:
+    """Content-addressed audio files on disk, evicted least recently used beyond max_bytes
+
+    The directory is the only index: worker processes sharing it see each other's files, hits touch the
+    modification time, and eviction scans the whole directory, so max_bytes bounds the directory as a whole.
+    """
+
+    def __init__(self, cache_dir=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _files(self):
+        """[(mtime, size, name)] of the cached files, oldest first"""
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_file() or entry.name.endswith(".tmp"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # evicted by another process meanwhile
+            files.append((stat.st_mtime, stat.st_size, entry.name))
+        files.sort()
+        return files
+
+    def get(self, filename):
+        path = os.path.join(self.cache_dir, filename)
+        try:
+            os.utime(path)
+            with open(path, "rb") as f:
+                audio = f.read()
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return audio
+
+    def set(self, filename, audio):
+        if len(audio) > self.max_bytes:
+            return
+        path = os.path.join(self.cache_dir, filename)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            files = self._files()
+            total = sum(size for _, size, _ in files)
+            for _, size, name in files:
+                if total <= self.max_bytes:
+                    break
+                if name == filename:
+                    continue
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass  # already evicted by another process
+                total -= size
+
+    def stats(self):
+        files = self._files()
+        return {"files": len(files), "bytes": sum(size for _, size, _ in files), "hits": self.hits, "misses": self.misses}
+
+
+def _streaming_wav_header(nchannels, sampwidth, framerate):
+    """WAV header with open-ended sizes, so PCM from later chunks can simply be appended"""
+    byte_rate = framerate * nchannels * sampwidth
+    return (b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, nchannels, framerate, byte_rate, nchannels * sampwidth, sampwidth * 8)
+            + b"data" + struct.pack("<I", 0xFFFFFFFF))
+
+
+def join_wav_stream(chunks):
+    """Turn a sequence of WAV files into one continuous WAV stream"""
+    params = None
+    for audio in chunks:
+        with wave.open(BytesIO(audio), "rb") as w:
+            chunk_params = (w.getnchannels(), w.getsampwidth(), w.getframerate())
+            frames = w.readframes(w.getnframes())
+        if params is None:
+            params = chunk_params
+            yield _streaming_wav_header(*params) + frames
+        elif chunk_params == params:
+            yield frames
+        else:
+            logger.warning(f"Skipping TTS chunk with mismatched audio format {chunk_params}")
+
+
+class TTSService:
+    """Chunked, cached, parallel speech synthesis streamed back in sentence order"""
+
+    def __init__(self, engine, cache, workers=TTS_WORKERS):
+        self.engine = engine
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts")
+        # The same sentence requested concurrently is synthesized once
+        self._flight = SingleFlight()
+
+    @property
+    def mimetype(self):
+        return self.engine.mimetype
+
+    def _cache_name(self, text):
+        digest = hashlib.sha256(f"{self.engine.name}|{self.engine.voice}|{text}".encode("utf-8")).hexdigest()
+        return f"{digest}.{self.engine.extension}"
+
+    def synthesize_chunk(self, text):
+        name = self._cache_name(text)
+        audio = self.cache.get(name)
+        if audio is None:
+            audio = self._flight.do(name, self._synthesize_uncached, name, text)
+        return audio
+
+    def _synthesize_uncached(self, name, text):
+        audio = self.engine.synthesize(text)
+        self.cache.set(name, audio)
+        return audio
+
+    def synthesize_chunks(self, text):
+        """Yield per-chunk audio in order while later chunks are synthesized in parallel"""
+        futures = [self._executor.submit(self.synthesize_chunk, chunk) for chunk in split_sentences(text)]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            # Client went away or a chunk failed: drop work that has not started yet
+            for future in futures:
+                future.cancel()
+
+    def stream(self, text):
+        """Audio bytes for text; waits for the first chunk so engine errors surface before streaming starts"""
+        chunks = self.synthesize_chunks(text)
+        if self.engine.extension == "wav":
+            chunks = join_wav_stream(chunks)
+        first = next(chunks, b"")
+        return itertools.chain([first], chunks)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_tts_service():
+    """Build the TTS service on first use, so the engine library is only needed when /tts is called"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = TTSService(build_engine(), AudioCache())
+    return _service
+
+
+def parse_tts_request(data):
+    """Validated text from a /tts request body; raises ValueError on bad input"""
+    if not isinstance(data, dict):
+        raise ValueError("The request body must be a JSON object")
+    text = data.get('text')
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError("Text is required")
+    if len(text) > TTS_MAX_CHARS:
+        raise ValueError(f"Text is limited to {TTS_MAX_CHARS} characters")
+    return text
@@ -0,0 +1,401 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+
+from http_transport import LatencyTracker, hedged_call
+from metrics import UPSTREAM_SECONDS, register_collector, counter_lines
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling an upstream that is rate limited, saturated or tripped open"""
+
+
+def _error_status(error):
+    return getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+
+
+def _is_overload(error):
+    """Whether an upstream error signals overload (429, timeouts) rather than a bad request"""
+    if _error_status(error) in (429, 502, 503, 504):
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in ("429", "rate limit", "ratelimit", "timeout", "timed out", "overloaded"))
+
+
+def _is_upstream_failure(error):
+    """Whether an error says the upstream is unhealthy (overload, 5xx, timeouts, connection failures)
+
+    Bad requests caused by user input (other 4xx) must not open the circuit for everyone.
+    """
+    status = _error_status(error)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return _is_overload(error) or any(marker in text for marker in ("connect", "server error", "unavailable"))
+
+
+class TokenBucket:
+    """Classic token bucket; a rate of 0 disables limiting"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        """Consume a token and return 0, or return the seconds until one is available"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def available(self):
+        """Tokens available right now, without consuming any"""
+        if self.rate <= 0:
+            return float(self.burst)
+        with self._lock:
+            return min(self.burst, self._tokens + (time.monotonic() - self._updated) * self.rate)
+
+    def acquire(self, timeout):
+        if self.rate <= 0:
+            return True
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self._take()
+            if wait == 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def aacquire(self, timeout):
+        if self.rate <= 0:
+            return True
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self._take()
+            if wait == 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit: grows by 1/limit per fast success, halves on slow or overloaded calls"""
+
+    def __init__(self, initial, min_limit, max_limit, target_latency, backoff=0.5):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.inflight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._async_cond = None  # (event loop, asyncio.Condition) for async waiters
+        self._async_waiters = 0
+
+    def try_acquire(self):
+        with self._cond:
+            if self.inflight < int(self.limit):
+                self.inflight += 1
+                return True
+            return False
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.inflight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.inflight += 1
+            return True
+
+    def _async_condition(self):
+        loop = asyncio.get_running_loop()
+        if self._async_cond is None or self._async_cond[0] is not loop:
+            self._async_cond = (loop, asyncio.Condition())
+        return self._async_cond[1]
+
+    async def aacquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        cond = self._async_condition()
+        # Counted before the first attempt so a release in between still wakes us
+        self._async_waiters += 1
+        try:
+            async with cond:
+                while not self.try_acquire():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    try:
+                        await asyncio.wait_for(cond.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+            return True
+        finally:
+            self._async_waiters -= 1
+
+    async def _anotify(self, cond):
+        async with cond:
+            cond.notify()
+
+    def release(self, latency=None, overloaded=False):
+        with self._cond:
+            self.inflight -= 1
+            now = time.monotonic()
+            if overloaded or (latency is not None and latency > self.target_latency):
+                # Decrease at most once per target-latency window so one slow burst halves once
+                if now - self._last_decrease >= self.target_latency:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+            elif latency is not None:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._cond.notify()
+        async_cond = self._async_cond
+        if self._async_waiters and async_cond is not None:
+            # release may run on another thread than the waiters' event loop
+            loop, cond = async_cond
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(loop.create_task, self._anotify(cond))
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single trial call through after reset_timeout"""
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def admit(self):
+        """None if the call is rejected, else whether it is the half-open trial call"""
+        with self._lock:
+            if self.state == "closed":
+                return False
+            # Let one trial call through per reset_timeout (also recovers if a trial never reported back)
+            now = time.monotonic()
+            if now - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._opened_at = now
+                return True
+            return None
+
+    def allow(self):
+        return self.admit() is not None
+
+    def cancel_trial(self):
+        """Give the trial slot back when the trial call never reached the upstream"""
+        with self._lock:
+            if self.state == "half_open":
+                self._opened_at = time.monotonic() - self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = "closed"
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"Circuit opened after {self._failures} consecutive failures")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class UpstreamGuard:
+    """Rate limit, adaptive concurrency and circuit breaker in front of one upstream service"""
+
+    def __init__(self, name, rate, burst, initial_limit, max_limit, target_latency,
+                 acquire_timeout, failure_threshold, reset_timeout):
+        self.name = name
+        self.acquire_timeout = acquire_timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.limiter = AdaptiveLimiter(initial_limit, 1, max_limit, target_latency)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.rejected = 0
+
+    def _reject(self, reason):
+        self.rejected += 1
+        raise UpstreamUnavailable(f"{self.name} unavailable: {reason}")
+
+    def _finish(self, started, error, measure_latency):
+        elapsed = time.monotonic() - started
+        UPSTREAM_SECONDS.observe(elapsed, self.name, "ok" if error is None else "error")
+        latency = elapsed if measure_latency else None
+        if error is None:
+            self.limiter.release(latency)
+            self.breaker.record_success()
+        else:
+            self.limiter.release(latency, overloaded=_is_overload(error))
+            if _is_upstream_failure(error):
+                self.breaker.record_failure()
+
+    def _wait_limit(self, budget):
+        """How long a call may wait for admission: acquire_timeout, but never past the request's deadline"""
+        if budget is None:
+            return self.acquire_timeout
+        return min(self.acquire_timeout, budget.remaining())
+
+    def _refuse(self, trial, reason):
+        if trial:
+            self.breaker.cancel_trial()
+        self._reject(reason)
+
+    @contextmanager
+    def slot(self, measure_latency=True, budget=None):
+        """Admit one upstream call (raises UpstreamUnavailable if it cannot be admitted in time)
+
+        With a deadline budget (see deadline.Budget), waiting for admission stops when the budget runs out.
+        """
+        trial = self.breaker.admit()
+        if trial is None:
+            self._reject("circuit open")
+        if not self.bucket.acquire(self._wait_limit(budget)):
+            self._refuse(trial, "rate limit")
+        if not self.limiter.acquire(self._wait_limit(budget)):
+            self._refuse(trial, "too many concurrent requests")
+        started = time.monotonic()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # Also runs when a streaming consumer goes away mid-stream
+            self._finish(started, error, measure_latency)
+
+    @asynccontextmanager
+    async def aslot(self, measure_latency=True, budget=None):
+        """Async variant of slot"""
+        trial = self.breaker.admit()
+        if trial is None:
+            self._reject("circuit open")
+        if not await self.bucket.aacquire(self._wait_limit(budget)):
+            self._refuse(trial, "rate limit")
+        if not await self.limiter.aacquire(self._wait_limit(budget)):
+            self._refuse(trial, "too many concurrent requests")
+        started = time.monotonic()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # Also runs when a streaming consumer goes away mid-stream
+            self._finish(started, error, measure_latency)
+
+    def has_headroom(self, reserve):
+        """Whether a background call can go ahead while leaving the reserve fraction of the
+        rate-limit burst and of the concurrency limit to interactive traffic"""
+        if self.breaker.state != "closed":
+            return False
+        if self.bucket.available() < 1 + reserve * self.bucket.burst:
+            return False
+        return self.limiter.inflight < int(self.limiter.limit * (1 - reserve))
+
+    def stats(self):
+        return {
+            "state": self.breaker.state,
+            "concurrency_limit": round(self.limiter.limit, 2),
+            "inflight": self.limiter.inflight,
+            "rejected": self.rejected,
+        }
+
+
+def guard_from_env(name, prefix, rate, burst, initial_limit, max_limit, target_latency):
+    """Build a guard whose settings can be overridden with <PREFIX>_* environment variables"""
+    return UpstreamGuard(
+        name,
+        rate=float(os.getenv(f"{prefix}_RATE_LIMIT", str(rate))),
+        burst=int(os.getenv(f"{prefix}_BURST", str(burst))),
+        initial_limit=int(os.getenv(f"{prefix}_CONCURRENCY", str(initial_limit))),
+        max_limit=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", str(max_limit))),
+        target_latency=float(os.getenv(f"{prefix}_TARGET_LATENCY", str(target_latency))),
+        acquire_timeout=float(os.getenv(f"{prefix}_ACQUIRE_TIMEOUT", "5")),
+        failure_threshold=int(os.getenv(f"{prefix}_BREAKER_FAILURES", "5")),
+        reset_timeout=float(os.getenv(f"{prefix}_BREAKER_RESET", "30")),
+    )
+
+
+# Guards shared by every request in the process
+tavily_guard = guard_from_env("tavily", "TAVILY", rate=10, burst=20, initial_limit=8, max_limit=32, target_latency=4)
+llm_guard = guard_from_env("llm", "LLM", rate=5, burst=10, initial_limit=4, max_limit=16, target_latency=15)
+
+
+@register_collector
+def _guard_metrics():
+    guards = (tavily_guard, llm_guard)
+    lines = counter_lines("quantell_upstream_rejected_total", "Calls rejected by the upstream guard",
+                          ("upstream",), [((guard.name,), guard.rejected) for guard in guards])
+    lines += ["# HELP quantell_upstream_concurrency_limit Current adaptive concurrency limit",
+              "# TYPE quantell_upstream_concurrency_limit gauge"]
+    lines += [f'quantell_upstream_concurrency_limit{{upstream="{guard.name}"}} {guard.limiter.limit:.2f}' for guard in guards]
+    return lines
+
+
+# Race a duplicate Tavily search when one runs past the observed p95 (costs extra quota)
+TAVILY_HEDGE = os.getenv("TAVILY_HEDGE", "0") == "1"
+
+
+def _admitted_kwargs(kwargs, budget):
+    """Search arguments with the read timeout shortened by the time spent waiting for admission"""
+    if budget is None or kwargs.get('timeout') is None:
+        return kwargs
+    return dict(kwargs, timeout=budget.timeout(kwargs['timeout']))
+
+
+class GuardedTavilyClient:
+    """TavilyClient wrapper whose searches pass through tavily_guard, optionally hedged"""
+
+    def __init__(self, client, guard=tavily_guard, hedge=TAVILY_HEDGE):
+        self.client = client
+        self.guard = guard
+        self.hedge = hedge
+        self.tracker = LatencyTracker()
+
+    def _search(self, kwargs, budget):
+        with self.guard.slot(budget=budget):
+            return self.client.search(**_admitted_kwargs(kwargs, budget))
+
+    def search(self, budget=None, **kwargs):
+        """TavilyClient.search; with a deadline budget, admission waits and the read timeout stay within it"""
+        if self.hedge:
+            # Each attempt is admitted separately, so a hedge never bypasses the rate limit
+            return hedged_call(lambda: self._search(kwargs, budget), self.tracker)
+        return self._search(kwargs, budget)
+
+
+class GuardedAsyncTavilyClient:
+    """AsyncTavilyClient wrapper whose searches pass through tavily_guard"""
+
+    def __init__(self, client, guard=tavily_guard):
+        self.client = client
+        self.guard = guard
+
+    async def search(self, budget=None, **kwargs):
+        async with self.guard.aslot(budget=budget):
+            return await self.client.search(**_admitted_kwargs(kwargs, budget))